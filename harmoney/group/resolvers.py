@@ -1,21 +1,15 @@
 """
     Group Schema resolvers
 """
-import asyncio
 import json
 
 from dotenv import load_dotenv
 from group.models import Group
 
 from harmoney.aiohttp_client import AioHttpClient
+from harmoney.config import Upstreams
+from harmoney.retry_policy import RetryPolicies
 
-EVENT_LOOP = None
-
-try:
-    EVENT_LOOP = asyncio.get_running_loop()
-except RuntimeError:
-    EVENT_LOOP = asyncio.new_event_loop()
-    asyncio.set_event_loop(EVENT_LOOP)
 
 load_dotenv()
 
@@ -27,13 +21,11 @@ class GroupResolvers:
         Functions to retrieve group information and format response
     """
 
-    def resolve_group(group_id):
+    async def resolve_group(group_id):
         """
-            Runs event loop on format_group to keep schema synchronous
+            Resolves a group from the response of format_group
         """
-        group = EVENT_LOOP.run_until_complete(
-            GroupResolvers.format_group(group_id)
-        )
+        group = await GroupResolvers.format_group(group_id)
 
         return Group(**group)
 
@@ -52,7 +44,9 @@ class GroupResolvers:
         }
         config = {
             'timeoutSeconds': 1,
-            'retries': 5
+            'retryPolicy': RetryPolicies.GROUP_API,
+            'upstream': Upstreams.GROUP_API,
+            'coalesce': True
         }
         response = await HTTP.run_instance(url, request_options, config)
         if response:
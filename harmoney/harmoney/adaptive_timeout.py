@@ -0,0 +1,208 @@
+"""
+Module: adaptive_timeout
+
+Provides the per-route adaptive timeouts used by the AioHttpClient.
+
+Instead of a fixed timeoutSeconds per call site, the timeout of a route is
+derived from the latency it was observed to have: a target percentile of its
+rolling latency histogram, multiplied by a safety factor and clamped between
+min and max bounds. The timeout therefore widens on its own during batch
+windows, when the upstreams are slow for everyone, and tightens again once
+they recover. It never goes below the caller's own timeoutSeconds, which is
+also used until the route has enough samples.
+
+Latencies are kept per (host, method, route), the route being the url path
+with its id-like segments (any segment holding a digit) replaced by ':id', so
+that a slow search does not widen the timeout of a fast lookup on the same
+host. Only idempotent requests (see RetryPolicy.IDEMPOTENT_METHODS) to the
+upstreams listed in the ADAPTIVE_TIMEOUTS Django setting adapt:
+
+    ADAPTIVE_TIMEOUTS = {
+        'upstreams': ['umv', 'group_api'],
+        'percentile': 0.99,
+        'safety_factor': 2.0,
+        'min_seconds': 0.25,
+        'max_seconds': 10,
+        'min_samples': 50,
+    }
+
+Attempts that time out are recorded at the time they waited, so a slow-down
+pushes the percentile up instead of hiding behind the timeouts it causes.
+The current timeouts are exposed for metrics through snapshot().
+"""
+
+import re
+import threading
+from typing import Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from yarl import URL
+
+from harmoney.metrics import HistogramRegistry, LatencyHistogram
+from harmoney.retry_policy import RetryPolicy
+
+# ADAPTIVE_TIMEOUTS keys configuring each AdaptiveTimeout
+TIMEOUT_SETTINGS = ('percentile', 'safety_factor', 'min_seconds', 'max_seconds', 'min_samples')
+ID_SEGMENT = re.compile(r'[^/]*\d[^/]*')
+
+
+def _get_settings() -> dict:
+    try:
+        return getattr(settings, 'ADAPTIVE_TIMEOUTS', {})
+    except ImproperlyConfigured:
+        return {}
+
+
+def is_adaptive_upstream(upstream: Optional[str]) -> bool:
+    """
+    :param upstream: the name of the request's upstream, if any
+    :type upstream: str
+    :return: whether the upstream opted in to adaptive timeouts
+    :rtype: bool
+    """
+    return upstream is not None and upstream in _get_settings().get('upstreams', ())
+
+
+def is_adaptive_method(method: Optional[str]) -> bool:
+    """
+    :param method: the HTTP method of the request
+    :type method: str
+    :return: whether requests of the method may adapt their timeout
+    :rtype: bool
+    """
+    return (method or '').upper() in RetryPolicy.IDEMPOTENT_METHODS
+
+
+def get_route_key(url, method: str) -> tuple:
+    """
+    :param url: a request url
+    :type url: str
+    :param method: the HTTP method of the request
+    :type method: str
+    :return: (host, method, route) of the request, its id-like path segments
+    replaced by ':id'
+    :rtype: tuple
+    """
+    parsed = URL(str(url))
+    return parsed.host or '', method.upper(), ID_SEGMENT.sub(':id', parsed.path)
+
+
+class AdaptiveTimeout:
+    """
+    Latency-derived timeout of a single upstream route
+
+    * name (str): the route, as 'METHOD host/path'
+    * histogram (LatencyHistogram): the route's observed latencies
+    * percentile (float): the target latency percentile, as a fraction
+    * safety_factor (float): multiplier applied to the target percentile
+    * min_seconds (float): lower bound of the timeout
+    * max_seconds (float): upper bound of the timeout
+    * min_samples (int): samples needed before the timeout adapts
+    """
+
+    def __init__(
+            self,
+            name: str,
+            histogram: LatencyHistogram,
+            percentile: float,
+            safety_factor: float,
+            min_seconds: float,
+            max_seconds: float,
+            min_samples: int
+    ):
+        self.name = name
+        self.histogram = histogram
+        self.percentile = percentile
+        self.safety_factor = safety_factor
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.min_samples = min_samples
+
+    def current(self) -> Optional[float]:
+        """
+        :return: the adapted timeout in seconds, or None while the route has
+        too few samples
+        :rtype: float
+        """
+        if self.histogram.sample_count() < self.min_samples:
+            return None
+        latency = self.histogram.percentile(self.percentile)
+        if latency is None:
+            return None
+        return min(self.max_seconds,
+                   max(self.min_seconds, latency * self.safety_factor))
+
+    def timeout(self, explicit: float) -> float:
+        """
+        :param explicit: the caller's static timeout, the least timeout
+        returned
+        :type explicit: float
+        :return: the timeout in seconds for the next call to the route
+        :rtype: float
+        """
+        current = self.current()
+        return explicit if current is None else max(explicit, current)
+
+    def snapshot(self) -> dict:
+        return {
+            'timeoutSeconds': self.current(),
+            'samples': self.histogram.sample_count(),
+            'percentile': self.percentile,
+            'safetyFactor': self.safety_factor,
+            'minSeconds': self.min_seconds,
+            'maxSeconds': self.max_seconds
+        }
+
+
+class AdaptiveTimeoutRegistry:
+    """
+    Process-wide adaptive timeouts keyed by (host, method, route), reading
+    latencies from the given histogram registry, which is keyed the same way.
+    Every route uses the settings of the ADAPTIVE_TIMEOUTS Django setting.
+    """
+
+    def __init__(self, histograms: HistogramRegistry):
+        self._lock = threading.Lock()
+        self._histograms = histograms
+        self._timeouts = {}
+
+    @staticmethod
+    def get_settings() -> dict:
+        """
+        :raises ImproperlyConfigured: ADAPTIVE_TIMEOUTS lacks one of
+        TIMEOUT_SETTINGS
+        :return: the AdaptiveTimeout keyword arguments configured
+        :rtype: dict
+        """
+        configured = _get_settings()
+        missing = [name for name in TIMEOUT_SETTINGS if name not in configured]
+        if missing:
+            raise ImproperlyConfigured(f"ADAPTIVE_TIMEOUTS must set {', '.join(missing)}")
+        return {name: configured[name] for name in TIMEOUT_SETTINGS}
+
+    def get(self, route_key: tuple) -> AdaptiveTimeout:
+        """
+        :param route_key: (host, method, route), see get_route_key
+        :type route_key: tuple
+        :return: the adaptive timeout of the route
+        :rtype: AdaptiveTimeout
+        """
+        with self._lock:
+            timeout = self._timeouts.get(route_key)
+            if timeout is None:
+                host, method, route = route_key
+                timeout = AdaptiveTimeout(
+                    f'{method} {host}{route}', self._histograms.get(route_key),
+                    **AdaptiveTimeoutRegistry.get_settings())
+                self._timeouts[route_key] = timeout
+            return timeout
+
+    def snapshot(self) -> dict:
+        """
+        :return: dict [route: adaptive timeout snapshot]
+        :rtype: dict
+        """
+        with self._lock:
+            timeouts = list(self._timeouts.values())
+        return {timeout.name: timeout.snapshot() for timeout in timeouts}
@@ -9,6 +9,16 @@ for efficient resource handling. It simplifies the process of working with HTTP
 requests, allowing users to easily send requests, handle responses, and manage
 connections.
 
+All AioHttpClient instances share one long-lived ClientSession per event loop
+(see get_shared_session), closed when that loop shuts down. The session owns
+a tuned TCPConnector so that keep-alive connections, TLS sessions and
+resolved DNS entries are reused across UMV, RTR, Softheon and MEDB calls
+instead of being re-established for every request. Automatic decompression
+is off on the session; bodies are decoded by the client itself (see
+harmoney.compression) so that wire and decoded byte counts can be accounted
+per host. The session also carries the TraceConfig of harmoney.tracing,
+which times the phases of every request.
+
 Example usage:
     ```
     # Create an instance of the AioHttpClient class
@@ -30,19 +40,295 @@ Example usage:
     ```
 """
 
+import atexit
+import codecs
+import contextvars
+import hashlib
 import json
 import re
 import asyncio
+import threading
+import time
+import weakref
 import aiohttp
 import logging
-from aiohttp import ClientSession, ClientTimeout
+from contextlib import AsyncExitStack, asynccontextmanager
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
 from typing import Optional
 
+from yarl import URL
+
+from harmoney import deadline, tracing
+from harmoney.adaptive_timeout import AdaptiveTimeoutRegistry, get_route_key, is_adaptive_method, \
+    is_adaptive_upstream
+from harmoney.bulkhead import BULKHEADS
+from harmoney.circuit_breaker import CIRCUIT_BREAKERS, CircuitBreaker
+from harmoney.compression import TRANSFER_STATS, ContentDecoder, get_accept_encoding
+from harmoney.config import Upstreams
+from harmoney.http_cache import CacheEntry, get_http_cache, is_cached_upstream
+from harmoney.exceptions import CircuitOpenException, DeadlineExceededException, ResponseTooLargeException, \
+    UpstreamStatusException, UpstreamTimeoutException
+from harmoney.json_stream import JsonArrayItemParser
+from harmoney.metrics import HistogramRegistry
+from harmoney.retry_policy import RetryPolicy, RetryPolicies
 from payment.constants import HttpStatusCodes
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 JSON_CONTENT_TYPE = re.compile(r'^application\/json', re.IGNORECASE)
 logger = logging.getLogger(__name__)
 
+COALESCABLE_METHODS = frozenset({'GET', 'HEAD'})
+HEDGEABLE_METHODS = frozenset({'GET', 'HEAD'})
+
+# Connection pool tuning for the shared session
+POOL_CONNECTION_LIMIT = 100
+POOL_CONNECTION_LIMIT_PER_HOST = 20
+POOL_KEEPALIVE_SECONDS = 30
+POOL_DNS_CACHE_SECONDS = 300
+
+# dict [event_loop: ClientSession]
+_SHARED_SESSIONS = weakref.WeakKeyDictionary()
+# dict [event_loop: asyncio.Task closing the loop's session once cancelled]
+_SESSION_CLOSERS = weakref.WeakKeyDictionary()
+_SHARED_SESSIONS_LOCK = threading.Lock()
+
+# dict [event_loop: dict [coalescing_key: asyncio.Task]]
+_IN_FLIGHT_REQUESTS = weakref.WeakKeyDictionary()
+_IN_FLIGHT_LOCK = threading.Lock()
+
+
+class CoalescingStats:
+    """
+    Thread-safe counters of coalesced requests. upstreamCalls counts the
+    requests actually sent, savedCalls the identical requests that joined one
+    already in flight instead of calling the upstream again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._upstream_calls = 0
+        self._saved_calls = 0
+
+    def record_upstream_call(self) -> None:
+        with self._lock:
+            self._upstream_calls += 1
+
+    def record_saved_call(self) -> None:
+        with self._lock:
+            self._saved_calls += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'upstreamCalls': self._upstream_calls,
+                'savedCalls': self._saved_calls
+            }
+
+
+COALESCING_STATS = CoalescingStats()
+
+
+class HedgeBudget:
+    """
+    Token bucket bounding the hedged requests sent to one host. Every
+    primary request earns `ratio` tokens, up to `max_tokens`, and every hedge
+    spends one. With a ratio of at most 1 there are never more hedges than
+    primary requests, so hedging can never more than double load.
+    """
+
+    DEFAULT_RATIO = 0.1
+    DEFAULT_MAX_TOKENS = 10
+
+    def __init__(self, ratio: float = DEFAULT_RATIO, max_tokens: float = DEFAULT_MAX_TOKENS):
+        self.ratio = min(ratio, 1.0)
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._requests = 0
+        self._hedges = 0
+        self._denied = 0
+
+    def record_request(self) -> None:
+        with self._lock:
+            self._requests += 1
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self._hedges += 1
+                return True
+            self._denied += 1
+            return False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'hedges': self._hedges,
+                'denied': self._denied,
+                'tokens': self._tokens
+            }
+
+
+class HedgeBudgetRegistry:
+    """
+    Process-wide HedgeBudgets keyed by upstream host
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._budgets = {}
+        self._host_settings = {}
+
+    def configure(self, host: str, **settings) -> None:
+        """
+        Sets the ratio and/or max_tokens of a host's budget
+
+        :param host: the upstream host
+        :type host: str
+        """
+        with self._lock:
+            self._host_settings[host] = settings
+            self._budgets.pop(host, None)
+
+    def get(self, host: str) -> HedgeBudget:
+        with self._lock:
+            budget = self._budgets.get(host)
+            if budget is None:
+                budget = HedgeBudget(**self._host_settings.get(host, {}))
+                self._budgets[host] = budget
+            return budget
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            budgets = list(self._budgets.items())
+        return {host: budget.snapshot() for host, budget in budgets}
+
+
+HEDGE_BUDGETS = HedgeBudgetRegistry()
+# Latency of completed attempts per upstream host
+HOST_LATENCIES = HistogramRegistry()
+# Latency of completed attempts per (host, method, route), for the routes
+# whose timeout adapts
+ROUTE_LATENCIES = HistogramRegistry()
+ADAPTIVE_TIMEOUTS = AdaptiveTimeoutRegistry(ROUTE_LATENCIES)
+
+
+def json_loads(body):
+    """
+    Decodes a JSON document with orjson when it is installed and with the
+    standard library otherwise. Both raise a ValueError on invalid input.
+
+    :param body: the raw JSON document
+    :type body: bytes or str
+    :return: the decoded document
+    :rtype: object
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def _build_connector() -> TCPConnector:
+    """
+    Creates the TCPConnector backing the shared session, with per-host
+    connection limits, keep-alive and a DNS cache
+
+    :return: a connector bound to the running event loop
+    :rtype: TCPConnector
+    """
+    return TCPConnector(
+        limit=POOL_CONNECTION_LIMIT,
+        limit_per_host=POOL_CONNECTION_LIMIT_PER_HOST,
+        keepalive_timeout=POOL_KEEPALIVE_SECONDS,
+        use_dns_cache=True,
+        ttl_dns_cache=POOL_DNS_CACHE_SECONDS,
+    )
+
+
+def get_shared_session() -> ClientSession:
+    """
+    Returns the long-lived ClientSession of the running event loop, creating
+    it on first use. aiohttp sessions are bound to the loop they were created
+    on, so every loop gets its own pool. Must be called from a coroutine.
+
+    :return: the pooled session for the running event loop
+    :rtype: ClientSession
+    """
+    loop = asyncio.get_running_loop()
+    with _SHARED_SESSIONS_LOCK:
+        session = _SHARED_SESSIONS.get(loop)
+        if session is None or session.closed:
+            session = ClientSession(
+                connector=_build_connector(),
+                auto_decompress=False,
+                trace_configs=[tracing.build_trace_config()]
+            )
+            _SHARED_SESSIONS[loop] = session
+            previous_closer = _SESSION_CLOSERS.get(loop)
+            if previous_closer is not None:
+                previous_closer.cancel()
+            # asyncio.run() cancels the tasks left on its loop before closing
+            # it, which closes the session while the loop can still run
+            _SESSION_CLOSERS[loop] = contextvars.Context().run(
+                loop.create_task, _close_session_when_cancelled(loop, session))
+    return session
+
+
+async def _close_session_when_cancelled(loop, session: ClientSession) -> None:
+    try:
+        await loop.create_future()
+    finally:
+        with _SHARED_SESSIONS_LOCK:
+            if _SHARED_SESSIONS.get(loop) is session:
+                del _SHARED_SESSIONS[loop]
+        if not session.closed:
+            await session.close()
+
+
+async def close_shared_session() -> None:
+    """
+    Closes the shared session of the running event loop and releases its
+    pooled connections. A new session is created on the next request.
+    """
+    loop = asyncio.get_running_loop()
+    with _SHARED_SESSIONS_LOCK:
+        session = _SHARED_SESSIONS.pop(loop, None)
+        closer = _SESSION_CLOSERS.pop(loop, None)
+    if closer is not None:
+        closer.cancel()
+        await asyncio.wait([closer])
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def _close_shared_sessions_at_exit() -> None:
+    """
+    Closes the sessions of loops that are idle at interpreter shutdown. Loops
+    that are still running are left to their owner to tear down, and loops
+    shut down by asyncio.run() closed their session on the way.
+    """
+    with _SHARED_SESSIONS_LOCK:
+        closers = list(_SESSION_CLOSERS.items())
+        _SESSION_CLOSERS.clear()
+    for loop, closer in closers:
+        if closer.done() or loop.is_closed() or loop.is_running():
+            continue
+        closer.cancel()
+        try:
+            loop.run_until_complete(asyncio.wait([closer]))
+        except Exception as exc:
+            logger.error(exc)
+
+
+atexit.register(_close_shared_sessions_at_exit)
+
 
 class AioHttpClient:
     """
@@ -67,7 +353,33 @@ class AioHttpClient:
     * throwOnParseError (bool): A boolean flag used to raise an exception when
     an error occurs. Defaults to False.
     * timeoutSeconds (int): An integer representing the total amount of seconds
-    permitted for the life of a HTTP request. Defaults to 10
+    permitted for the life of a HTTP request, and the least timeout an
+    adaptive timeout may set. Defaults to 1.
+    * adaptiveTimeout (bool): Widen the timeout of idempotent requests to the
+    observed latency of their route (see harmoney.adaptive_timeout). Defaults
+    to whether the request's upstream is listed in the ADAPTIVE_TIMEOUTS
+    setting.
+    * retryPolicy (RetryPolicies or RetryPolicy): The named retry policy of the
+    request. Defaults to RetryPolicies.DEFAULT.
+    * retries (int), backoff (float): Legacy retry settings, translated into a
+    RetryPolicy when no retryPolicy is given.
+    * upstream (Upstreams or str): The upstream called, which selects the
+    concurrency bulkhead the request runs in. Requests without an upstream
+    are not bounded.
+    * coalesce (bool): Share one upstream call and its parsed result between
+    identical GET/HEAD requests in flight at the same time. Defaults to False.
+    * hedge (bool): Send a second identical GET/HEAD request when the first
+    has not completed after the hedge delay and keep the first response.
+    Defaults to False.
+    * hedgeDelaySeconds (float): The hedge delay. Defaults to the observed p95
+    latency of the host.
+    * httpCache (bool): Serve GET requests from the HTTP cache while fresh
+    and revalidate them with ETag / Last-Modified (see harmoney.http_cache).
+    Defaults to whether the request's upstream is listed in the HTTP_CACHE
+    setting.
+    * maxBodyBytes (int): The largest response body read, larger bodies abort
+    the read with a ResponseTooLargeException. None for no limit. Defaults to
+    16 MiB.
     * _retryAttempts (int): An integer representing the total amount of HTTP
     request retries available. Defaults to 0.
     """
@@ -78,16 +390,34 @@ class AioHttpClient:
     DEFAULT_BACKOFF_SECONDS = 0.05
     DEFAULT_ASSUME_RESPONSE_IS_JSON = False
     DEFAULT_THROW_ON_PARSE_ERROR = False
+    DEFAULT_MAX_CONCURRENCY = 10
+    DEFAULT_MAX_BODY_BYTES = 16 * 1024 * 1024
+    STREAM_CHUNK_BYTES = 64 * 1024
+    HEDGE_PERCENTILE = 0.95
+    HEDGE_MIN_SAMPLES = 20
 
     def __init__(self):
         self.session: Optional[ClientSession] = None
 
     async def __aenter__(self) -> "AioHttpClient":
-        self.session = ClientSession()
+        self.session = get_shared_session()
         return self
 
     async def __aexit__(self, *err) -> None:
-        await self.session.close()
+        # The shared session outlives the context, only drop the reference
+        self.session = None
+
+    def _get_session(self) -> ClientSession:
+        """
+        Returns the session bound by the context manager, or the shared
+        session of the running event loop
+
+        :return: the session to issue requests on
+        :rtype: ClientSession
+        """
+        if self.session is not None and not self.session.closed:
+            return self.session
+        return get_shared_session()
 
     @staticmethod
     def build_headers_object(headers: dict):
@@ -101,70 +431,106 @@ class AioHttpClient:
         return headers.items()
 
     @staticmethod
-    async def get_common_response(response: aiohttp.ClientResponse):
+    def get_common_response(response: aiohttp.ClientResponse, parsed_body: dict):
         """
-        get_common_response() takes in a ClientResponse object from aiohttp.
-         It creates a common dictionary response
+        get_common_response() takes in a ClientResponse object from aiohttp
+        and its already decoded body. It creates a common dictionary response
         that allows more transparency between shared services
 
         :param response: The returned response from an aiohttp call
         :type response: object
+        :param parsed_body: The decoded body as returned by parse_response
+        :type parsed_body: dict
         :return: returns a common response dictionary for other services
         :rtype: dict
         """
-        try:
-            data = await response.text()
-            common_response = {
-                'ok': response.ok,
-                'status': response.status,
-                'statusText': response.reason,
-                'headers': AioHttpClient.build_headers_object(response.headers),
-                'url': str(response.url)
-            }
-            try:
-                json_data = json.loads(data)
-                common_response['data'] = json_data
-            except json.JSONDecodeError:
-                common_response['data'] = data
-            return common_response
-        except Exception as exc:
-            logger.error(exc)
-            return {}
+        return {
+            'ok': response.ok,
+            'status': response.status,
+            'statusText': response.reason,
+            'headers': AioHttpClient.build_headers_object(response.headers),
+            'url': str(response.url),
+            'isJson': parsed_body.get('isJson', False),
+            'data': parsed_body.get('data')
+        }
 
     @staticmethod
-    async def parse_response(response: aiohttp.ClientResponse, config=None):
+    def parse_response(response: aiohttp.ClientResponse, body: bytes, config=None):
         """
-        Automatically parse an aiohttp response as JSON, with error handling
-        * :param res: The aiohttp response
-        * :type res: Response
+        Decodes the raw body of an aiohttp response exactly once, as JSON when
+        the response is (or is assumed to be) JSON and as text otherwise
+        * :param response: The aiohttp response the body was read from
+        * :type response: Response
+        * :param body: The raw response body
+        * :type body: bytes
         * :param dict config: The configuration object
         * :type config: dict
-        * :return: Awaits a coroutine with an object containing a data field and
-            an isJson field.  If the parse succeeds, data will be the parsed
-            object from the json and isJson will be true.  If the parse fails,
-            data will be the response text and isJson will be false.  If the
-            config option throwOnParseError is set and the parse fails, an error
-            will be thrown.
-        * :rtype: coroutine<dict>
+        * :return: An object containing a data field and an isJson field.  If
+            the parse succeeds, data will be the parsed object from the json
+            and isJson will be true.  If the parse fails, data will be the
+            response text and isJson will be false.  If the config option
+            throwOnParseError is set and the parse fails, an error will be
+            thrown.
+        * :rtype: dict
         """
-        data = await response.text()
+        config = {} if config is None else config
         assume_response_is_json = config.get(
             "assumeResponseIsJson",
             AioHttpClient.DEFAULT_ASSUME_RESPONSE_IS_JSON
         )
         if assume_response_is_json or JSON_CONTENT_TYPE.match(
-                response.headers['Content-Type']):
+                response.headers.get('Content-Type', '')):
             try:
-                return {'data': json.loads(data), 'isJson': True}
-            except json.JSONDecodeError as exc:
-                if config.get("throwOnParseError", False):
+                return {'data': json_loads(body), 'isJson': True}
+            except ValueError as exc:
+                if config.get(
+                        "throwOnParseError",
+                        AioHttpClient.DEFAULT_THROW_ON_PARSE_ERROR):
                     raise exc
-        return {'data': data, 'isJson': False}
+        return {
+            'data': body.decode(response.charset or 'utf-8', errors='replace'),
+            'isJson': False
+        }
 
     async def _http_request(self, url, options, config):
         """
         http_request is a helper function and a wrapper around aiohttp that
-        implements timeouts, retries, and automatic json parsing
+        implements timeouts, retries, and automatic json parsing. Requests
+        opted in with the 'coalesce' config key share one upstream call with
+        identical requests already in flight. Fresh responses of cached
+        upstreams are served without a request
+
+        * :param str url: The url to request
+        * :type url: str
+        * :param options: The options object to pass to request
+        * :type options: dict
+        * :param dict config: The request configuration object.
+        * :type config: dict
+        * :return: Returns a coroutine with a response object
+        * :rtype: coroutine<dict>
+        """
+        cache_key = AioHttpClient.get_http_cache_key(url, options, config)
+        if cache_key is not None:
+            cache = get_http_cache()
+            entry = cache.get(cache_key)
+            if entry is not None and entry.is_fresh():
+                cache.record_hit()
+                return AioHttpClient.get_cached_response(entry, config)
+            config = {**config, '_httpCacheKey': cache_key}
+        if config.get('coalesce') and AioHttpClient.is_coalescable(options):
+            return await self._coalesced_http_request(url, options, config)
+        return await self._retrying_http_request(url, options, config)
+
+    async def _retrying_http_request(self, url, options, config):
+        """
+        Performs a request with the request's RetryPolicy: timeouts,
+        connection errors and retryable statuses are retried with jittered
+        exponential backoff while attempts and the elapsed-time budget remain.
+        Every attempt goes through the circuit breaker of the url's host,
+        and the request counts as a single success or failure of the breaker
+        once it gives up retrying; an open circuit fails fast.
+        No retry is started when its backoff would outlast the request
+        deadline (see harmoney.deadline)
 
         * :param str url: The url to request
         * :type url: str
@@ -172,29 +538,558 @@ class AioHttpClient:
         * :type options: dict
         * :param dict config: The request configuration object.
         * :type config: dict
+        * :raises CircuitOpenException: the upstream's circuit is open
+        * :raises DeadlineExceededException: the request deadline passed
+        before any attempt completed
+        * :raises UpstreamTimeoutException: the last attempt timed out and no
+        attempt returned a response
         * :return: Returns a coroutine with a response object
-        * :rtype: coroutine<dict or None>
+        * :rtype: coroutine<dict>
         """
+        if deadline.expired():
+            raise DeadlineExceededException(url)
+        policy = AioHttpClient.get_retry_policy(config)
+        method = options.get('method', '').upper()
+        can_retry = policy.allows_method(method)
         response = {}
-        retries = config.get('retries', AioHttpClient.DEFAULT_RETRIES)
-        retry_attempts = config.get('_retryAttempts', 0)
-        backoff = config.get('backoff', AioHttpClient.DEFAULT_BACKOFF_SECONDS)
-        while retry_attempts < retries + 1:
+        attempt = config.get('_retryAttempts', AioHttpClient.DEFAULT_RETRY_ATTEMPTS)
+        start = time.monotonic()
+        breaker = AioHttpClient.get_circuit_breaker(url)
+        while True:
+            retry_after = None
+            if not breaker.allow_request():
+                logger.error(f"Circuit open for {breaker.name}, failing fast: {url}")
+                raise CircuitOpenException(breaker.name, breaker.retry_after())
             try:
-                response = await self._perform_http_request(url, options, config)
-                return response
+                response = await self._attempt_http_request(url, options, config)
             except (aiohttp.ServerTimeoutError, asyncio.TimeoutError):
-                logger.error(f"Timeout Reached: {url}, retrying again.")
-                await asyncio.sleep(backoff)
-                retry_attempts += 1
-                continue
+                failed = True
+                if not can_retry:
+                    breaker.record_failure()
+                    logger.error(f"Timeout Reached: {url}, not retrying {method}.")
+                    return AioHttpClient.last_response(url, response, f"not retrying {method}")
+                reason = "Timeout Reached"
+            except aiohttp.ClientConnectionError as exc:
+                failed = True
+                if not (can_retry and policy.retry_on_connection_errors) \
+                        or attempt >= policy.max_retries:
+                    breaker.record_failure()
+                    raise exc
+                reason = f"Connection error ({exc})"
+            except BaseException:
+                breaker.release()
+                raise
+            else:
+                status = response.get('status')
+                failed = status >= 500
+                if not (can_retry and policy.should_retry_status(status)):
+                    AioHttpClient.record_outcome(breaker, failed)
+                    return response
+                retry_after = RetryPolicy.parse_retry_after(
+                    AioHttpClient.get_header(response, 'Retry-After'))
+                reason = f"Status {status}"
+
+            if attempt >= policy.max_retries:
+                AioHttpClient.record_outcome(breaker, failed)
+                logger.error(f"{reason}: {url}, retries exhausted.")
+                return AioHttpClient.last_response(url, response, "retries exhausted")
+            delay = policy.compute_delay(attempt, retry_after)
+            if not policy.has_budget(time.monotonic() - start, delay):
+                AioHttpClient.record_outcome(breaker, failed)
+                logger.error(f"{reason}: {url}, retry budget exhausted.")
+                return AioHttpClient.last_response(url, response, "retry budget exhausted")
+            left = deadline.remaining()
+            if left is not None and delay >= left:
+                AioHttpClient.record_outcome(breaker, failed)
+                logger.error(f"{reason}: {url}, request deadline reached.")
+                if not response:
+                    raise DeadlineExceededException(url)
+                return response
+            if failed:
+                breaker.record_retried_failure()
+            else:
+                breaker.release()
+            logger.error(f"{reason}: {url}, retrying again in {delay:.3f}s.")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def record_outcome(breaker: CircuitBreaker, failed: bool) -> None:
+        """
+        Ends the last allowed call of a request that gives up retrying
+
+        :param breaker: the circuit breaker of the request's host
+        :type breaker: CircuitBreaker
+        :param failed: whether the last attempt timed out, failed to connect
+        or returned a 5xx
+        :type failed: bool
+        """
+        if failed:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    @staticmethod
+    def last_response(url, response: dict, reason: str) -> dict:
+        """
+        :param url: the requested url
+        :type url: str
+        :param response: the response of the last attempt that returned one,
+        empty when every attempt timed out
+        :type response: dict
+        :param reason: why no further attempt is made
+        :type reason: str
+        :raises UpstreamTimeoutException: no attempt returned a response
+        :return: the response
+        :rtype: dict
+        """
+        if not response:
+            raise UpstreamTimeoutException(url, reason)
+        return response
+
+    @staticmethod
+    def is_coalescable(options) -> bool:
+        """
+        :param options: The options object to pass to request
+        :type options: dict
+        :return: whether the request is idempotent and body-less, and so may
+        share its result with identical requests
+        :rtype: bool
+        """
+        method = options.get('method', '').upper()
+        return method in COALESCABLE_METHODS and not options.get('data')
+
+    @staticmethod
+    def coalescing_key(url, options) -> tuple:
+        """
+        Builds the identity of a request for coalescing from its method, url,
+        params and a hash of its Authorization header, so that callers with
+        different credentials never share a result
+
+        :param url: url to fetch data from
+        :type url: str
+        :param options: The options object to pass to request
+        :type options: dict
+        :return: the coalescing key
+        :rtype: tuple
+        """
+        headers = options.get('headers') or {}
+        authorization = next(
+            (value for key, value in headers.items()
+             if key.lower() == 'authorization'),
+            ''
+        )
+        params = options.get('params') or {}
+        return (
+            options.get('method', '').upper(),
+            str(url),
+            tuple(sorted((str(k), str(v)) for k, v in params.items())),
+            hashlib.sha256(authorization.encode('utf-8')).hexdigest()
+        )
+
+    async def _coalesced_http_request(self, url, options, config):
+        """
+        Joins an identical request that is already in flight on this event
+        loop, or starts one that later identical requests can join. All
+        callers get the same parsed result (as a shallow copy) or exception.
+        The shared request runs outside any request deadline, and each caller
+        waits for it until its own deadline. A caller being cancelled or
+        running out of time does not cancel the shared request.
+
+        :param url: url to fetch data from
+        :type url: str
+        :param options: The options object to pass to request
+        :type options: dict
+        :param config: the request configuration object
+        :type config: dict
+        :raises DeadlineExceededException: the caller's deadline passed
+        before the shared request completed
+        :return: returns dictionary with common_response attached
+        :rtype: dict
+        """
+        key = AioHttpClient.coalescing_key(url, options)
+        loop = asyncio.get_running_loop()
+        with _IN_FLIGHT_LOCK:
+            in_flight = _IN_FLIGHT_REQUESTS.setdefault(loop, {})
+        task = in_flight.get(key)
+        if task is None:
+            COALESCING_STATS.record_upstream_call()
+            # The shared call serves unrelated requests, so it must not run
+            # under the deadline and resolver tag of the one that started it
+            task = contextvars.Context().run(
+                loop.create_task, self._retrying_http_request(url, options, config))
+            in_flight[key] = task
+            task.add_done_callback(
+                lambda done: in_flight.pop(key, None)
+                if in_flight.get(key) is done else None
+            )
+        else:
+            COALESCING_STATS.record_saved_call()
+        left = deadline.remaining()
+        if left is None:
+            response = await asyncio.shield(task)
+        else:
+            if left <= 0:
+                raise DeadlineExceededException(url)
+            try:
+                response = await asyncio.wait_for(asyncio.shield(task), left)
+            except asyncio.TimeoutError:
+                if task.done():
+                    raise
+                raise DeadlineExceededException(url)
+        return dict(response)
+
+    @staticmethod
+    def get_http_cache_key(url, options, config) -> Optional[tuple]:
+        """
+        :param url: url to fetch data from
+        :type url: str
+        :param options: The options object to pass to request
+        :type options: dict
+        :param config: the request configuration object
+        :type config: dict
+        :return: the HTTP cache key of the request, None when it is not
+        cached
+        :rtype: tuple
+        """
+        if (options.get('method') or '').upper() != 'GET':
+            return None
+        enabled = config.get('httpCache')
+        if enabled is None:
+            enabled = is_cached_upstream(AioHttpClient.get_upstream(config))
+        if not enabled:
+            return None
+        return AioHttpClient.coalescing_key(url, options)
+
+    @staticmethod
+    def get_cached_response(entry: CacheEntry, config) -> dict:
+        """
+        Decodes a cached response into a new common response, so that callers
+        never share mutable data
+
+        :param entry: the cached response
+        :type entry: CacheEntry
+        :param config: the request configuration object
+        :type config: dict
+        :return: returns dictionary with common_response attached
+        :rtype: dict
+        """
+        parsed_body = AioHttpClient.parse_response(entry, entry.body, config)
+        return AioHttpClient.get_common_response(entry, parsed_body)
+
+    @staticmethod
+    def http_cache_stats() -> dict:
+        """
+        :return: the HTTP cache size and hit counters, for metrics
+        :rtype: dict
+        """
+        return get_http_cache().snapshot()
+
+    @staticmethod
+    def coalescing_stats() -> dict:
+        """
+        :return: counters of coalesced requests, for metrics
+        :rtype: dict
+        """
+        return COALESCING_STATS.snapshot()
+
+    async def _attempt_http_request(self, url, options, config):
+        """
+        Performs a single attempt, hedged when the request opted in with the
+        'hedge' config key
+
+        :param url: url to fetch data from
+        :type url: str
+        :param options: The options object to pass to request
+        :type options: dict
+        :param config: the request configuration object
+        :type config: dict
+        :return: returns dictionary with common_response attached
+        :rtype: dict
+        """
+        method = options.get('method', '').upper()
+        if config.get('hedge') and method in HEDGEABLE_METHODS:
+            return await self._hedged_http_request(url, options, config)
+        return await self._bulkheaded_http_request(url, options, config)
+
+    async def _hedged_http_request(self, url, options, config):
+        """
+        Sends the request and, if it has not completed after the hedge delay,
+        a second identical request. The first successful response wins and
+        the other request is cancelled. Hedges are only sent while the host's
+        HedgeBudget allows it, which bounds them to a fraction of the
+        primary requests so that hedging can never more than double load.
+
+        :param url: url to fetch data from
+        :type url: str
+        :param options: The options object to pass to request
+        :type options: dict
+        :param config: the request configuration object
+        :type config: dict
+        :return: returns dictionary with common_response attached
+        :rtype: dict
+        """
+        host = URL(str(url)).host or ''
+        budget = HEDGE_BUDGETS.get(host)
+        budget.record_request()
+        delay = AioHttpClient.get_hedge_delay(url, config)
+        primary = asyncio.ensure_future(
+            self._bulkheaded_http_request(url, options, config))
+        tasks = [primary]
+        try:
+            if delay is None:
+                return await primary
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not budget.try_acquire():
+                return await primary
+            logger.debug(f"Hedging request to {url} after {delay:.3f}s")
+            tasks.append(asyncio.ensure_future(
+                self._bulkheaded_http_request(url, options, config)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is None:
+                        return task.result()
+            # Both requests failed, surface the primary's error
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    @staticmethod
+    def get_hedge_delay(url, config) -> Optional[float]:
+        """
+        Resolves how long to wait before hedging: the 'hedgeDelaySeconds'
+        config key, or the observed p95 latency of the url's host once enough
+        samples were collected
+
+        :param url: a request url
+        :type url: str
+        :param config: the request configuration object
+        :type config: dict
+        :return: the hedge delay in seconds, or None to not hedge
+        :rtype: float
+        """
+        delay = config.get('hedgeDelaySeconds')
+        if delay is not None:
+            return delay
+        histogram = HOST_LATENCIES.get(URL(str(url)).host or '')
+        if histogram.sample_count() < AioHttpClient.HEDGE_MIN_SAMPLES:
+            return None
+        return histogram.percentile(AioHttpClient.HEDGE_PERCENTILE)
+
+    @staticmethod
+    def hedging_stats() -> dict:
+        """
+        :return: dict [host: hedge budget counters], for metrics
+        :rtype: dict
+        """
+        return HEDGE_BUDGETS.snapshot()
+
+    async def _bulkheaded_http_request(self, url, options, config):
+        """
+        Performs a single attempt inside a slot of the bulkhead named by the
+        'upstream' config key, and records its latency once it holds the slot
+
+        :param url: url to fetch data from
+        :type url: str
+        :param options: The options object to pass to request
+        :type options: dict
+        :param config: the request configuration object
+        :type config: dict
+        :raises BulkheadFullException: the upstream's bulkhead is full
+        :return: returns dictionary with common_response attached
+        :rtype: dict
+        """
+        upstream = AioHttpClient.get_upstream(config)
+        if upstream is None:
+            return await self._timed_http_request(url, options, config)
+        async with BULKHEADS.get(upstream).slot():
+            return await self._timed_http_request(url, options, config)
+
+    async def _timed_http_request(self, url, options, config):
+        """
+        Performs a single attempt and records its latency in the histogram of
+        the url's host, from which the hedge delay is derived, and in that of
+        its route when its timeout adapts. An attempt that timed out is
+        recorded with the time it waited.
+
+        :param url: url to fetch data from
+        :type url: str
+        :param options: The options object to pass to request
+        :type options: dict
+        :param config: the request configuration object
+        :type config: dict
+        :return: returns dictionary with common_response attached
+        :rtype: dict
+        """
+        histograms = [HOST_LATENCIES.get(URL(str(url)).host or '')]
+        if AioHttpClient.uses_adaptive_timeout(options, config):
+            histograms.append(ROUTE_LATENCIES.get(get_route_key(url, options['method'])))
+        start = time.monotonic()
+        try:
+            response = await self._perform_http_request(url, options, config)
+        except asyncio.TimeoutError:
+            # The real latency is at least as long as the attempt waited,
+            # unless the attempt was cut short by the request deadline
+            if not deadline.expired():
+                for histogram in histograms:
+                    histogram.observe(time.monotonic() - start)
+            raise
+        for histogram in histograms:
+            histogram.observe(time.monotonic() - start)
         return response
 
+    @staticmethod
+    def uses_adaptive_timeout(options, config) -> bool:
+        """
+        :param options: The options object to pass to request
+        :type options: dict
+        :param config: the request configuration object
+        :type config: dict
+        :return: whether the request's timeout adapts to the latency of its
+        route: an idempotent request whose 'adaptiveTimeout' config key, or
+        else its upstream, opted in
+        :rtype: bool
+        """
+        if not is_adaptive_method(options.get('method')):
+            return False
+        enabled = config.get('adaptiveTimeout')
+        if enabled is None:
+            enabled = is_adaptive_upstream(AioHttpClient.get_upstream(config))
+        return bool(enabled)
+
+    @staticmethod
+    def get_timeout(url, options, config) -> float:
+        """
+        Resolves the total timeout of an attempt: the static 'timeoutSeconds'
+        config key, widened to the adaptive timeout of the request's route
+        when it uses one (see uses_adaptive_timeout) and the route has enough
+        samples. Either is cut down to the time left before the request
+        deadline
+
+        :param url: url to fetch data from
+        :type url: str
+        :param options: The options object to pass to request
+        :type options: dict
+        :param config: the request configuration object
+        :type config: dict
+        :raises DeadlineExceededException: the request deadline has passed
+        :return: the timeout in seconds
+        :rtype: float
+        """
+        timeout = config.get(
+            'timeoutSeconds', AioHttpClient.DEFAULT_TIMEOUT_SECONDS)
+        if AioHttpClient.uses_adaptive_timeout(options, config):
+            timeout = ADAPTIVE_TIMEOUTS.get(
+                get_route_key(url, options['method'])).timeout(timeout)
+        left = deadline.remaining()
+        if left is None:
+            return timeout
+        if left <= 0:
+            raise DeadlineExceededException(url)
+        return min(timeout, left)
+
+    @staticmethod
+    def timeout_states() -> dict:
+        """
+        :return: dict [route: current adaptive timeout and its settings], for
+        metrics
+        :rtype: dict
+        """
+        return ADAPTIVE_TIMEOUTS.snapshot()
+
+    @staticmethod
+    def get_upstream(config) -> Optional[str]:
+        """
+        :param config: the request configuration object
+        :type config: dict
+        :return: the name of the request's upstream, if given
+        :rtype: str
+        """
+        upstream = config.get('upstream')
+        if isinstance(upstream, Upstreams):
+            return upstream.value
+        return upstream
+
+    @staticmethod
+    def bulkhead_states() -> dict:
+        """
+        :return: dict [upstream: bulkhead counters], for metrics
+        :rtype: dict
+        """
+        return BULKHEADS.snapshot()
+
+    @staticmethod
+    def get_circuit_breaker(url) -> CircuitBreaker:
+        """
+        :param url: a request url
+        :type url: str
+        :return: the circuit breaker of the url's host
+        :rtype: CircuitBreaker
+        """
+        return CIRCUIT_BREAKERS.get(URL(str(url)).host or '')
+
+    @staticmethod
+    def circuit_breaker_states() -> dict:
+        """
+        :return: dict [host: state and counters] of every circuit breaker,
+        for metrics
+        :rtype: dict
+        """
+        return CIRCUIT_BREAKERS.snapshot()
+
+    @staticmethod
+    def get_retry_policy(config) -> RetryPolicy:
+        """
+        Resolves the retry policy of a request config. A named policy given
+        under 'retryPolicy' wins; the legacy 'retries' and 'backoff' keys are
+        translated into an equivalent policy.
+
+        :param config: the request configuration object
+        :type config: dict
+        :return: the policy to apply to the request
+        :rtype: RetryPolicy
+        """
+        policy = config.get('retryPolicy')
+        if isinstance(policy, RetryPolicies):
+            return policy.value
+        if isinstance(policy, RetryPolicy):
+            return policy
+        if 'retries' not in config and 'backoff' not in config:
+            return RetryPolicies.DEFAULT.value
+        return RetryPolicy(
+            max_retries=config.get('retries', AioHttpClient.DEFAULT_RETRIES),
+            base_delay_seconds=config.get(
+                'backoff', AioHttpClient.DEFAULT_BACKOFF_SECONDS)
+        )
+
+    @staticmethod
+    def get_header(response: dict, name: str):
+        """
+        Looks up a header of a common response, case-insensitively
+
+        :param response: a common response dictionary
+        :type response: dict
+        :param name: the header name
+        :type name: str
+        :return: the first value of the header, or None
+        :rtype: str
+        """
+        name = name.lower()
+        for key, value in response.get('headers') or ():
+            if key.lower() == name:
+                return value
+        return None
+
     async def _perform_http_request(self, url, options, config):
         """
         perform_http_request is a helper function called within the scope
         of http_request that performs the actual http request and returns
-        data if valid
+        data if valid. The body is read as bytes and decoded a single time
 
         :param url: url to fetch data from
         :type url: str
@@ -207,27 +1102,305 @@ class AioHttpClient:
         :return: returns dictionary with common_response attached
         :rtype: dict
         """
-        resp = {}
         method = options.get('method', '').upper()
-        headers = options.get('headers', None)
+        headers = AioHttpClient.get_request_headers(options, config)
         params = options.get('params', {})
+        cache_key = config.get('_httpCacheKey')
+        entry = get_http_cache().get(cache_key) if cache_key is not None else None
+        if entry is not None:
+            for name, value in entry.conditional_headers().items():
+                headers.setdefault(name, value)
         data = options.get('data', {})
-        timeout = ClientTimeout(total=config.get(
-            'timeoutSeconds', AioHttpClient.DEFAULT_TIMEOUT_SECONDS))
-        async with self.session.request(
+        timeout = ClientTimeout(total=AioHttpClient.get_timeout(url, options, config))
+        trace_context = tracing.new_trace_context(AioHttpClient.get_upstream(config))
+        async with self._get_session().request(
                 method=method,
                 url=url,
                 params=params,
                 headers=headers,
                 data=data,
                 ssl=False,
-                timeout=timeout
+                timeout=timeout,
+                trace_request_ctx=trace_context
         ) as response:
-            common_response = await AioHttpClient.get_common_response(response)
-            obj = await self.parse_response(response, config)
-            if obj.get('isJson'):
-                resp = {'isJson': True, 'data': obj.get('data', {}), **common_response}
-        return resp
+            body = await AioHttpClient.read_body(
+                response, url, AioHttpClient.get_max_body_bytes(config))
+        tracing.record_body_read(trace_context)
+        if cache_key is not None:
+            cache = get_http_cache()
+            if response.status == HttpStatusCodes.NotModified.value and entry is not None:
+                entry.refresh(response.headers)
+                cache.record_revalidated()
+                return AioHttpClient.get_cached_response(entry, config)
+            cache.record_miss()
+            if CacheEntry.is_storable(response.status, response.headers):
+                cache.put(cache_key, CacheEntry(
+                    response.status, response.reason, response.headers,
+                    str(response.url), response.charset, body))
+        parsed_body = AioHttpClient.parse_response(response, body, config)
+        return AioHttpClient.get_common_response(response, parsed_body)
+
+    @staticmethod
+    def get_request_headers(options, config) -> dict:
+        """
+        :param options: The options object to pass to request
+        :type options: dict
+        :param config: the request configuration object
+        :type config: dict
+        :return: the request's headers, with the Accept-Encoding of its
+        upstream unless the caller set one
+        :rtype: dict
+        """
+        headers = dict(options.get('headers') or {})
+        if not any(key.lower() == 'accept-encoding' for key in headers):
+            headers['Accept-Encoding'] = get_accept_encoding(
+                AioHttpClient.get_upstream(config))
+        return headers
+
+    @staticmethod
+    def phase_timings() -> dict:
+        """
+        :return: dict [upstream: dict [resolver: dict [phase: latency
+        histogram]]] of the pool_wait, dns, connect, first_byte and body
+        phases, for metrics
+        :rtype: dict
+        """
+        return tracing.phase_snapshot()
+
+    @staticmethod
+    def connection_reuse_stats() -> dict:
+        """
+        :return: dict [upstream: dict [resolver: new and reused connection
+        counts]], for metrics
+        :rtype: dict
+        """
+        return tracing.CONNECTION_STATS.snapshot()
+
+    @staticmethod
+    def transfer_stats() -> dict:
+        """
+        :return: dict [host: dict [encoding: wire and decoded byte counts]],
+        for metrics
+        :rtype: dict
+        """
+        return TRANSFER_STATS.snapshot()
+
+    @staticmethod
+    def get_max_body_bytes(config) -> Optional[int]:
+        """
+        :param config: the request configuration object
+        :type config: dict
+        :return: the largest response body allowed, None for no limit
+        :rtype: int
+        """
+        return config.get('maxBodyBytes', AioHttpClient.DEFAULT_MAX_BODY_BYTES)
+
+    @staticmethod
+    async def iter_body(response: aiohttp.ClientResponse, url, max_bytes: Optional[int]):
+        """
+        Reads and decodes a response body chunk by chunk, aborting once the
+        decoded body grows past max_bytes. A Content-Length above the limit
+        aborts before reading. Wire and decoded sizes are recorded in the
+        transfer stats of the url's host.
+
+        :param response: the response being read
+        :type response: aiohttp.ClientResponse
+        :param url: the requested url, for the error message
+        :type url: str
+        :param max_bytes: the largest body allowed, None for no limit
+        :type max_bytes: int
+        :raises ResponseTooLargeException: the body exceeds max_bytes
+        :return: the decoded body chunks
+        :rtype: async_generator<bytes>
+        """
+        if max_bytes is not None and response.content_length is not None \
+                and response.content_length > max_bytes:
+            raise ResponseTooLargeException(url, max_bytes)
+        decoder = ContentDecoder(
+            response.headers.get('Content-Encoding'),
+            AioHttpClient.STREAM_CHUNK_BYTES)
+        wire_bytes = 0
+        decoded_bytes = 0
+        try:
+            async for chunk in response.content.iter_chunked(
+                    AioHttpClient.STREAM_CHUNK_BYTES):
+                wire_bytes += len(chunk)
+                for piece in decoder.decompress(chunk):
+                    decoded_bytes += len(piece)
+                    if max_bytes is not None and decoded_bytes > max_bytes:
+                        logger.error(f"Aborting read of {url} after {decoded_bytes} bytes")
+                        raise ResponseTooLargeException(url, max_bytes)
+                    yield piece
+            piece = decoder.flush()
+            decoded_bytes += len(piece)
+            if max_bytes is not None and decoded_bytes > max_bytes:
+                raise ResponseTooLargeException(url, max_bytes)
+            if piece:
+                yield piece
+        finally:
+            TRANSFER_STATS.record(
+                URL(str(url)).host or '', decoder.encoding, wire_bytes, decoded_bytes)
+
+    @staticmethod
+    async def read_body(response: aiohttp.ClientResponse, url, max_bytes: Optional[int]) -> bytes:
+        """
+        :param response: the response being read
+        :type response: aiohttp.ClientResponse
+        :param url: the requested url, for the error message
+        :type url: str
+        :param max_bytes: the largest body allowed, None for no limit
+        :type max_bytes: int
+        :raises ResponseTooLargeException: the body exceeds max_bytes
+        :return: the whole decoded body
+        :rtype: bytes
+        """
+        chunks = [
+            chunk async for chunk in AioHttpClient.iter_body(response, url, max_bytes)
+        ]
+        return b''.join(chunks)
+
+    @asynccontextmanager
+    async def _streaming_response(self, url, options, config):
+        """
+        Opens a request whose body is left unread for the caller to stream.
+        The request holds its circuit breaker call and bulkhead slot until the
+        block exits, and its outcome is recorded then: a body that times out
+        or breaks off while read counts as a failure, like a status >= 500.
+        Statuses >= 400 raise like run_instance
+
+        :param url: url to fetch data from
+        :type url: str
+        :param options: The options object to pass to request
+        :type options: dict
+        :param config: the request configuration object
+        :type config: dict
+        :raises CircuitOpenException: the upstream's circuit is open
+        :raises BulkheadFullException: the upstream's bulkhead is full
+        :return: the response with its body unread
+        :rtype: aiohttp.ClientResponse
+        """
+        breaker = AioHttpClient.get_circuit_breaker(url)
+        if not breaker.allow_request():
+            logger.error(f"Circuit open for {breaker.name}, failing fast: {url}")
+            raise CircuitOpenException(breaker.name, breaker.retry_after())
+        # Bounds each read rather than the whole, arbitrarily long, stream
+        attempt_timeout = AioHttpClient.get_timeout(url, options, config)
+        timeout = ClientTimeout(
+            total=deadline.remaining(),
+            sock_connect=attempt_timeout,
+            sock_read=attempt_timeout
+        )
+        upstream = AioHttpClient.get_upstream(config)
+        async with AsyncExitStack() as stack:
+            try:
+                if upstream is not None:
+                    await stack.enter_async_context(BULKHEADS.get(upstream).slot())
+                response = await stack.enter_async_context(
+                    self._get_session().request(
+                        method=options.get('method', '').upper(),
+                        url=url,
+                        params=options.get('params', {}),
+                        headers=AioHttpClient.get_request_headers(options, config),
+                        data=options.get('data', {}),
+                        ssl=False,
+                        timeout=timeout,
+                        trace_request_ctx=tracing.new_trace_context(upstream)
+                    ))
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError):
+                breaker.record_failure()
+                raise
+            except BaseException:
+                breaker.release()
+                raise
+            record_outcome = breaker.record_failure if response.status >= 500 \
+                else breaker.record_success
+            try:
+                if response.status >= 400:
+                    body = await AioHttpClient.read_body(
+                        response, url, AioHttpClient.get_max_body_bytes(config))
+                    logger.error(f"Streaming {url} failed with status {response.status}")
+                    raise UpstreamStatusException(
+                        url, response.status, AioHttpClient.parse_response(response, body, config))
+                yield response
+            except (asyncio.TimeoutError, aiohttp.ClientPayloadError, aiohttp.ClientConnectionError):
+                record_outcome = breaker.record_failure
+                raise
+            except asyncio.CancelledError:
+                record_outcome = breaker.release
+                raise
+            finally:
+                record_outcome()
+
+    async def stream_text(self, url, request_options, request_config=None):
+        """
+        stream_text() requests url and yields its body as decoded text chunks
+        while it is read. The read stops when the caller leaves the loop.
+        Requests are attempted once, without retries, coalescing or hedging
+
+        * :param str url: The url to request
+        * :type url: str
+        * :param request_options: The options object to pass to request
+        * :type request_options: dict
+        * :param dict request_config: The request configuration object.
+        * :type request_config: dict
+        * :raises ResponseTooLargeException: the body exceeds maxBodyBytes
+        * :return: the decoded body chunks
+        * :rtype: async_generator<str>
+        """
+        request_config = {} if request_config is None else request_config
+        max_bytes = AioHttpClient.get_max_body_bytes(request_config)
+        async with self._streaming_response(url, request_options, request_config) as response:
+            try:
+                decoder = codecs.getincrementaldecoder(
+                    response.charset or 'utf-8')(errors='replace')
+            except LookupError:
+                decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            async for chunk in AioHttpClient.iter_body(response, url, max_bytes):
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+            text = decoder.decode(b'', final=True)
+            if text:
+                yield text
+
+    async def stream_json_items(self, url, request_options, request_config=None, items_key=None):
+        """
+        stream_json_items() requests url and yields the items of a JSON array
+        in its body as soon as each one is read, so callers that need only
+        some records can stop early. Requests are attempted once, without
+        retries, coalescing or hedging
+
+        Example usage:
+            ```
+            async for invoice in client.stream_json_items(url, options, items_key='invoices'):
+                if is_wanted(invoice):
+                    break
+            ```
+
+        * :param str url: The url to request
+        * :type url: str
+        * :param request_options: The options object to pass to request
+        * :type request_options: dict
+        * :param dict request_config: The request configuration object.
+        * :type request_config: dict
+        * :param items_key: The top-level key holding the array, None when the
+        body itself is the array
+        * :type items_key: str
+        * :raises ResponseTooLargeException: the body exceeds maxBodyBytes
+        * :raises ValueError: the body holds no such array
+        * :return: the decoded array items
+        * :rtype: async_generator
+        """
+        request_config = {} if request_config is None else request_config
+        max_bytes = AioHttpClient.get_max_body_bytes(request_config)
+        parser = JsonArrayItemParser(items_key, json_loads)
+        async with self._streaming_response(url, request_options, request_config) as response:
+            async for chunk in AioHttpClient.iter_body(response, url, max_bytes):
+                for item in parser.feed(chunk):
+                    yield item
+                if parser.done:
+                    return
+        parser.close()
 
     async def run_instance(self, url, request_options, request_config=None):
         """
@@ -241,37 +1414,122 @@ class AioHttpClient:
         * :type request_options: dict
         * :param dict request_config: The request configuration object.
         * :type request_config: dict
+        * :raises UpstreamStatusException: the response status is >= 400
         * :return: Returns a coroutine with a response object
         * :rtype: coroutine<dict>
         """
         request_config = {} if request_config is None else request_config
-        async with AioHttpClient() as instance:
-            data = await instance._http_request(url, request_options, request_config)
-            if data['status'] >= 400:
-                logger.error(data)
-                raise Exception(f'Error thrown with status: {data["status"]}. {data["data"]}')
-            return data
+        data = await self._http_request(url, request_options, request_config)
+        if data['status'] >= 400:
+            logger.error(data)
+            raise UpstreamStatusException(url, data['status'], data['data'])
+        return data
+
+    async def _timed_run_instance(self, index, request):
+        url = request['url']
+        start = time.monotonic()
+        try:
+            response = await self.run_instance(
+                url, request.get('options', {}), request.get('config'))
+            exception = None
+        except Exception as exc:
+            response = None
+            exception = exc
+        return {
+            'index': index,
+            'url': url,
+            'response': response,
+            'exception': exception,
+            'elapsedSeconds': time.monotonic() - start
+        }
+
+    async def run_many(
+            self,
+            requests,
+            max_concurrency=DEFAULT_MAX_CONCURRENCY,
+            return_exceptions=True
+    ):
+        """
+        run_many() runs a batch of requests through run_instance, at most
+        max_concurrency at a time, and yields their results as they complete.
+        Requests are started lazily, so a large batch never has more than
+        max_concurrency tasks in flight, and leaving the loop early cancels
+        the requests still running
+
+        Example usage:
+            ```
+            requests = [{'url': url, 'options': {'method': 'get'}} for url in urls]
+            async for result in client.run_many(requests, max_concurrency=5):
+                responses[result['index']] = result['response']
+            ```
+
+        * :param requests: dictionaries with the 'url', 'options' and
+        optional 'config' of each request
+        * :type requests: iterable<dict>
+        * :param max_concurrency: requests allowed in flight at once
+        * :type max_concurrency: int
+        * :param return_exceptions: yield failed requests with their
+        exception instead of raising the first one
+        * :type return_exceptions: bool
+        * :return: dictionaries with the 'index' of the request in requests,
+        its 'url', 'response' and 'exception', and 'elapsedSeconds'
+        * :rtype: async_generator<dict>
+        """
+        pending_requests = enumerate(requests)
+        in_flight = set()
 
-    async def get(self, url, api_key=None):
+        def start_next() -> bool:
+            for index, request in pending_requests:
+                in_flight.add(asyncio.ensure_future(
+                    self._timed_run_instance(index, request)))
+                return True
+            return False
+
+        try:
+            while len(in_flight) < max_concurrency and start_next():
+                pass
+            while in_flight:
+                done, in_flight_left = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED)
+                in_flight.intersection_update(in_flight_left)
+                for task in done:
+                    result = task.result()
+                    if result['exception'] is not None and not return_exceptions:
+                        raise result['exception']
+                    start_next()
+                    yield result
+        finally:
+            for task in in_flight:
+                task.cancel()
+            # Cancelled requests release their bulkhead slots and connections
+            # before the caller moves on
+            await asyncio.gather(*in_flight, return_exceptions=True)
+
+    async def get(self, url, api_key=None, coalesce=False, upstream=None):
         """
         get() provides a simple way to complete standalone get requests
 
         * :param url: The url to get data from
         * :type url: str
+        * :param coalesce: Share the call with identical in-flight requests
+        * :type coalesce: bool
+        * :param upstream: The upstream called, selecting its bulkhead
+        * :type upstream: Upstreams
         * :return: Returns data retrieved from a get request to url
         * :rtype: coroutine<dict>
         """
-        async with AioHttpClient() as instance:
-            data = await instance._http_request(
-                url,
-                {
-                    'method': 'get',
-                    'headers': {
-                        'Authorization': f"Basic {api_key}"
-                    }
-                },
-                {
-                    'retries': 0
+        data = await self._http_request(
+            url,
+            {
+                'method': 'get',
+                'headers': {
+                    'Authorization': f"Basic {api_key}"
                 }
-            )
+            },
+            {
+                'retryPolicy': RetryPolicies.NO_RETRY,
+                'coalesce': coalesce,
+                'upstream': upstream
+            }
+        )
         return data.get('data')
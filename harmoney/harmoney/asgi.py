@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'harmoney.settings')
+# Serve GraphQL with the async view, on the server's event loop
+os.environ.setdefault('HARMONEY_SERVER_INTERFACE', 'asgi')
 
 application = get_asgi_application()
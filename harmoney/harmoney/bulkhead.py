@@ -0,0 +1,182 @@
+"""
+Module: bulkhead
+
+Provides the per-upstream concurrency bulkheads used by the AioHttpClient.
+
+Each upstream named in harmoney.config.Upstreams gets its own bulkhead, so
+that a slow upstream (e.g. the MEDB invoice endpoint) can only tie up its own
+share of connections and event-loop slots instead of starving the others.
+A bulkhead lets max_concurrent calls run, queues up to max_queue more for at
+most queue_timeout_seconds, and rejects everything beyond that right away
+with a BulkheadFullException.
+
+Limits are read from the HTTP_BULKHEADS Django setting:
+
+    HTTP_BULKHEADS = {
+        'umv': {
+            'max_concurrent': 20,
+            'max_queue': 50,
+            'queue_timeout_seconds': 0.5
+        },
+        ...
+    }
+"""
+
+import asyncio
+import threading
+import weakref
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from harmoney.exceptions import BulkheadFullException
+
+
+class Bulkhead:
+    """
+    Bounded concurrency with a bounded, time-limited queue for one upstream.
+    Bulkheads use asyncio primitives and belong to a single event loop.
+
+    * name (str): the upstream guarded by the bulkhead
+    * max_concurrent (int): calls allowed in flight at once
+    * max_queue (int): calls allowed to wait for a slot
+    * queue_timeout_seconds (float): how long a queued call waits for a slot
+    """
+
+    DEFAULT_MAX_CONCURRENT = 20
+    DEFAULT_MAX_QUEUE = 50
+    DEFAULT_QUEUE_TIMEOUT_SECONDS = 0.5
+
+    def __init__(
+            self,
+            name: str,
+            max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+            max_queue: int = DEFAULT_MAX_QUEUE,
+            queue_timeout_seconds: float = DEFAULT_QUEUE_TIMEOUT_SECONDS
+    ):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._active = 0
+        self._waiting = 0
+        self._accepted = 0
+        self._rejected = 0
+
+    async def _acquire(self) -> None:
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return
+        if self._waiting >= self.max_queue:
+            self._rejected += 1
+            raise BulkheadFullException(self.name, 'queue is full')
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(
+                self._semaphore.acquire(), self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            self._rejected += 1
+            raise BulkheadFullException(
+                self.name,
+                f'no slot within {self.queue_timeout_seconds} seconds'
+            ) from None
+        finally:
+            self._waiting -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Holds one of the bulkhead's slots for the duration of the block
+
+        :raises BulkheadFullException: no slot is available in time
+        """
+        await self._acquire()
+        self._active += 1
+        self._accepted += 1
+        try:
+            yield
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+
+    def snapshot(self) -> dict:
+        return {
+            'maxConcurrent': self.max_concurrent,
+            'maxQueue': self.max_queue,
+            'active': self._active,
+            'waiting': self._waiting,
+            'accepted': self._accepted,
+            'rejected': self._rejected
+        }
+
+
+class BulkheadRegistry:
+    """
+    Bulkheads keyed by upstream name, one set per event loop. Settings come
+    from the HTTP_BULKHEADS Django setting, falling back to the Bulkhead
+    defaults for upstreams it does not list.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # dict [event_loop: dict [upstream: Bulkhead]]
+        self._bulkheads = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def get_settings(name: str) -> dict:
+        """
+        :param name: the upstream name
+        :type name: str
+        :return: the Bulkhead keyword arguments configured for the upstream
+        :rtype: dict
+        """
+        try:
+            configured = getattr(settings, 'HTTP_BULKHEADS', {})
+        except ImproperlyConfigured:
+            configured = {}
+        return configured.get(name, {})
+
+    def get(self, name: str) -> Bulkhead:
+        """
+        Must be called from a coroutine running on the loop the bulkhead is
+        used on
+
+        :param name: the upstream name
+        :type name: str
+        :return: the upstream's bulkhead on the running event loop
+        :rtype: Bulkhead
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            bulkheads = self._bulkheads.setdefault(loop, {})
+            bulkhead = bulkheads.get(name)
+            if bulkhead is None:
+                bulkhead = Bulkhead(name, **BulkheadRegistry.get_settings(name))
+                bulkheads[name] = bulkhead
+            return bulkhead
+
+    def snapshot(self) -> dict:
+        """
+        :return: dict [upstream: counters] summed over all event loops
+        :rtype: dict
+        """
+        with self._lock:
+            bulkheads = [
+                bulkhead
+                for per_loop in self._bulkheads.values()
+                for bulkhead in per_loop.values()
+            ]
+        result = {}
+        for bulkhead in bulkheads:
+            snapshot = bulkhead.snapshot()
+            if bulkhead.name not in result:
+                result[bulkhead.name] = snapshot
+                continue
+            for key in ('active', 'waiting', 'accepted', 'rejected'):
+                result[bulkhead.name][key] += snapshot[key]
+        return result
+
+
+BULKHEADS = BulkheadRegistry()
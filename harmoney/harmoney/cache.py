@@ -0,0 +1,741 @@
+"""
+Module: cache
+
+Provides thread-safe in-process caches with per-entry expiry and LRU
+eviction, for values derived from upstream calls that rarely change.
+
+Entries expire after the TTL they were stored with, so that failed lookups
+can be cached for less time than successful ones (negative caching). The
+number of entries is bounded, evicting the least recently used first. Hits,
+misses, expirations and evictions are counted for snapshot().
+
+Caches implement the CacheBackend interface, with two backends:
+
+    * 'memory': TTLCache, private to the process
+    * 'sqlite': SQLiteCache, a table in a SQLite file on local disk shared by
+    every worker process of the host, so that a value looked up by one worker
+    is served to the others, and a cold worker starts warm. Values must be
+    JSON-serializable. The file must be in a directory private to the
+    service user, and is refused unless owned by it with mode 0600.
+
+Coroutines use the a-prefixed methods (aget, aset, ...), which run the
+SQLite reads and writes on a thread pool instead of the event loop.
+
+create_cache() builds the backend a Django settings dict selects, e.g.:
+
+    PAYMENT_SYSTEM_CACHE = {
+        'backend': 'sqlite',
+        'path': '/var/lib/harmoney/cache.sqlite3',
+        'max_entries': 10000,
+        'ttl_seconds': 3600,
+        'negative_ttl_seconds': 60
+    }
+
+StaleWhileRevalidateCache wraps a TTLCache for values loaded by coroutines.
+It serves entries for up to stale_ttl seconds, and reloads entries older than
+fresh_ttl in the background while the stale value is served.
+
+Example usage:
+    ```
+    cache = create_cache('PAYMENT_SYSTEM_CACHE')
+    value = await cache.aget(key)
+    if value is MISSING:
+        value = await compute(key)
+        await cache.aset(key, value)
+    ```
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import stat
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from harmoney import deadline
+from harmoney.exceptions import DeadlineExceededException
+
+logger = logging.getLogger(__name__)
+
+# Returned by get() for keys without a live entry, so that None can be cached
+MISSING = object()
+
+
+def get_cache_settings(setting_name: str) -> dict:
+    """
+    :param setting_name: name of the Django setting holding the cache's
+    configuration
+    :type setting_name: str
+    :return: the configured values, empty when the setting is absent
+    :rtype: dict
+    """
+    try:
+        return getattr(settings, setting_name, {})
+    except ImproperlyConfigured:
+        return {}
+
+
+class CacheBackend(ABC):
+    """
+    Interface of the caches returned by create_cache(). get() returns MISSING
+    for keys without a live entry. A backend missing one of the methods
+    cannot be instantiated.
+
+    The a-prefixed coroutines wrap the methods of the same name for callers
+    on an event loop; backends doing blocking I/O run them off the loop.
+    """
+
+    @abstractmethod
+    def get(self, key):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key, value, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_negative(self, key, value) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def add(self, key, value, ttl: float) -> bool:
+        """
+        Stores a value only if the key has no live entry, e.g. to elect the
+        one process that refreshes a shared value
+
+        :return: whether the value was stored
+        :rtype: bool
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def invalidate(self, key) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def snapshot(self) -> dict:
+        raise NotImplementedError
+
+    async def _call(self, method, *args):
+        return method(*args)
+
+    async def aget(self, key):
+        return await self._call(self.get, key)
+
+    async def aset(self, key, value, ttl: Optional[float] = None) -> None:
+        await self._call(self.set, key, value, ttl)
+
+    async def aset_negative(self, key, value) -> None:
+        await self._call(self.set_negative, key, value)
+
+    async def aadd(self, key, value, ttl: float) -> bool:
+        return await self._call(self.add, key, value, ttl)
+
+    async def ainvalidate(self, key) -> bool:
+        return await self._call(self.invalidate, key)
+
+
+class TTLCache(CacheBackend):
+    """
+    Thread-safe LRU cache whose entries expire individually
+
+    * max_entries (int): the most entries kept
+    * ttl (float): seconds a value stored with set() stays fresh
+    * negative_ttl (float): seconds a value stored with set_negative() stays
+    fresh
+    """
+
+    DEFAULT_MAX_ENTRIES = 10000
+    DEFAULT_TTL_SECONDS = 300.0
+    DEFAULT_NEGATIVE_TTL_SECONDS = 30.0
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl: float = DEFAULT_TTL_SECONDS,
+                 negative_ttl: float = DEFAULT_NEGATIVE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        # OrderedDict [key: (value, expires_at, negative)]
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+        self._expirations = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @classmethod
+    def from_settings(cls, setting_name: str, **defaults) -> 'TTLCache':
+        """
+        :param setting_name: name of the Django setting sizing the cache
+        :type setting_name: str
+        :param defaults: values for the keys the setting leaves out
+        :return: a cache sized from the setting
+        :rtype: TTLCache
+        """
+        configured = {**defaults, **get_cache_settings(setting_name)}
+        return cls(
+            max_entries=configured.get('max_entries', cls.DEFAULT_MAX_ENTRIES),
+            ttl=configured.get('ttl_seconds', cls.DEFAULT_TTL_SECONDS),
+            negative_ttl=configured.get(
+                'negative_ttl_seconds', cls.DEFAULT_NEGATIVE_TTL_SECONDS)
+        )
+
+    def get(self, key):
+        """
+        :param key: the cache key
+        :return: the fresh value stored for the key, or MISSING
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return MISSING
+            value, expires_at, negative = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            if negative:
+                self._negative_hits += 1
+            else:
+                self._hits += 1
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None) -> None:
+        """
+        :param key: the cache key
+        :param value: the value to store
+        :param ttl: seconds the value stays fresh, defaults to the cache's ttl
+        :type ttl: float
+        """
+        self._store(key, value, self.ttl if ttl is None else ttl, negative=False)
+
+    def set_negative(self, key, value) -> None:
+        """
+        Stores the fallback value of a failed lookup, for negative_ttl seconds
+
+        :param key: the cache key
+        :param value: the value to serve until the lookup is retried
+        """
+        self._store(key, value, self.negative_ttl, negative=True)
+
+    def add(self, key, value, ttl: float) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                return False
+        self._store(key, value, ttl, negative=False)
+        return True
+
+    def _store(self, key, value, ttl: float, negative: bool) -> None:
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.monotonic() + ttl, negative)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key) -> bool:
+        """
+        :param key: the cache key
+        :return: whether an entry was dropped
+        :rtype: bool
+        """
+        with self._lock:
+            dropped = self._entries.pop(key, None) is not None
+            if dropped:
+                self._invalidations += 1
+            return dropped
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'negativeHits': self._negative_hits,
+                'misses': self._misses,
+                'expirations': self._expirations,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations
+            }
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache shared by the processes of a host through a SQLite file. Each cache
+    is a namespace of one table, so several caches may share a file. Entries
+    expire by wall-clock time; once more than max_entries are stored, those
+    closest to expiring are evicted. A failing database is logged and treated
+    as a miss, so that requests never fail because of the cache.
+
+    The file holds values such as access tokens, so it must sit in a
+    directory owned by the process user and writable by no one else. It is
+    created with mode 0600 and never through a symlink, and an existing file
+    is refused unless it is owned by the process user with mode 0600. The
+    async methods run their queries on a small thread pool of the cache, so
+    that a busy database never blocks the event loop.
+
+    * path (str): the SQLite file
+    * namespace (str): the name of the cache within the file
+    * max_entries (int): the most entries kept
+    * ttl (float): seconds a value stored with set() stays fresh
+    * negative_ttl (float): seconds a value stored with set_negative() stays
+    fresh
+    """
+
+    BUSY_TIMEOUT_SECONDS = 1.0
+    # Expired and excess entries are pruned every PRUNE_INTERVAL writes
+    PRUNE_INTERVAL = 100
+    # Threads running the queries of the async methods
+    MAX_WORKERS = 4
+
+    def __init__(self, path: str, namespace: str = 'default',
+                 max_entries: int = TTLCache.DEFAULT_MAX_ENTRIES,
+                 ttl: float = TTLCache.DEFAULT_TTL_SECONDS,
+                 negative_ttl: float = TTLCache.DEFAULT_NEGATIVE_TTL_SECONDS):
+        self.path = os.path.abspath(path)
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._writes = 0
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+        self._expirations = 0
+        self._invalidations = 0
+        self._errors = 0
+        self._check_file()
+
+    @classmethod
+    def from_settings(cls, setting_name: str, **defaults) -> 'SQLiteCache':
+        """
+        :param setting_name: name of the Django setting configuring the cache,
+        also its namespace
+        :type setting_name: str
+        :param defaults: values for the keys the setting leaves out
+        :return: a cache configured from the setting
+        :rtype: SQLiteCache
+        :raises ImproperlyConfigured: the setting has no path, or the file is
+        not private to the process user
+        """
+        configured = {**defaults, **get_cache_settings(setting_name)}
+        if not configured.get('path'):
+            raise ImproperlyConfigured(
+                f"{setting_name} must set the 'path' of its SQLite file, in a directory "
+                f"private to the service user")
+        return cls(
+            path=configured['path'],
+            namespace=setting_name,
+            max_entries=configured.get('max_entries', TTLCache.DEFAULT_MAX_ENTRIES),
+            ttl=configured.get('ttl_seconds', TTLCache.DEFAULT_TTL_SECONDS),
+            negative_ttl=configured.get(
+                'negative_ttl_seconds', TTLCache.DEFAULT_NEGATIVE_TTL_SECONDS)
+        )
+
+    def _check_file(self) -> None:
+        """
+        Creates the SQLite file if needed, and checks that it and its
+        directory are private to the process user
+
+        :raises ImproperlyConfigured: the directory is not owned by the
+        process user or is writable by others, or the file is a symlink, not
+        owned by the process user, or not of mode 0600
+        """
+        uid = os.getuid()
+        directory = os.path.dirname(self.path)
+        try:
+            directory_stat = os.stat(directory)
+        except OSError as exc:
+            raise ImproperlyConfigured(f"SQLite cache directory {directory} is unusable: {exc}")
+        if directory_stat.st_uid != uid or directory_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise ImproperlyConfigured(
+                f"SQLite cache directory {directory} must be owned by uid {uid} "
+                f"and not writable by group or others")
+        flags = os.O_RDWR | getattr(os, 'O_NOFOLLOW', 0)
+        try:
+            try:
+                fd = os.open(self.path, flags | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                fd = os.open(self.path, flags)
+        except OSError as exc:
+            raise ImproperlyConfigured(f"SQLite cache file {self.path} cannot be opened: {exc}")
+        try:
+            file_stat = os.fstat(fd)
+        finally:
+            os.close(fd)
+        if not stat.S_ISREG(file_stat.st_mode) or file_stat.st_uid != uid \
+                or stat.S_IMODE(file_stat.st_mode) != 0o600:
+            raise ImproperlyConfigured(
+                f"SQLite cache file {self.path} must be a regular file owned by uid {uid} "
+                f"with mode 0600")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections belong to one thread, and must not cross a fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        # mode=rw opens the checked file, and never creates a new one
+        connection = sqlite3.connect(
+            f'{Path(self.path).as_uri()}?mode=rw', uri=True,
+            timeout=SQLiteCache.BUSY_TIMEOUT_SECONDS, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache_entries ('
+            'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+            'expires_at REAL NOT NULL, negative INTEGER NOT NULL, '
+            'PRIMARY KEY (namespace, key))')
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS cache_entries_expiry '
+            'ON cache_entries (namespace, expires_at)')
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _encode_key(key) -> str:
+        return key if isinstance(key, str) else json.dumps(key)
+
+    async def _call(self, method, *args):
+        with self._lock:
+            # Executor threads do not survive a fork
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=SQLiteCache.MAX_WORKERS,
+                    thread_name_prefix=f'sqlite-cache-{self.namespace}')
+                self._executor_pid = os.getpid()
+            executor = self._executor
+        return await asyncio.get_running_loop().run_in_executor(executor, method, *args)
+
+    def _failed(self, exc: Exception) -> None:
+        with self._lock:
+            self._errors += 1
+        logger.error(f"SQLite cache {self.namespace} at {self.path} failed: {exc}")
+
+    def get(self, key):
+        """
+        :param key: the cache key, a string or a JSON-serializable tuple
+        :return: the fresh value stored for the key, or MISSING
+        """
+        now = time.time()
+        try:
+            row = self._connection().execute(
+                'SELECT value, expires_at, negative FROM cache_entries '
+                'WHERE namespace = ? AND key = ?',
+                (self.namespace, SQLiteCache._encode_key(key))).fetchone()
+        except sqlite3.Error as exc:
+            self._failed(exc)
+            return MISSING
+        with self._lock:
+            if row is None or row[1] <= now:
+                self._misses += 1
+                if row is not None:
+                    self._expirations += 1
+                return MISSING
+            if row[2]:
+                self._negative_hits += 1
+            else:
+                self._hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl: Optional[float] = None) -> None:
+        self._store(key, value, self.ttl if ttl is None else ttl, negative=False)
+
+    def set_negative(self, key, value) -> None:
+        self._store(key, value, self.negative_ttl, negative=True)
+
+    def _store(self, key, value, ttl: float, negative: bool) -> None:
+        if ttl <= 0:
+            return
+        try:
+            self._connection().execute(
+                'INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?, ?)',
+                (self.namespace, SQLiteCache._encode_key(key), json.dumps(value),
+                 time.time() + ttl, int(negative)))
+        except sqlite3.Error as exc:
+            self._failed(exc)
+            return
+        self._wrote()
+
+    def add(self, key, value, ttl: float) -> bool:
+        now = time.time()
+        try:
+            cursor = self._connection().execute(
+                'INSERT INTO cache_entries VALUES (?, ?, ?, ?, 0) '
+                'ON CONFLICT (namespace, key) DO UPDATE SET '
+                'value = excluded.value, expires_at = excluded.expires_at, negative = 0 '
+                'WHERE cache_entries.expires_at <= ?',
+                (self.namespace, SQLiteCache._encode_key(key), json.dumps(value),
+                 now + ttl, now))
+        except sqlite3.Error as exc:
+            self._failed(exc)
+            return False
+        self._wrote()
+        return cursor.rowcount == 1
+
+    def _wrote(self) -> None:
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % SQLiteCache.PRUNE_INTERVAL == 0
+        if prune:
+            self.prune()
+
+    def prune(self) -> None:
+        """
+        Deletes the expired entries of the cache, then the entries closest to
+        expiring beyond max_entries
+        """
+        try:
+            connection = self._connection()
+            connection.execute(
+                'DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?',
+                (self.namespace, time.time()))
+            connection.execute(
+                'DELETE FROM cache_entries WHERE namespace = ? AND key IN ('
+                'SELECT key FROM cache_entries WHERE namespace = ? '
+                'ORDER BY expires_at DESC LIMIT -1 OFFSET ?)',
+                (self.namespace, self.namespace, self.max_entries))
+        except sqlite3.Error as exc:
+            self._failed(exc)
+
+    def invalidate(self, key) -> bool:
+        try:
+            cursor = self._connection().execute(
+                'DELETE FROM cache_entries WHERE namespace = ? AND key = ?',
+                (self.namespace, SQLiteCache._encode_key(key)))
+        except sqlite3.Error as exc:
+            self._failed(exc)
+            return False
+        dropped = cursor.rowcount > 0
+        if dropped:
+            with self._lock:
+                self._invalidations += 1
+        return dropped
+
+    def clear(self) -> None:
+        try:
+            self._connection().execute(
+                'DELETE FROM cache_entries WHERE namespace = ?', (self.namespace,))
+        except sqlite3.Error as exc:
+            self._failed(exc)
+
+    def snapshot(self) -> dict:
+        """
+        :return: the entries of the shared cache, and the hits, misses and
+        errors of this process
+        :rtype: dict
+        """
+        try:
+            entries = self._connection().execute(
+                'SELECT COUNT(*) FROM cache_entries WHERE namespace = ? AND expires_at > ?',
+                (self.namespace, time.time())).fetchone()[0]
+        except sqlite3.Error as exc:
+            self._failed(exc)
+            entries = None
+        with self._lock:
+            return {
+                'entries': entries,
+                'hits': self._hits,
+                'negativeHits': self._negative_hits,
+                'misses': self._misses,
+                'expirations': self._expirations,
+                'invalidations': self._invalidations,
+                'errors': self._errors
+            }
+
+
+# dict [backend setting: CacheBackend class]
+CACHE_BACKENDS = {
+    'memory': TTLCache,
+    'sqlite': SQLiteCache
+}
+
+
+def create_cache(setting_name: str, **defaults) -> CacheBackend:
+    """
+    :param setting_name: name of the Django setting configuring the cache,
+    whose 'backend' key selects one of CACHE_BACKENDS ('memory' by default)
+    :type setting_name: str
+    :param defaults: values for the keys the setting leaves out
+    :return: the configured cache
+    :rtype: CacheBackend
+    :raises ImproperlyConfigured: the backend is unknown
+    """
+    backend = {**defaults, **get_cache_settings(setting_name)}.get('backend', 'memory')
+    cache_class = CACHE_BACKENDS.get(backend)
+    if cache_class is None:
+        raise ImproperlyConfigured(
+            f"{setting_name} backend must be one of {sorted(CACHE_BACKENDS)}, not {backend!r}")
+    return cache_class.from_settings(setting_name, **defaults)
+
+
+class StaleWhileRevalidateCache:
+    """
+    Cache of values loaded by coroutines, served stale while they are
+    reloaded in the background. Concurrent loads of a key on the same event
+    loop share one task, which runs outside any request deadline; each
+    caller waits for it until its own deadline.
+
+    * max_entries (int): the most entries kept
+    * fresh_ttl (float): seconds a value is served without reloading it
+    * stale_ttl (float): seconds a value may be served at all, reloaded in the
+    background once older than fresh_ttl
+    """
+
+    DEFAULT_FRESH_TTL_SECONDS = 60.0
+    DEFAULT_STALE_TTL_SECONDS = 600.0
+
+    def __init__(self, max_entries: int = TTLCache.DEFAULT_MAX_ENTRIES,
+                 fresh_ttl: float = DEFAULT_FRESH_TTL_SECONDS,
+                 stale_ttl: float = DEFAULT_STALE_TTL_SECONDS):
+        self.fresh_ttl = fresh_ttl
+        # dict [key: (value, loaded_at)]
+        self._cache = TTLCache(max_entries=max_entries, ttl=max(stale_ttl, fresh_ttl))
+        self._lock = threading.Lock()
+        # dict [key: asyncio.Task]
+        self._loading = {}
+        self._stale_served = 0
+        self._refreshes = 0
+        self._refresh_failures = 0
+
+    @classmethod
+    def from_settings(cls, setting_name: str, **defaults) -> 'StaleWhileRevalidateCache':
+        """
+        :param setting_name: name of the Django setting sizing the cache, with
+        max_entries, fresh_ttl_seconds and stale_ttl_seconds keys
+        :type setting_name: str
+        :param defaults: values for the keys the setting leaves out
+        :return: a cache sized from the setting
+        :rtype: StaleWhileRevalidateCache
+        """
+        configured = {**defaults, **get_cache_settings(setting_name)}
+        return cls(
+            max_entries=configured.get('max_entries', TTLCache.DEFAULT_MAX_ENTRIES),
+            fresh_ttl=configured.get('fresh_ttl_seconds', cls.DEFAULT_FRESH_TTL_SECONDS),
+            stale_ttl=configured.get('stale_ttl_seconds', cls.DEFAULT_STALE_TTL_SECONDS)
+        )
+
+    async def get(self, key, load):
+        """
+        :param key: the cache key
+        :param load: coroutine function loading the value of the key
+        :type load: callable
+        :return: the cached value, or the value loaded when none is cached
+        :raises DeadlineExceededException: the caller's deadline passed
+        before the value was loaded
+        """
+        entry = self._cache.get(key)
+        if entry is MISSING:
+            return await StaleWhileRevalidateCache._wait(key, self._load(key, load, refresh=False))
+        value, loaded_at = entry
+        if time.monotonic() - loaded_at >= self.fresh_ttl:
+            with self._lock:
+                self._stale_served += 1
+            self._load(key, load, refresh=True)
+        return value
+
+    def _load(self, key, load, refresh: bool) -> asyncio.Task:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._loading.get(key)
+            if task is not None and task.get_loop() is loop and not task.done():
+                return task
+            # The load serves unrelated requests, so it must not run under
+            # the deadline and resolver tag of the one that started it
+            task = contextvars.Context().run(asyncio.ensure_future, self._store(key, load))
+            self._loading[key] = task
+            if refresh:
+                self._refreshes += 1
+                task.add_done_callback(lambda done: self._check_refresh(key, done))
+        return task
+
+    @staticmethod
+    async def _wait(key, task: asyncio.Task):
+        # Leaving before the load completes must not cancel it for the others
+        left = deadline.remaining()
+        if left is None:
+            return await asyncio.shield(task)
+        if left <= 0:
+            raise DeadlineExceededException(key)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), left)
+        except asyncio.TimeoutError:
+            if task.done():
+                raise
+            raise DeadlineExceededException(key)
+
+    async def _store(self, key, load):
+        try:
+            value = await load()
+        finally:
+            with self._lock:
+                # A key invalidated while loading is not stored
+                current = self._loading.get(key) is asyncio.current_task()
+                if current:
+                    del self._loading[key]
+        if current:
+            self._cache.set(key, (value, time.monotonic()))
+        return value
+
+    def _check_refresh(self, key, task: asyncio.Task) -> None:
+        exc = None if task.cancelled() else task.exception()
+        if exc is not None:
+            with self._lock:
+                self._refresh_failures += 1
+            logger.warning(f"Background reload of {key} failed, serving the stale value: {exc}")
+
+    def invalidate(self, key) -> bool:
+        """
+        :param key: the cache key
+        :return: whether an entry was dropped
+        :rtype: bool
+        """
+        with self._lock:
+            self._loading.pop(key, None)
+        return self._cache.invalidate(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._loading.clear()
+        self._cache.clear()
+
+    def snapshot(self) -> dict:
+        snapshot = self._cache.snapshot()
+        with self._lock:
+            snapshot.update({
+                'staleServed': self._stale_served,
+                'refreshes': self._refreshes,
+                'refreshFailures': self._refresh_failures
+            })
+        return snapshot
@@ -0,0 +1,237 @@
+"""
+Module: circuit_breaker
+
+Provides the per-upstream circuit breakers used by the AioHttpClient.
+
+A breaker starts closed and counts consecutive failed requests (timeouts,
+connection errors and 5xx responses) to its upstream host. A request counts
+once, when it gives up, however many attempts its retry policy made. Once
+the failure threshold is reached it opens, and every call to that host fails
+fast with a CircuitOpenException instead of waiting out its timeout and
+retries. After the cool-down the breaker turns half-open and lets a limited
+number of probe calls through: a successful probe closes it again, a failed
+one re-opens it.
+
+Breakers are process-wide and thread-safe, one per host, and are looked up
+through the CIRCUIT_BREAKERS registry. Their state is exposed for metrics
+through CIRCUIT_BREAKERS.snapshot(). Thresholds are read from the
+CIRCUIT_BREAKERS Django setting, whose 'default' entry applies to every host
+and whose other entries, keyed by host, override it:
+
+    CIRCUIT_BREAKERS = {
+        'default': {
+            'failure_threshold': 5,
+            'recovery_timeout_seconds': 30,
+            'half_open_max_calls': 1
+        },
+        'apitest.centene.com': {'failure_threshold': 10},
+        ...
+    }
+"""
+
+import threading
+import time
+from enum import Enum
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+class CircuitState(Enum):
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Closed, open and half-open circuit breaker for a single upstream host
+
+    * name (str): the upstream host guarded by the breaker
+    * failure_threshold (int): consecutive failures that open the circuit
+    * recovery_timeout_seconds (float): cool-down before probing again
+    * half_open_max_calls (int): probe calls allowed while half-open
+    """
+
+    DEFAULT_FAILURE_THRESHOLD = 5
+    DEFAULT_RECOVERY_TIMEOUT_SECONDS = 30
+    DEFAULT_HALF_OPEN_MAX_CALLS = 1
+
+    def __init__(
+            self,
+            name: str,
+            failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+            recovery_timeout_seconds: float = DEFAULT_RECOVERY_TIMEOUT_SECONDS,
+            half_open_max_calls: int = DEFAULT_HALF_OPEN_MAX_CALLS
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout_seconds = recovery_timeout_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self._lock = threading.Lock()
+        self._state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._successes = 0
+        self._failures = 0
+        self._rejections = 0
+        self._times_opened = 0
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def _refresh_state(self) -> None:
+        # Moves an open circuit to half-open once its cool-down has elapsed.
+        # Callers must hold the lock.
+        if self._state == CircuitState.OPEN and \
+                time.monotonic() - self._opened_at >= self.recovery_timeout_seconds:
+            self._state = CircuitState.HALF_OPEN
+            self._half_open_calls = 0
+
+    def _open(self) -> None:
+        self._state = CircuitState.OPEN
+        self._opened_at = time.monotonic()
+        self._half_open_calls = 0
+        self._times_opened += 1
+
+    def retry_after(self) -> float:
+        """
+        :return: seconds left before an open circuit accepts a probe
+        :rtype: float
+        """
+        with self._lock:
+            if self._state != CircuitState.OPEN:
+                return 0.0
+            elapsed = time.monotonic() - self._opened_at
+            return max(0.0, self.recovery_timeout_seconds - elapsed)
+
+    def allow_request(self) -> bool:
+        """
+        Decides whether a call may go through. Every allowed call must be
+        followed by exactly one of record_success, record_failure or release.
+
+        :return: False when the call must fail fast
+        :rtype: bool
+        """
+        with self._lock:
+            self._refresh_state()
+            if self._state == CircuitState.OPEN:
+                self._rejections += 1
+                return False
+            if self._state == CircuitState.HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    self._rejections += 1
+                    return False
+                self._half_open_calls += 1
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._successes += 1
+            self._consecutive_failures = 0
+            if self._state == CircuitState.HALF_OPEN:
+                self._state = CircuitState.CLOSED
+                self._half_open_calls = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._consecutive_failures += 1
+            if self._state == CircuitState.HALF_OPEN or (
+                    self._state == CircuitState.CLOSED and
+                    self._consecutive_failures >= self.failure_threshold):
+                self._open()
+
+    def record_retried_failure(self) -> None:
+        """
+        Ends an allowed call that failed and is retried within the same
+        request. A half-open circuit re-opens; otherwise the failure is
+        counted once, by record_failure, when the request gives up
+        """
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN:
+                self._failures += 1
+                self._open()
+
+    def release(self) -> None:
+        """
+        Ends an allowed call that neither succeeded nor failed, e.g. one that
+        was cancelled, so that a half-open probe slot is not leaked
+        """
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def snapshot(self) -> dict:
+        """
+        :return: the breaker state and counters, for metrics
+        :rtype: dict
+        """
+        retry_after = self.retry_after()
+        with self._lock:
+            self._refresh_state()
+            return {
+                'state': self._state.value,
+                'consecutiveFailures': self._consecutive_failures,
+                'failureThreshold': self.failure_threshold,
+                'recoveryTimeoutSeconds': self.recovery_timeout_seconds,
+                'retryAfterSeconds': retry_after,
+                'successes': self._successes,
+                'failures': self._failures,
+                'rejections': self._rejections,
+                'timesOpened': self._times_opened
+            }
+
+
+class CircuitBreakerRegistry:
+    """
+    Process-wide registry of circuit breakers keyed by upstream host. Settings
+    come from the CIRCUIT_BREAKERS Django setting, falling back to the
+    CircuitBreaker defaults.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    @staticmethod
+    def get_settings(host: str) -> dict:
+        """
+        :param host: the upstream host
+        :type host: str
+        :return: the CircuitBreaker keyword arguments configured for the host
+        :rtype: dict
+        """
+        try:
+            configured = getattr(settings, 'CIRCUIT_BREAKERS', {})
+        except ImproperlyConfigured:
+            configured = {}
+        return {**configured.get('default', {}), **configured.get(host, {})}
+
+    def get(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker(host, **CircuitBreakerRegistry.get_settings(host))
+                self._breakers[host] = breaker
+            return breaker
+
+    def snapshot(self) -> dict:
+        """
+        :return: dict [host: breaker snapshot]
+        :rtype: dict
+        """
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._breakers.clear()
+
+
+CIRCUIT_BREAKERS = CircuitBreakerRegistry()
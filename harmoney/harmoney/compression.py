@@ -0,0 +1,171 @@
+"""
+Module: compression
+
+Provides the content-encoding negotiation and decoding used by the
+AioHttpClient, together with per-host transfer accounting.
+
+The shared session is created with aiohttp's automatic decompression turned
+off, so that the client sees both the bytes that crossed the wire and the
+bytes they decoded to. Every request advertises the encodings configured for
+its upstream in the HTTP_ACCEPT_ENCODING Django setting, falling back to all
+the encodings this module can decode:
+
+    HTTP_ACCEPT_ENCODING = {
+        'rtr': 'gzip, deflate',
+        'softheon_identity': 'identity',
+        ...
+    }
+
+gzip and deflate are decoded with zlib. br is only advertised and decoded
+when the brotli (or brotlicffi) package is installed. Wire and decoded byte
+counts are kept per host and encoding in TRANSFER_STATS, to show where
+compression saves bandwidth and where it only costs CPU.
+"""
+
+import logging
+import threading
+import zlib
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+logger = logging.getLogger(__name__)
+
+IDENTITY = 'identity'
+SUPPORTED_ENCODINGS = ('gzip', 'deflate', 'br') if brotli is not None else ('gzip', 'deflate')
+DEFAULT_ACCEPT_ENCODING = ', '.join(SUPPORTED_ENCODINGS)
+
+
+def get_accept_encoding(upstream: Optional[str]) -> str:
+    """
+    :param upstream: the name of the request's upstream, if any
+    :type upstream: str
+    :return: the Accept-Encoding header value to send to the upstream
+    :rtype: str
+    """
+    try:
+        configured = getattr(settings, 'HTTP_ACCEPT_ENCODING', {})
+    except ImproperlyConfigured:
+        configured = {}
+    return configured.get(upstream, DEFAULT_ACCEPT_ENCODING)
+
+
+class ContentDecoder:
+    """
+    Incremental decoder of one response body for its Content-Encoding.
+    Decoded output is produced in pieces of at most max_piece_bytes, so that a
+    highly compressed chunk cannot expand all at once.
+
+    * encoding (str): the Content-Encoding of the response
+    * max_piece_bytes (int): the largest piece decompress yields at a time
+    """
+
+    def __init__(self, encoding: str, max_piece_bytes: int = 64 * 1024):
+        self.encoding = (encoding or IDENTITY).strip().lower() or IDENTITY
+        self.max_piece_bytes = max_piece_bytes
+        self._started = False
+        self._decompressor = None
+        if self.encoding == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.encoding == 'deflate':
+            self._decompressor = zlib.decompressobj()
+        elif self.encoding == 'br' and brotli is not None:
+            self._decompressor = brotli.Decompressor()
+        elif self.encoding != IDENTITY:
+            logger.warning(f"Passing through unsupported Content-Encoding {self.encoding}")
+
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        """
+        :param data: the next raw chunk of the body
+        :type data: bytes
+        :return: the decoded pieces of the chunk
+        :rtype: iterator<bytes>
+        """
+        if self._decompressor is None:
+            if data:
+                yield data
+            return
+        if self.encoding == 'br':
+            piece = self._decompressor.process(data)
+            if piece:
+                yield piece
+            return
+        if self.encoding == 'deflate' and not self._started:
+            # Servers disagree on whether deflate is zlib-wrapped or raw
+            self._started = True
+            try:
+                probe = zlib.decompressobj()
+                first = probe.decompress(data, self.max_piece_bytes)
+            except zlib.error:
+                self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            else:
+                self._decompressor = probe
+                if first:
+                    yield first
+                data = probe.unconsumed_tail
+        while data:
+            piece = self._decompressor.decompress(data, self.max_piece_bytes)
+            data = self._decompressor.unconsumed_tail
+            if piece:
+                yield piece
+
+    def flush(self) -> bytes:
+        """
+        :return: the decoded bytes still buffered at the end of the body
+        :rtype: bytes
+        """
+        if self._decompressor is None or self.encoding == 'br':
+            return b''
+        return self._decompressor.flush()
+
+
+class TransferStats:
+    """
+    Thread-safe wire and decoded byte counters, keyed by host and
+    Content-Encoding
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # dict [host: dict [encoding: [responses, wire_bytes, decoded_bytes]]]
+        self._counters = {}
+
+    def record(self, host: str, encoding: str, wire_bytes: int, decoded_bytes: int) -> None:
+        with self._lock:
+            counters = self._counters.setdefault(host, {}).setdefault(
+                encoding, [0, 0, 0])
+            counters[0] += 1
+            counters[1] += wire_bytes
+            counters[2] += decoded_bytes
+
+    def snapshot(self) -> dict:
+        """
+        :return: dict [host: dict [encoding: counters]], where ratio is the
+        share of the decoded bytes that crossed the wire
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                host: {
+                    encoding: {
+                        'responses': responses,
+                        'wireBytes': wire_bytes,
+                        'decodedBytes': decoded_bytes,
+                        'ratio': wire_bytes / decoded_bytes if decoded_bytes else None
+                    }
+                    for encoding, (responses, wire_bytes, decoded_bytes) in by_encoding.items()
+                }
+                for host, by_encoding in self._counters.items()
+            }
+
+
+TRANSFER_STATS = TransferStats()
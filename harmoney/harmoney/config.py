@@ -7,3 +7,15 @@ class BaseConfig(Enum):
 
 class Softheon(Enum):
     pass
+
+
+class Upstreams(Enum):
+    # Names of the upstream services called through the AioHttpClient,
+    # passed as the 'upstream' request config key
+    UMV = 'umv'
+    RTR = 'rtr'
+    SOFTHEON_IDENTITY = 'softheon_identity'
+    SOFTHEON_WALLET = 'softheon_wallet'
+    SOFTHEON_PAYMENT = 'softheon_payment'
+    MEDB = 'medb'
+    GROUP_API = 'group_api'
@@ -0,0 +1,71 @@
+"""
+Module: deadline
+
+Provides the request-scoped deadline shared by every upstream call made while
+serving one GraphQL request.
+
+The GraphQL view opens a deadline_scope() for each request, from the
+X-Request-Deadline-Ms header or the GRAPHQL_REQUEST_DEADLINE_SECONDS setting.
+The deadline is kept in a contextvar, so it follows the request into the
+coroutines its resolvers run. The AioHttpClient shrinks the timeout of every
+attempt to the time remaining and stops retrying once the deadline passed;
+a call that starts after it fails with a DeadlineExceededException. Fields
+whose upstream calls run out of time resolve to errors while the rest of the
+response is still returned, ahead of the gateway's own cutoff.
+
+Example usage:
+    ```
+    with deadline_scope(8):
+        result = schema.execute(query)
+    ```
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Absolute time.monotonic() value after which upstream calls stop, or None
+_DEADLINE: ContextVar[Optional[float]] = ContextVar('harmoney_deadline', default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]):
+    """
+    Sets a deadline for the duration of the block. A deadline that is already
+    set and is sooner is kept.
+
+    :param seconds: seconds from now until the deadline, None for no deadline
+    :type seconds: float
+    """
+    deadline = _DEADLINE.get()
+    if seconds is not None:
+        candidate = time.monotonic() + seconds
+        if deadline is None or candidate < deadline:
+            deadline = candidate
+    token = _DEADLINE.set(deadline)
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """
+    :return: seconds left before the current deadline, negative once it
+    passed, or None without a deadline
+    :rtype: float
+    """
+    deadline = _DEADLINE.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    """
+    :return: whether the current deadline has passed
+    :rtype: bool
+    """
+    left = remaining()
+    return left is not None and left <= 0
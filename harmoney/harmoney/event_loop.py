@@ -0,0 +1,167 @@
+"""
+Module: event_loop
+
+Provides the background event loop that sync code, such as the GraphQL view
+of threaded WSGI workers, runs its coroutines on.
+
+Every process owns one event loop, run forever by a dedicated daemon thread.
+Sync callers submit coroutines to it with run_sync(), which blocks the
+calling thread until the coroutine completes or its timeout passes, while
+other threads keep submitting their own. Since the AioHttpClient keeps one
+ClientSession per event loop, every WSGI thread shares the pooled
+connections of that loop. Under ASGI, coroutines run on the server's event
+loop instead (see harmoney.views.AsyncGraphQLView).
+
+The caller's contextvars, such as the request deadline, follow the coroutine
+onto the loop. The loop thread is started on first use, and again in a
+process forked after it started.
+
+Example usage:
+    ```
+    member = run_sync(logic_resolve_member(member_id), timeout=5)
+    ```
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import logging
+import os
+import threading
+from typing import Optional
+
+from harmoney import deadline
+from harmoney.aiohttp_client import close_shared_session
+from harmoney.exceptions import EventLoopTimeoutException
+
+logger = logging.getLogger(__name__)
+
+
+class EventLoopBridge:
+    """
+    An event loop run by a background thread, accepting coroutines from any
+    other thread
+
+    * default_timeout (float): seconds run() waits for a coroutine when no
+    timeout is given and no request deadline is set
+    * deadline_grace (float): seconds run() waits past the request deadline,
+    for the calls it cut short to unwind
+    """
+
+    DEFAULT_TIMEOUT_SECONDS = 30.0
+    DEADLINE_GRACE_SECONDS = 0.5
+    SHUTDOWN_TIMEOUT_SECONDS = 5.0
+
+    def __init__(self, default_timeout: float = DEFAULT_TIMEOUT_SECONDS,
+                 deadline_grace: float = DEADLINE_GRACE_SECONDS):
+        self.default_timeout = default_timeout
+        self.deadline_grace = deadline_grace
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._pid = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """
+        :return: the running background loop, started if needed
+        :rtype: asyncio.AbstractEventLoop
+        """
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._start()
+            return self._loop
+
+    def _start(self) -> None:
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run_forever():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(started.set)
+            loop.run_forever()
+
+        self._thread = threading.Thread(
+            target=run_forever, name='harmoney-event-loop', daemon=True)
+        self._thread.start()
+        started.wait()
+        self._loop = loop
+        self._pid = os.getpid()
+
+    def get_timeout(self, timeout: Optional[float]) -> float:
+        """
+        :param timeout: the timeout requested by the caller, if any
+        :type timeout: float
+        :return: seconds to wait for a coroutine, the time left before the
+        request deadline when one is set and no timeout is given
+        :rtype: float
+        """
+        if timeout is not None:
+            return timeout
+        left = deadline.remaining()
+        if left is None:
+            return self.default_timeout
+        return max(0.0, left) + self.deadline_grace
+
+    def run(self, coroutine, timeout: Optional[float] = None):
+        """
+        Runs a coroutine on the background loop and waits for its result.
+        The coroutine is cancelled if it does not complete in time.
+
+        :param coroutine: the coroutine to run
+        :type coroutine: coroutine
+        :param timeout: seconds to wait, see get_timeout()
+        :type timeout: float
+        :return: the result of the coroutine
+        :raises EventLoopTimeoutException: the coroutine did not complete in
+        time
+        """
+        loop = self.loop
+        if threading.current_thread() is self._thread:
+            coroutine.close()
+            raise RuntimeError('run() cannot wait on the event loop from its own thread')
+        seconds = self.get_timeout(timeout)
+        future = asyncio.run_coroutine_threadsafe(coroutine, loop)
+        try:
+            return future.result(seconds)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise EventLoopTimeoutException(seconds)
+
+    def stop(self) -> None:
+        """
+        Closes the shared session of the loop, then stops the loop and its
+        thread
+        """
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None or self._pid != os.getpid():
+                return
+            self._loop = self._thread = None
+        if thread.is_alive():
+            try:
+                asyncio.run_coroutine_threadsafe(close_shared_session(), loop).result(
+                    EventLoopBridge.SHUTDOWN_TIMEOUT_SECONDS)
+            except Exception as exc:
+                logger.error(exc)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(EventLoopBridge.SHUTDOWN_TIMEOUT_SECONDS)
+
+
+EVENT_LOOP_BRIDGE = EventLoopBridge()
+atexit.register(EVENT_LOOP_BRIDGE.stop)
+
+
+def run_sync(coroutine, timeout: Optional[float] = None):
+    """
+    Runs a coroutine on the process's background event loop, see
+    EventLoopBridge.run
+
+    :param coroutine: the coroutine to run
+    :type coroutine: coroutine
+    :param timeout: seconds to wait, defaults to the time left before the
+    request deadline
+    :type timeout: float
+    :return: the result of the coroutine
+    """
+    return EVENT_LOOP_BRIDGE.run(coroutine, timeout)
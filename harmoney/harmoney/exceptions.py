@@ -62,4 +62,58 @@ class InvoiceNotFoundException(Exception):
 
 class InvalidCreditCardTypeException(Exception):
     #Call when a user tries to use a credit card that does not have a cardType that we support
-    pass
\ No newline at end of file
+    pass
+
+###UPSTREAM###
+class UpstreamUnavailableException(Exception):
+    # Called when a call to an upstream service is rejected without being made
+    pass
+
+class CircuitOpenException(UpstreamUnavailableException):
+    # Called when the circuit breaker of an upstream host is open and calls to it fail fast
+    def __init__(self, host, retry_after=0.0):
+        self.host = host
+        self.retry_after = retry_after
+        super().__init__(
+            f'Upstream {host} is unavailable, retry in {retry_after:.0f} seconds')
+
+class BulkheadFullException(UpstreamUnavailableException):
+    # Called when the concurrency bulkhead of an upstream is full and a call is rejected instead of queued
+    def __init__(self, upstream, reason):
+        self.upstream = upstream
+        self.reason = reason
+        super().__init__(f'Upstream {upstream} is overloaded: {reason}')
+
+class DeadlineExceededException(UpstreamUnavailableException):
+    # Called when the deadline of the GraphQL request passes before an upstream call could complete
+    def __init__(self, url):
+        self.url = url
+        super().__init__(f'Request deadline exceeded calling {url}')
+
+class UpstreamTimeoutException(Exception):
+    # Called when an upstream call timed out and no retry was left to make
+    def __init__(self, url, reason):
+        self.url = url
+        self.reason = reason
+        super().__init__(f'Upstream call to {url} timed out: {reason}')
+
+class UpstreamStatusException(Exception):
+    # Called when an upstream answered a request with a status of 400 or more
+    def __init__(self, url, status, data):
+        self.url = url
+        self.status = status
+        self.data = data
+        super().__init__(f'Error thrown with status: {status}. {data}')
+
+class ResponseTooLargeException(Exception):
+    # Called when an upstream response body exceeds the size allowed for the request and its read is aborted
+    def __init__(self, url, max_bytes):
+        self.url = url
+        self.max_bytes = max_bytes
+        super().__init__(f'Response from {url} exceeds {max_bytes} bytes')
+
+class EventLoopTimeoutException(Exception):
+    # Called when a coroutine submitted from sync code to the background event loop does not complete in time
+    def __init__(self, seconds):
+        self.seconds = seconds
+        super().__init__(f'Coroutine did not complete within {seconds:.2f} seconds')
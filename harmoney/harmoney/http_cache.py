@@ -0,0 +1,254 @@
+"""
+Module: http_cache
+
+Provides the in-process HTTP cache used by the AioHttpClient for GET requests
+to upstreams whose data rarely changes.
+
+Responses are stored as body bytes with their status and headers, keyed like
+coalesced requests (method, url, params and a hash of the Authorization
+header), and parsed again on every hit so that callers never share mutable
+results. The cache honors the upstream's caching headers:
+
+    * Cache-Control max-age: the response is served without a request while
+    it is fresh
+    * Cache-Control no-store: the response is not stored
+    * Cache-Control no-cache, or validators without max-age: the response is
+    revalidated before every use
+    * ETag / Last-Modified: stale entries are revalidated with
+    If-None-Match / If-Modified-Since, and a 304 is served from the cache
+
+Memory is bounded by both an entry count and a total body size, evicting the
+least recently used entries first. Caching is opt-in per upstream through
+the HTTP_CACHE Django setting, so that data such as the Softheon wallet is
+always fetched fresh:
+
+    HTTP_CACHE = {
+        'upstreams': ['umv', 'group_api'],
+        'max_entries': 2000,
+        'max_bytes': 64 * 1024 * 1024
+    }
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from multidict import CIMultiDict, CIMultiDictProxy
+
+
+def parse_cache_control(value: Optional[str]) -> dict:
+    """
+    :param value: a Cache-Control header value
+    :type value: str
+    :return: dict [directive: value or True], directives lower-cased
+    :rtype: dict
+    """
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, argument = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"') if argument else True
+    return directives
+
+
+class CacheEntry:
+    """
+    A stored response. Entries expose the attributes of an aiohttp
+    ClientResponse the AioHttpClient decodes responses from.
+
+    * status (int): the status of the stored response
+    * reason (str): its status text
+    * headers (CIMultiDictProxy): its headers
+    * url (str): its url
+    * charset (str): the charset of its body, if given
+    * body (bytes): its decoded body
+    """
+
+    def __init__(self, status, reason, headers, url, charset, body: bytes):
+        self.status = status
+        self.reason = reason
+        headers = CIMultiDict(headers)
+        # The body is stored decoded
+        headers.popall('Content-Encoding', None)
+        headers.popall('Content-Length', None)
+        self.headers = CIMultiDictProxy(headers)
+        self.url = url
+        self.charset = charset
+        self.body = body
+        self.etag = self.headers.get('ETag')
+        self.last_modified = self.headers.get('Last-Modified')
+        self.max_age = 0.0
+        self.stored_at = 0.0
+        self.refresh(self.headers)
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    def refresh(self, headers) -> None:
+        """
+        Restarts the freshness lifetime of the entry, from the headers of the
+        response that stored or revalidated it
+
+        :param headers: the response headers
+        :type headers: multidict
+        """
+        directives = parse_cache_control(headers.get('Cache-Control'))
+        max_age = 0.0
+        if 'no-cache' not in directives:
+            try:
+                max_age = max(0.0, float(directives.get('max-age', 0)))
+            except (TypeError, ValueError):
+                max_age = 0.0
+        self.max_age = max_age
+        self.stored_at = time.monotonic()
+        self.etag = headers.get('ETag') or self.etag
+        self.last_modified = headers.get('Last-Modified') or self.last_modified
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() - self.stored_at < self.max_age
+
+    def conditional_headers(self) -> dict:
+        """
+        :return: the If-None-Match / If-Modified-Since headers revalidating
+        the entry
+        :rtype: dict
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    @staticmethod
+    def is_storable(status: int, headers) -> bool:
+        """
+        :param status: the response status
+        :type status: int
+        :param headers: the response headers
+        :type headers: multidict
+        :return: whether the response may be stored and reused
+        :rtype: bool
+        """
+        if status != 200:
+            return False
+        directives = parse_cache_control(headers.get('Cache-Control'))
+        if 'no-store' in directives:
+            return False
+        has_validator = bool(headers.get('ETag') or headers.get('Last-Modified'))
+        return has_validator or 'max-age' in directives
+
+
+class HttpCache:
+    """
+    Thread-safe LRU cache of CacheEntry objects, bounded by entry count and
+    total body bytes
+
+    * max_entries (int): the most entries kept
+    * max_bytes (int): the most body bytes kept, over all entries
+    """
+
+    DEFAULT_MAX_ENTRIES = 2000
+    DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._revalidated = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry: CacheEntry) -> None:
+        size = len(entry.body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous.body)
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+                self._evictions += 1
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self._hits += 1
+
+    def record_revalidated(self) -> None:
+        with self._lock:
+            self._revalidated += 1
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self._misses += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self._hits,
+                'revalidated': self._revalidated,
+                'misses': self._misses,
+                'evictions': self._evictions
+            }
+
+
+def _get_settings() -> dict:
+    try:
+        return getattr(settings, 'HTTP_CACHE', {})
+    except ImproperlyConfigured:
+        return {}
+
+
+def is_cached_upstream(upstream: Optional[str]) -> bool:
+    """
+    :param upstream: the name of the request's upstream, if any
+    :type upstream: str
+    :return: whether the upstream opted in to HTTP caching
+    :rtype: bool
+    """
+    return upstream is not None and upstream in _get_settings().get('upstreams', ())
+
+
+_HTTP_CACHE = None
+_HTTP_CACHE_LOCK = threading.Lock()
+
+
+def get_http_cache() -> HttpCache:
+    """
+    :return: the process-wide HttpCache, sized from the HTTP_CACHE setting
+    :rtype: HttpCache
+    """
+    global _HTTP_CACHE
+    with _HTTP_CACHE_LOCK:
+        if _HTTP_CACHE is None:
+            configured = _get_settings()
+            _HTTP_CACHE = HttpCache(
+                max_entries=configured.get('max_entries', HttpCache.DEFAULT_MAX_ENTRIES),
+                max_bytes=configured.get('max_bytes', HttpCache.DEFAULT_MAX_BYTES)
+            )
+        return _HTTP_CACHE
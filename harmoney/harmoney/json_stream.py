@@ -0,0 +1,153 @@
+"""
+Module: json_stream
+
+Provides an incremental parser for the items of a JSON array.
+
+JsonArrayItemParser is fed a JSON document chunk by chunk, as it is read off
+the wire, and returns every item of the target array as soon as the item is
+complete. The target array is either the document itself or the value of one
+of its top-level keys (e.g. 'data' in {"data": [...]}). Bytes of finished
+items are dropped, so memory stays bounded by the largest single item rather
+than by the whole body, and the caller can stop reading once it has the
+items it needs.
+
+Example usage:
+    ```
+    parser = JsonArrayItemParser(key='invoices')
+    async for chunk in response.content.iter_chunked(65536):
+        for item in parser.feed(chunk):
+            ...
+    ```
+"""
+
+import json
+from typing import Callable, List, Optional
+
+_QUOTE = ord('"')
+_BACKSLASH = ord('\\')
+_COLON = ord(':')
+_COMMA = ord(',')
+_OPENERS = frozenset(b'[{')
+_CLOSERS = frozenset(b']}')
+_OPEN_ARRAY = ord('[')
+
+
+class JsonArrayItemParser:
+    """
+    Incremental parser yielding the items of one JSON array. Only the
+    structure of the document is scanned, items themselves are decoded with
+    the given loads function once complete.
+
+    * key (str): top-level key holding the array, None when the document
+    itself is the array
+    * loads (callable): decodes the bytes of one item
+    """
+
+    def __init__(self, key: Optional[str] = None, loads: Callable = json.loads):
+        self._key = None if key is None else key.encode('utf-8')
+        self._loads = loads
+        self._buffer = bytearray()
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._current_key = None
+        self._array_depth = None
+        self._item_start = None
+        self.done = False
+
+    def feed(self, data: bytes) -> List:
+        """
+        :param data: the next chunk of the document
+        :type data: bytes
+        :return: the items completed by this chunk, in document order
+        :rtype: list
+        """
+        if self.done:
+            return []
+        self._buffer.extend(data)
+        items = []
+        buffer = self._buffer
+        end = len(buffer)
+        pos = self._pos
+        while pos < end:
+            char = buffer[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == _BACKSLASH:
+                    self._escape = True
+                elif char == _QUOTE:
+                    self._in_string = False
+                    if self._string_start is not None:
+                        self._last_string = bytes(
+                            buffer[self._string_start + 1:pos])
+                        self._string_start = None
+            elif char == _QUOTE:
+                self._in_string = True
+                if self._array_depth is None and self._depth == 1:
+                    self._string_start = pos
+            elif char in _OPENERS:
+                self._depth += 1
+                if self._array_depth is None and char == _OPEN_ARRAY \
+                        and self._is_target_array():
+                    self._array_depth = self._depth
+                    self._item_start = pos + 1
+            elif char in _CLOSERS:
+                if self._depth == self._array_depth:
+                    self._emit(self._item_start, pos, items)
+                    self.done = True
+                    pos += 1
+                    break
+                self._depth -= 1
+            elif char == _COMMA:
+                if self._depth == self._array_depth:
+                    self._emit(self._item_start, pos, items)
+                    self._item_start = pos + 1
+                elif self._array_depth is None and self._depth == 1:
+                    self._current_key = None
+            elif char == _COLON and self._array_depth is None and self._depth == 1:
+                self._current_key = self._last_string
+            pos += 1
+        self._pos = pos
+        self._compact()
+        return items
+
+    def _is_target_array(self) -> bool:
+        if self._key is None:
+            return self._depth == 1
+        return self._depth == 2 and self._current_key == self._key
+
+    def _emit(self, start: int, stop: int, items: list) -> None:
+        raw = bytes(self._buffer[start:stop]).strip()
+        if raw:
+            items.append(self._loads(raw))
+
+    def _compact(self) -> None:
+        # Drops the bytes no pending item or key can still refer to
+        if self.done:
+            keep_from = len(self._buffer)
+        elif self._item_start is not None:
+            keep_from = self._item_start
+        elif self._string_start is not None:
+            keep_from = self._string_start
+        else:
+            keep_from = self._pos
+        if keep_from:
+            del self._buffer[:keep_from]
+            self._pos -= keep_from
+            if self._item_start is not None:
+                self._item_start -= keep_from
+            if self._string_start is not None:
+                self._string_start -= keep_from
+
+    def close(self) -> None:
+        """
+        Checks that the document contained the target array
+
+        :raises ValueError: the array was not found or not terminated
+        """
+        if not self.done:
+            raise ValueError('JSON array not found or truncated')
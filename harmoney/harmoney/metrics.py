@@ -0,0 +1,97 @@
+"""
+Module: metrics
+
+Provides thread-safe, in-process latency histograms.
+
+A LatencyHistogram keeps a rolling window of the most recent samples for
+percentile queries (e.g. the p95 latency of an upstream host) alongside
+lifetime count and sum totals. HistogramRegistry lazily creates one histogram
+per key, such as per upstream host.
+"""
+
+import math
+import threading
+from collections import deque
+from typing import Optional
+
+
+class LatencyHistogram:
+    """
+    Rolling window of latency samples, in seconds
+
+    * window_size (int): how many of the most recent samples percentiles are
+    computed over
+    """
+
+    DEFAULT_WINDOW_SIZE = 500
+
+    def __init__(self, window_size: int = DEFAULT_WINDOW_SIZE):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window_size)
+        self._count = 0
+        self._sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self._count += 1
+            self._sum += seconds
+
+    def sample_count(self) -> int:
+        """
+        :return: the number of samples currently in the window
+        :rtype: int
+        """
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """
+        Nearest-rank percentile over the samples in the window
+
+        :param fraction: the percentile as a fraction, e.g. 0.95
+        :type fraction: float
+        :return: the latency in seconds, or None without samples
+        :rtype: float
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = max(1, math.ceil(fraction * len(samples)))
+        return samples[min(rank, len(samples)) - 1]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            count, total = self._count, self._sum
+        return {
+            'count': count,
+            'sum': total,
+            'p50': self.percentile(0.50),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99)
+        }
+
+
+class HistogramRegistry:
+    """
+    Lazily created LatencyHistograms keyed by an arbitrary hashable key
+    """
+
+    def __init__(self, window_size: int = LatencyHistogram.DEFAULT_WINDOW_SIZE):
+        self._lock = threading.Lock()
+        self._window_size = window_size
+        self._histograms = {}
+
+    def get(self, key) -> LatencyHistogram:
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = LatencyHistogram(self._window_size)
+                self._histograms[key] = histogram
+            return histogram
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = list(self._histograms.items())
+        return {key: histogram.snapshot() for key, histogram in histograms}
@@ -0,0 +1,173 @@
+"""
+Module: retry_policy
+
+Provides the retry policies used by the AioHttpClient.
+
+A RetryPolicy decides whether a failed attempt is retried and how long to
+wait before the next one. Delays grow exponentially with full jitter, so that
+workers that failed together do not retry together, and the total time spent
+retrying is bounded by an optional max-elapsed budget. Retries happen on
+timeouts, connection errors and configurable status codes (502/503/504 by
+default), honoring the upstream's Retry-After header.
+
+Callers pick one of the named policies in RetryPolicies through the
+'retryPolicy' request config key:
+
+    config = {
+        'timeoutSeconds': 1,
+        'retryPolicy': RetryPolicies.SOFTHEON_WALLET
+    }
+"""
+
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from enum import Enum
+from typing import Optional
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, a max-elapsed budget and
+    status-aware retries.
+
+    Only idempotent methods are retried by default, a POST that timed out may
+    already have been applied upstream. Policies for endpoints where a repeat
+    is harmless (e.g. token requests) can opt in with retry_methods.
+
+    * max_retries (int): retries after the first attempt
+    * base_delay_seconds (float): ceiling of the first backoff
+    * max_delay_seconds (float): upper bound of any single backoff
+    * max_elapsed_seconds (float): total time budget for all attempts and
+    backoffs, None for no budget
+    * retry_statuses (frozenset): response statuses that are retried
+    * retry_on_connection_errors (bool): retry connection resets and refusals
+    * retry_methods (frozenset): upper-case HTTP methods that may be retried
+    * respect_retry_after (bool): wait at least as long as Retry-After asks
+    """
+
+    IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+    DEFAULT_RETRY_STATUSES = frozenset({502, 503, 504})
+
+    def __init__(
+            self,
+            max_retries: int = 3,
+            base_delay_seconds: float = 0.05,
+            max_delay_seconds: float = 2.0,
+            max_elapsed_seconds: Optional[float] = None,
+            retry_statuses=DEFAULT_RETRY_STATUSES,
+            retry_on_connection_errors: bool = True,
+            retry_methods=IDEMPOTENT_METHODS,
+            respect_retry_after: bool = True
+    ):
+        self.max_retries = max_retries
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.max_elapsed_seconds = max_elapsed_seconds
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_on_connection_errors = retry_on_connection_errors
+        self.retry_methods = frozenset(m.upper() for m in retry_methods)
+        self.respect_retry_after = respect_retry_after
+
+    def allows_method(self, method: str) -> bool:
+        """
+        :param method: the HTTP method of the request
+        :type method: str
+        :return: whether requests with this method may be retried at all
+        :rtype: bool
+        """
+        return (method or '').upper() in self.retry_methods
+
+    def should_retry_status(self, status) -> bool:
+        """
+        :param status: the HTTP status of a completed attempt
+        :type status: int
+        :return: whether the status is worth another attempt
+        :rtype: bool
+        """
+        return status in self.retry_statuses
+
+    def compute_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Computes the backoff before the next attempt using full jitter: a
+        uniform draw between zero and the exponential ceiling for the attempt
+
+        :param attempt: zero-based number of the attempt that just failed
+        :type attempt: int
+        :param retry_after: seconds requested by the upstream, if any
+        :type retry_after: float
+        :return: seconds to sleep before the next attempt
+        :rtype: float
+        """
+        ceiling = min(
+            self.max_delay_seconds,
+            self.base_delay_seconds * (2 ** attempt)
+        )
+        delay = random.uniform(0, ceiling)
+        if retry_after is not None and self.respect_retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+    def has_budget(self, elapsed: float, delay: float) -> bool:
+        """
+        :param elapsed: seconds spent on the request so far
+        :type elapsed: float
+        :param delay: the backoff about to be slept
+        :type delay: float
+        :return: whether another attempt fits in the max-elapsed budget
+        :rtype: bool
+        """
+        if self.max_elapsed_seconds is None:
+            return True
+        return elapsed + delay < self.max_elapsed_seconds
+
+    @staticmethod
+    def parse_retry_after(value) -> Optional[float]:
+        """
+        Parses a Retry-After header, given either as delay-seconds or as an
+        HTTP-date
+
+        :param value: the raw header value
+        :type value: str
+        :return: seconds to wait, or None when absent or unparsable
+        :rtype: float
+        """
+        if not value:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicies(Enum):
+    """
+    Named retry policies shared by the AioHttpClient callers
+    """
+    NO_RETRY = RetryPolicy(max_retries=0)
+    DEFAULT = RetryPolicy()
+    # Wallet and subscription reads, spread out so that workers do not
+    # retry against the Softheon wallet in lockstep
+    SOFTHEON_WALLET = RetryPolicy(
+        max_retries=5,
+        base_delay_seconds=0.1,
+        max_delay_seconds=1.0,
+        max_elapsed_seconds=6.0
+    )
+    # Token requests are POSTs but repeating them is harmless
+    SOFTHEON_IDENTITY = RetryPolicy(
+        max_retries=3,
+        retry_methods=RetryPolicy.IDEMPOTENT_METHODS | {'POST'}
+    )
+    GROUP_API = RetryPolicy(
+        max_retries=5,
+        base_delay_seconds=0.1,
+        max_delay_seconds=1.0,
+        max_elapsed_seconds=6.0
+    )
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -54,8 +55,17 @@ MIDDLEWARE = [
 
 GRAPHENE = {
     "SCHEMA": "harmoney.schema.schema",
+    "MIDDLEWARE": [
+        "harmoney.tracing.ResolverTracingMiddleware",
+    ],
 }
 
+# Time budget of a GraphQL request's upstream calls, kept under the gateway's
+# 10 second cutoff so that partial data is returned before it. Callers may
+# ask for less through the X-Request-Deadline-Ms header.
+
+GRAPHQL_REQUEST_DEADLINE_SECONDS = 8
+
 ROOT_URLCONF = 'harmoney.urls'
 
 TEMPLATES = [
@@ -128,3 +138,125 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Per-upstream concurrency bulkheads of the AioHttpClient, keyed by
+# harmoney.config.Upstreams values. Each upstream may run max_concurrent calls
+# and queue max_queue more for up to queue_timeout_seconds before rejecting.
+
+HTTP_BULKHEADS = {
+    'umv': {'max_concurrent': 20, 'max_queue': 50, 'queue_timeout_seconds': 0.5},
+    'rtr': {'max_concurrent': 10, 'max_queue': 20, 'queue_timeout_seconds': 0.5},
+    'softheon_identity': {'max_concurrent': 5, 'max_queue': 50, 'queue_timeout_seconds': 1.0},
+    'softheon_wallet': {'max_concurrent': 20, 'max_queue': 50, 'queue_timeout_seconds': 0.5},
+    'softheon_payment': {'max_concurrent': 10, 'max_queue': 20, 'queue_timeout_seconds': 0.5},
+    'medb': {'max_concurrent': 5, 'max_queue': 10, 'queue_timeout_seconds': 0.25},
+    'group_api': {'max_concurrent': 10, 'max_queue': 20, 'queue_timeout_seconds': 0.5},
+}
+
+# Circuit breakers of the AioHttpClient, one per upstream host. 'default'
+# applies to every host, entries keyed by host override it. A request counts
+# as one failure however many attempts its retry policy made.
+
+CIRCUIT_BREAKERS = {
+    'default': {
+        'failure_threshold': 5,
+        'recovery_timeout_seconds': 30,
+        'half_open_max_calls': 1,
+    },
+}
+
+# Adaptive timeouts of the AioHttpClient. Idempotent requests to the listed
+# upstreams (harmoney.config.Upstreams values) widen their timeoutSeconds to
+# safety_factor times the percentile latency of their route, once the route
+# has min_samples samples, clamped to [min_seconds, max_seconds].
+
+ADAPTIVE_TIMEOUTS = {
+    'upstreams': ['umv', 'group_api'],
+    'percentile': 0.99,
+    'safety_factor': 2.0,
+    'min_seconds': 0.25,
+    'max_seconds': 10,
+    'min_samples': 50,
+}
+
+# Accept-Encoding sent to each upstream by the AioHttpClient, keyed by
+# harmoney.config.Upstreams values. Upstreams not listed are offered every
+# encoding the client can decode (gzip, deflate, and br when brotli is
+# installed). Token responses are too small for compression to pay off.
+
+HTTP_ACCEPT_ENCODING = {
+    'softheon_identity': 'identity',
+}
+
+# HTTP cache of the AioHttpClient. Only GET requests to the listed upstreams
+# (harmoney.config.Upstreams values) are cached; Softheon wallet and payment
+# data must always be fetched fresh.
+
+HTTP_CACHE = {
+    'upstreams': ['umv', 'group_api'],
+    'max_entries': 2000,
+    'max_bytes': 64 * 1024 * 1024,
+}
+
+# Directory of the caches shared by the worker processes of a host through a
+# SQLite file (harmoney.cache.SQLiteCache). It must be owned by the service
+# user and writable by no one else. Without it, those caches are kept per
+# process.
+
+SHARED_CACHE_DIR = os.environ.get('HARMONEY_SHARED_CACHE_DIR')
+SHARED_CACHE_BACKEND = {
+    'backend': 'sqlite',
+    'path': os.path.join(SHARED_CACHE_DIR, 'cache.sqlite3'),
+} if SHARED_CACHE_DIR else {
+    'backend': 'memory',
+}
+
+# Payment system (embark or softheon) of members, keyed by issuer subscriber
+# ID. Lookups that fail are cached as softheon for negative_ttl_seconds.
+
+PAYMENT_SYSTEM_CACHE = {
+    **SHARED_CACHE_BACKEND,
+    'max_entries': 10000,
+    'ttl_seconds': 3600,
+    'negative_ttl_seconds': 60,
+}
+
+# Rule table deciding the payment system of members from their enrollment
+# source and plan HIOS ID (see payment.payment_system_rules). RTR is only
+# called for the members no rule decides. The file is reloaded when it
+# changes.
+
+PAYMENT_SYSTEM_RULES = {
+    'path': BASE_DIR / 'payment' / 'payment_system_rules.json',
+    'check_interval_seconds': 5,
+}
+
+# Reference IDs of members' payment profiles (Embark paymentProfileId or
+# Softheon FolderID), keyed by issuer subscriber ID and payment system.
+
+REF_ID_CACHE = {
+    **SHARED_CACHE_BACKEND,
+    'max_entries': 10000,
+    'ttl_seconds': 86400,
+}
+
+# Enriched UMV members, keyed by member ID. Entries older than
+# fresh_ttl_seconds are served while reloaded in the background, and dropped
+# after stale_ttl_seconds.
+
+ENRICHED_MEMBER_CACHE = {
+    'max_entries': 5000,
+    'fresh_ttl_seconds': 60,
+    'stale_ttl_seconds': 600,
+}
+
+# Softheon access tokens are kept for their expires_in, and fetched again in
+# the background once within refresh_ahead_seconds of expiring. With a shared
+# cache directory, the worker processes of a host share each token, and only
+# one of them refreshes it.
+
+SOFTHEON_ACCESS_TOKENS = {
+    **SHARED_CACHE_BACKEND,
+    'refresh_ahead_seconds': 300,
+    'default_lifetime_seconds': 3600,
+}
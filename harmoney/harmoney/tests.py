@@ -0,0 +1,1253 @@
+import asyncio
+import gzip
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import aclosing
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import graphene
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from harmoney import cache, circuit_breaker, deadline, token_manager, tracing
+from harmoney.adaptive_timeout import get_route_key
+from harmoney.aiohttp_client import (
+    COALESCING_STATS, HEDGE_BUDGETS, HOST_LATENCIES, ROUTE_LATENCIES, AioHttpClient, close_shared_session,
+    get_shared_session)
+from harmoney.bulkhead import Bulkhead
+from harmoney.cache import MISSING, SQLiteCache, StaleWhileRevalidateCache, TTLCache
+from harmoney.circuit_breaker import CIRCUIT_BREAKERS, CircuitBreaker, CircuitState
+from harmoney.compression import ContentDecoder
+from harmoney.deadline import deadline_scope
+from harmoney.event_loop import EventLoopBridge
+from harmoney.exceptions import BulkheadFullException, DeadlineExceededException, EventLoopTimeoutException, \
+    ResponseTooLargeException, UpstreamTimeoutException
+from harmoney.http_cache import get_http_cache
+from harmoney.json_stream import JsonArrayItemParser
+from harmoney.retry_policy import RetryPolicy
+from harmoney.token_manager import AccessTokenManager
+from harmoney.views import AsyncGraphQLView, DeadlineGraphQLView
+
+
+class FakeClock:
+    """
+    Stands in for the time module of the module under test
+    """
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class SharedSessionTests(SimpleTestCase):
+
+    @staticmethod
+    async def get_session():
+        return get_shared_session()
+
+    def test_clients_on_a_loop_share_one_session(self):
+        async def sessions():
+            async with AioHttpClient() as client:
+                bound = client.session
+            return get_shared_session(), AioHttpClient()._get_session(), bound
+
+        shared, unbound, bound = asyncio.run(sessions())
+        self.assertIs(unbound, shared)
+        self.assertIs(bound, shared)
+
+    def test_each_loop_gets_its_own_session_closed_with_the_loop(self):
+        first = asyncio.run(SharedSessionTests.get_session())
+        second = asyncio.run(SharedSessionTests.get_session())
+
+        self.assertIsNot(first, second)
+        self.assertTrue(first.closed)
+        self.assertTrue(second.closed)
+
+    def test_closed_session_is_replaced_on_next_use(self):
+        async def sessions():
+            closed = get_shared_session()
+            await close_shared_session()
+            return closed, get_shared_session()
+
+        closed, replacement = asyncio.run(sessions())
+        self.assertTrue(closed.closed)
+        self.assertIsNot(replacement, closed)
+
+
+class RetryTests(SimpleTestCase):
+
+    URL = 'http://retry.test/members'
+    POLICY = RetryPolicy(max_retries=2, base_delay_seconds=0)
+
+    def setUp(self):
+        CIRCUIT_BREAKERS.reset()
+        self.addCleanup(CIRCUIT_BREAKERS.reset)
+
+    def request(self, method: str, outcome):
+        """
+        :param method: the HTTP method of the request
+        :param outcome: the status every attempt returns, or the exception it
+        raises
+        :return: the response and the number of attempts made
+        """
+        if isinstance(outcome, int):
+            attempt = AsyncMock(return_value={'status': outcome, 'ok': outcome < 400, 'headers': [], 'data': None})
+        else:
+            attempt = AsyncMock(side_effect=outcome)
+        with patch.object(AioHttpClient, '_perform_http_request', attempt):
+            try:
+                result = asyncio.run(AioHttpClient()._http_request(
+                    RetryTests.URL, {'method': method}, {'retryPolicy': RetryTests.POLICY}))
+            except Exception as exc:
+                result = exc
+        return result, attempt.await_count
+
+    def test_policy_retries_idempotent_methods_only(self):
+        policy = RetryPolicy()
+        for method in ('get', 'HEAD', 'put', 'delete'):
+            self.assertTrue(policy.allows_method(method), method)
+        for method in ('post', 'PATCH', None):
+            self.assertFalse(policy.allows_method(method), method)
+
+    def test_get_is_retried_until_retries_are_exhausted(self):
+        result, attempts = self.request('get', 503)
+        self.assertEqual(result['status'], 503)
+        self.assertEqual(attempts, 3)
+
+    def test_post_is_not_retried(self):
+        result, attempts = self.request('post', 503)
+        self.assertEqual(result['status'], 503)
+        self.assertEqual(attempts, 1)
+
+    def test_non_retryable_status_is_returned_at_once(self):
+        result, attempts = self.request('get', 404)
+        self.assertEqual(result['status'], 404)
+        self.assertEqual(attempts, 1)
+
+    def test_timeouts_without_a_response_raise(self):
+        result, attempts = self.request('get', asyncio.TimeoutError())
+        self.assertIsInstance(result, UpstreamTimeoutException)
+        self.assertEqual(result.reason, 'retries exhausted')
+        self.assertEqual(attempts, 3)
+        result, attempts = self.request('post', asyncio.TimeoutError())
+        self.assertIsInstance(result, UpstreamTimeoutException)
+        self.assertEqual(attempts, 1)
+
+    def test_retried_request_counts_as_one_breaker_failure(self):
+        self.request('get', 503)
+        snapshot = CIRCUIT_BREAKERS.get('retry.test').snapshot()
+        self.assertEqual(snapshot['failures'], 1)
+        self.assertEqual(snapshot['state'], CircuitState.CLOSED.value)
+
+
+class CoalescingTests(SimpleTestCase):
+
+    URL = 'http://coalesce.test/members'
+
+    def setUp(self):
+        self.calls = []
+        self.release = None
+        patcher = patch.object(AioHttpClient, '_retrying_http_request', self.upstream)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def upstream(self, url, options, config):
+        self.calls.append(options)
+        await self.release.wait()
+        return {'status': 200, 'ok': True, 'headers': [], 'data': {'id': len(self.calls)}}
+
+    @staticmethod
+    def options(authorization: str = 'Basic a') -> dict:
+        return {'method': 'get', 'headers': {'Authorization': authorization}}
+
+    def test_identical_gets_share_one_upstream_call(self):
+        async def requests():
+            self.release = asyncio.Event()
+            client = AioHttpClient()
+            pending = [
+                asyncio.ensure_future(client._http_request(
+                    CoalescingTests.URL, CoalescingTests.options(), {'coalesce': True}))
+                for _ in range(3)
+            ]
+            await asyncio.sleep(0)
+            self.release.set()
+            return await asyncio.gather(*pending)
+
+        before = AioHttpClient.coalescing_stats()
+        responses = asyncio.run(requests())
+        after = COALESCING_STATS.snapshot()
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual([response['data'] for response in responses], [{'id': 1}] * 3)
+        self.assertIsNot(responses[0], responses[1])
+        self.assertEqual(after['upstreamCalls'] - before['upstreamCalls'], 1)
+        self.assertEqual(after['savedCalls'] - before['savedCalls'], 2)
+
+    def test_different_credentials_or_methods_are_not_shared(self):
+        async def requests():
+            self.release = asyncio.Event()
+            self.release.set()
+            client = AioHttpClient()
+            return await asyncio.gather(
+                client._http_request(CoalescingTests.URL, CoalescingTests.options('Basic a'), {'coalesce': True}),
+                client._http_request(CoalescingTests.URL, CoalescingTests.options('Basic b'), {'coalesce': True}),
+                client._http_request(CoalescingTests.URL, {'method': 'post'}, {'coalesce': True}),
+                client._http_request(CoalescingTests.URL, CoalescingTests.options('Basic a'), {}),
+            )
+
+        asyncio.run(requests())
+        self.assertEqual(len(self.calls), 4)
+
+    def test_cancelling_the_first_caller_does_not_cancel_the_shared_call(self):
+        async def requests():
+            self.release = asyncio.Event()
+            client = AioHttpClient()
+            leader = asyncio.ensure_future(client._http_request(
+                CoalescingTests.URL, CoalescingTests.options(), {'coalesce': True}))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(client._http_request(
+                CoalescingTests.URL, CoalescingTests.options(), {'coalesce': True}))
+            await asyncio.sleep(0)
+            leader.cancel()
+            await asyncio.sleep(0)
+            self.release.set()
+            return leader, await follower
+
+        leader, response = asyncio.run(requests())
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(response['data'], {'id': 1})
+        self.assertEqual(len(self.calls), 1)
+
+
+class HedgingTests(SimpleTestCase):
+
+    HOST = 'hedge.test'
+    URL = f'http://{HOST}/wallet'
+
+    def setUp(self):
+        HEDGE_BUDGETS.configure(HedgingTests.HOST, ratio=1.0)
+        self.attempts = []
+        self.cancelled = []
+        patcher = patch.object(AioHttpClient, '_perform_http_request', self.upstream)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def upstream(self, url, options, config):
+        attempt = len(self.attempts)
+        self.attempts.append(attempt)
+        try:
+            # The primary stalls, the hedge answers at once
+            await asyncio.sleep(0.05 if attempt == 0 else 0)
+        except asyncio.CancelledError:
+            self.cancelled.append(attempt)
+            raise
+        return {'status': 200, 'ok': True, 'headers': [], 'data': attempt}
+
+    def request(self, method: str = 'get') -> dict:
+        return asyncio.run(AioHttpClient()._http_request(
+            HedgingTests.URL, {'method': method}, {'hedge': True, 'hedgeDelaySeconds': 0.01}))
+
+    def test_slow_attempt_is_hedged_and_the_first_response_wins(self):
+        response = self.request()
+
+        self.assertEqual(response['data'], 1)
+        self.assertEqual(self.cancelled, [0])
+        self.assertEqual(AioHttpClient.hedging_stats()[HedgingTests.HOST]['hedges'], 1)
+
+    def test_no_hedge_is_sent_without_budget(self):
+        HEDGE_BUDGETS.configure(HedgingTests.HOST, ratio=0.5)
+        response = self.request()
+
+        self.assertEqual(response['data'], 0)
+        self.assertEqual(self.attempts, [0])
+        self.assertEqual(AioHttpClient.hedging_stats()[HedgingTests.HOST]['denied'], 1)
+
+    def test_post_is_never_hedged(self):
+        response = self.request('post')
+
+        self.assertEqual(response['data'], 0)
+        self.assertEqual(self.attempts, [0])
+
+    def test_hedge_delay_is_the_host_p95_once_enough_samples_exist(self):
+        url = 'http://latency.test/wallet'
+        histogram = HOST_LATENCIES.get('latency.test')
+        for _ in range(AioHttpClient.HEDGE_MIN_SAMPLES - 1):
+            histogram.observe(0.2)
+        self.assertIsNone(AioHttpClient.get_hedge_delay(url, {}))
+        histogram.observe(1.0)
+        self.assertEqual(AioHttpClient.get_hedge_delay(url, {}), 0.2)
+        self.assertEqual(AioHttpClient.get_hedge_delay(url, {'hedgeDelaySeconds': 0.5}), 0.5)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch.object(circuit_breaker, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(
+            'upstream.test', failure_threshold=2, recovery_timeout_seconds=30, half_open_max_calls=1)
+
+    def fail(self, times: int = 1) -> None:
+        for _ in range(times):
+            self.assertTrue(self.breaker.allow_request())
+            self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.fail()
+        self.assertEqual(self.breaker.state, CircuitState.CLOSED)
+        self.fail()
+        self.assertEqual(self.breaker.state, CircuitState.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+        self.assertEqual(self.breaker.retry_after(), 30)
+
+    def test_success_resets_the_failure_count(self):
+        self.fail()
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_success()
+        self.fail()
+        self.assertEqual(self.breaker.state, CircuitState.CLOSED)
+
+    def test_half_open_after_recovery_timeout_allows_one_probe(self):
+        self.fail(2)
+        self.clock.advance(30)
+        self.assertEqual(self.breaker.state, CircuitState.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_successful_probe_closes(self):
+        self.fail(2)
+        self.clock.advance(30)
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitState.CLOSED)
+
+    def test_failed_probe_reopens(self):
+        self.fail(2)
+        self.clock.advance(30)
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_retried_failure()
+        self.assertEqual(self.breaker.state, CircuitState.OPEN)
+        self.assertEqual(self.breaker.snapshot()['timesOpened'], 2)
+
+    def test_released_probe_frees_its_slot(self):
+        self.fail(2)
+        self.clock.advance(30)
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.release()
+        self.assertTrue(self.breaker.allow_request())
+
+
+class BulkheadTests(SimpleTestCase):
+
+    @staticmethod
+    async def hold(bulkhead: Bulkhead, release: asyncio.Event) -> str:
+        async with bulkhead.slot():
+            await release.wait()
+        return 'done'
+
+    def test_calls_beyond_the_limit_queue_until_a_slot_frees(self):
+        async def calls():
+            bulkhead = Bulkhead('queue.test', max_concurrent=1, max_queue=1, queue_timeout_seconds=1)
+            release = asyncio.Event()
+            running = asyncio.ensure_future(BulkheadTests.hold(bulkhead, release))
+            await asyncio.sleep(0)
+            queued = asyncio.ensure_future(BulkheadTests.hold(bulkhead, release))
+            await asyncio.sleep(0)
+            waiting = bulkhead.snapshot()
+            release.set()
+            return waiting, await asyncio.gather(running, queued), bulkhead.snapshot()
+
+        waiting, results, done = asyncio.run(calls())
+        self.assertEqual((waiting['active'], waiting['waiting']), (1, 1))
+        self.assertEqual(results, ['done', 'done'])
+        self.assertEqual((done['active'], done['accepted'], done['rejected']), (0, 2, 0))
+
+    def test_calls_beyond_the_queue_are_rejected_at_once(self):
+        async def calls():
+            bulkhead = Bulkhead('reject.test', max_concurrent=1, max_queue=0, queue_timeout_seconds=1)
+            release = asyncio.Event()
+            running = asyncio.ensure_future(BulkheadTests.hold(bulkhead, release))
+            await asyncio.sleep(0)
+            try:
+                with self.assertRaises(BulkheadFullException):
+                    await BulkheadTests.hold(bulkhead, release)
+            finally:
+                release.set()
+                await running
+            return bulkhead.snapshot()
+
+        snapshot = asyncio.run(calls())
+        self.assertEqual((snapshot['accepted'], snapshot['rejected']), (1, 1))
+
+    def test_queued_calls_are_rejected_after_the_queue_timeout(self):
+        async def calls():
+            bulkhead = Bulkhead('timeout.test', max_concurrent=1, max_queue=1, queue_timeout_seconds=0.01)
+            release = asyncio.Event()
+            running = asyncio.ensure_future(BulkheadTests.hold(bulkhead, release))
+            await asyncio.sleep(0)
+            try:
+                with self.assertRaises(BulkheadFullException):
+                    await BulkheadTests.hold(bulkhead, release)
+            finally:
+                release.set()
+                await running
+            return bulkhead.snapshot()
+
+        snapshot = asyncio.run(calls())
+        self.assertEqual((snapshot['waiting'], snapshot['rejected']), (0, 1))
+
+
+class AdaptiveTimeoutTests(SimpleTestCase):
+
+    URL = 'http://adaptive.test/members/U123/enrollments'
+
+    def observe(self, seconds: float, samples: int = 50) -> None:
+        histogram = ROUTE_LATENCIES.get(get_route_key(AdaptiveTimeoutTests.URL, 'GET'))
+        for _ in range(samples):
+            histogram.observe(seconds)
+
+    def get_timeout(self, method: str, config: dict) -> float:
+        return AioHttpClient.get_timeout(AdaptiveTimeoutTests.URL, {'method': method}, config)
+
+    def test_route_key_folds_id_segments(self):
+        self.assertEqual(
+            get_route_key('http://adaptive.test/members/U123/enrollments?page=2', 'get'),
+            ('adaptive.test', 'GET', '/members/:id/enrollments'))
+
+    def test_timeout_widens_to_the_observed_latency(self):
+        self.observe(2.0)
+        self.assertEqual(self.get_timeout('get', {'adaptiveTimeout': True, 'timeoutSeconds': 1}), 4.0)
+
+    def test_timeout_never_goes_below_the_callers(self):
+        self.observe(2.0)
+        self.assertEqual(self.get_timeout('get', {'adaptiveTimeout': True, 'timeoutSeconds': 6}), 6)
+
+    def test_non_idempotent_and_opted_out_requests_keep_their_timeout(self):
+        self.observe(2.0)
+        self.assertEqual(self.get_timeout('post', {'adaptiveTimeout': True, 'timeoutSeconds': 1}), 1)
+        self.assertEqual(self.get_timeout('get', {'upstream': 'rtr', 'timeoutSeconds': 1}), 1)
+
+
+class DeadlineTests(SimpleTestCase):
+
+    URL = 'http://deadline.test/members'
+
+    def setUp(self):
+        CIRCUIT_BREAKERS.reset()
+        self.addCleanup(CIRCUIT_BREAKERS.reset)
+
+    @override_settings(GRAPHQL_REQUEST_DEADLINE_SECONDS=8)
+    def test_view_caps_the_header_deadline_at_the_setting(self):
+        def deadline_for(header=None):
+            headers = {} if header is None else {'HTTP_X_REQUEST_DEADLINE_MS': header}
+            return DeadlineGraphQLView.get_deadline_seconds(RequestFactory().post('/graphql/', **headers))
+
+        self.assertEqual(deadline_for('2000'), 2.0)
+        self.assertEqual(deadline_for('20000'), 8)
+        self.assertEqual(deadline_for('soon'), 8)
+        self.assertEqual(deadline_for(), 8)
+
+    def test_nested_scopes_keep_the_sooner_deadline(self):
+        self.assertIsNone(deadline.remaining())
+        with deadline_scope(5):
+            with deadline_scope(10):
+                self.assertLessEqual(deadline.remaining(), 5)
+            with deadline_scope(None):
+                self.assertLessEqual(deadline.remaining(), 5)
+        self.assertIsNone(deadline.remaining())
+
+    def test_attempt_timeout_is_cut_to_the_time_left(self):
+        with deadline_scope(0.5):
+            timeout = AioHttpClient.get_timeout(DeadlineTests.URL, {'method': 'post'}, {'timeoutSeconds': 3})
+        self.assertLessEqual(timeout, 0.5)
+        with deadline_scope(0):
+            with self.assertRaises(DeadlineExceededException):
+                AioHttpClient.get_timeout(DeadlineTests.URL, {'method': 'post'}, {'timeoutSeconds': 3})
+
+    def test_no_retry_is_started_past_the_deadline(self):
+        attempt = AsyncMock(return_value={
+            'status': 503, 'ok': False, 'headers': [('Retry-After', '5')], 'data': None})
+
+        async def request():
+            with deadline_scope(1):
+                return await AioHttpClient()._http_request(
+                    DeadlineTests.URL, {'method': 'get'}, {'retryPolicy': RetryPolicy(max_retries=2)})
+
+        with patch.object(AioHttpClient, '_perform_http_request', attempt):
+            response = asyncio.run(request())
+        self.assertEqual(response['status'], 503)
+        self.assertEqual(attempt.await_count, 1)
+
+    def test_coalesced_caller_stops_waiting_at_its_own_deadline(self):
+        release = asyncio.Event()
+        calls = []
+
+        async def upstream(client, url, options, config):
+            calls.append(deadline.remaining())
+            await release.wait()
+            return {'status': 200, 'ok': True, 'headers': [], 'data': 'member'}
+
+        async def requests():
+            client = AioHttpClient()
+            options = {'method': 'get'}
+            leader = asyncio.ensure_future(client._http_request(DeadlineTests.URL, options, {'coalesce': True}))
+            await asyncio.sleep(0)
+            with deadline_scope(0.01):
+                with self.assertRaises(DeadlineExceededException):
+                    await client._http_request(DeadlineTests.URL, options, {'coalesce': True})
+            release.set()
+            return await leader
+
+        with patch.object(AioHttpClient, '_retrying_http_request', upstream):
+            response = asyncio.run(requests())
+        self.assertEqual(response['data'], 'member')
+        self.assertEqual(calls, [None])
+
+
+class RunManyTests(SimpleTestCase):
+
+    def setUp(self):
+        self.running = 0
+        self.peak = 0
+        self.cancelled = []
+        patcher = patch.object(AioHttpClient, 'run_instance', self.run_instance)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def run_instance(self, url, options, config=None):
+        """
+        Stands in for an upstream call that takes options['delay'] seconds
+        and fails when options['fail'] is set
+        """
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(options['delay'])
+        except asyncio.CancelledError:
+            self.cancelled.append(url)
+            raise
+        finally:
+            self.running -= 1
+        if options.get('fail'):
+            raise ValueError(url)
+        return {'status': 200, 'data': url}
+
+    @staticmethod
+    def batch(*delays, fail=()) -> list:
+        return [
+            {'url': f'req-{index}', 'options': {'delay': delay, 'fail': index in fail}}
+            for index, delay in enumerate(delays)
+        ]
+
+    def test_results_are_yielded_as_they_complete_with_their_index(self):
+        async def run():
+            return [
+                result async for result in AioHttpClient().run_many(
+                    RunManyTests.batch(0.04, 0.01, 0.05, 0, fail=(2,)), max_concurrency=2)
+            ]
+
+        results = asyncio.run(run())
+
+        self.assertEqual([result['index'] for result in results], [1, 0, 3, 2])
+        self.assertEqual(results[1]['response']['data'], 'req-0')
+        self.assertIsInstance(results[3]['exception'], ValueError)
+        self.assertIsNone(results[3]['response'])
+        self.assertEqual(self.peak, 2)
+
+    def test_first_failure_is_raised_and_the_rest_cancelled(self):
+        async def run():
+            async for _ in AioHttpClient().run_many(
+                    RunManyTests.batch(0, 1, 1, fail=(0,)), return_exceptions=False):
+                pass
+
+        with self.assertRaises(ValueError):
+            asyncio.run(run())
+        self.assertEqual(sorted(self.cancelled), ['req-1', 'req-2'])
+        self.assertEqual(self.running, 0)
+
+    def test_leaving_the_loop_early_cancels_the_requests_still_running(self):
+        async def run():
+            results = AioHttpClient().run_many(RunManyTests.batch(0, 1, 1, 1), max_concurrency=3)
+            first = await results.__anext__()
+            await results.aclose()
+            # Nothing is left running once the generator is closed
+            return first, self.running
+
+        first, running = asyncio.run(run())
+        self.assertEqual(first['index'], 0)
+        self.assertEqual(running, 0)
+        self.assertEqual(sorted(self.cancelled), ['req-1', 'req-2'])
+
+
+class JsonArrayItemParserTests(SimpleTestCase):
+
+    DOCUMENT = b'{"total": 3, "invoices": [{"id": 1, "memo": "a, [b]"}, {"id": 2, "memo": "\\"c\\""}, 3]}'
+
+    def test_items_split_across_chunks_are_returned_once_complete(self):
+        parser = JsonArrayItemParser('invoices')
+        items = []
+        for start in range(0, len(JsonArrayItemParserTests.DOCUMENT), 7):
+            items.extend(parser.feed(JsonArrayItemParserTests.DOCUMENT[start:start + 7]))
+        parser.close()
+
+        self.assertEqual(items, [{'id': 1, 'memo': 'a, [b]'}, {'id': 2, 'memo': '"c"'}, 3])
+        self.assertTrue(parser.done)
+
+    def test_document_without_the_array_is_rejected(self):
+        parser = JsonArrayItemParser('payments')
+        self.assertEqual(parser.feed(JsonArrayItemParserTests.DOCUMENT), [])
+        with self.assertRaises(ValueError):
+            parser.close()
+
+
+class StreamingTests(SimpleTestCase):
+
+    INVOICES = {'invoices': [{'id': index} for index in range(100)]}
+
+    def setUp(self):
+        CIRCUIT_BREAKERS.reset()
+        self.addCleanup(CIRCUIT_BREAKERS.reset)
+
+    @staticmethod
+    async def invoices(request):
+        return web.json_response(StreamingTests.INVOICES)
+
+    @staticmethod
+    async def stalled(request):
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await response.write(b'{"invoices": [{"id": 0}, ')
+        await asyncio.sleep(1)
+        return response
+
+    @staticmethod
+    async def serve(consume):
+        """
+        Runs consume(client, base_url) against a local upstream
+
+        :return: what consume returns and the breaker snapshot of the upstream
+        """
+        app = web.Application()
+        app.router.add_get('/invoices', StreamingTests.invoices)
+        app.router.add_get('/stalled', StreamingTests.stalled)
+        async with TestServer(app) as server:
+            result = await consume(AioHttpClient(), str(server.make_url('')))
+            return result, CIRCUIT_BREAKERS.get(server.host).snapshot()
+
+    def test_json_items_are_streamed_and_leaving_early_is_a_success(self):
+        async def consume(client, base_url):
+            items = []
+            stream = client.stream_json_items(f'{base_url}/invoices', {'method': 'get'}, items_key='invoices')
+            async with aclosing(stream):
+                async for item in stream:
+                    items.append(item)
+                    if len(items) == 2:
+                        break
+            return items
+
+        items, breaker = asyncio.run(StreamingTests.serve(consume))
+        self.assertEqual(items, [{'id': 0}, {'id': 1}])
+        self.assertEqual((breaker['successes'], breaker['failures']), (1, 0))
+
+    def test_stalled_body_counts_as_a_breaker_failure(self):
+        async def consume(client, base_url):
+            items = []
+            with self.assertRaises(asyncio.TimeoutError):
+                async for item in client.stream_json_items(
+                        f'{base_url}/stalled', {'method': 'get'}, {'timeoutSeconds': 0.05},
+                        items_key='invoices'):
+                    items.append(item)
+            return items
+
+        items, breaker = asyncio.run(StreamingTests.serve(consume))
+        self.assertEqual(items, [{'id': 0}])
+        self.assertEqual((breaker['successes'], breaker['failures']), (0, 1))
+
+    def test_body_over_the_limit_is_aborted(self):
+        async def consume(client, base_url):
+            with self.assertRaises(ResponseTooLargeException):
+                await client.run_instance(f'{base_url}/invoices', {'method': 'get'}, {'maxBodyBytes': 100})
+            chunks = []
+            with self.assertRaises(ResponseTooLargeException):
+                async for chunk in client.stream_text(
+                        f'{base_url}/invoices', {'method': 'get'}, {'maxBodyBytes': 100}):
+                    chunks.append(chunk)
+            return chunks
+
+        chunks, _ = asyncio.run(StreamingTests.serve(consume))
+        self.assertEqual(chunks, [])
+
+
+class CompressionTests(SimpleTestCase):
+
+    BODY = json.dumps({'invoices': [{'id': index, 'status': 'paid'} for index in range(500)]}).encode()
+
+    def test_decoder_handles_every_deflate_flavour_in_bounded_pieces(self):
+        for encoding, compressed in (
+                ('gzip', gzip.compress(CompressionTests.BODY)),
+                ('deflate', zlib.compress(CompressionTests.BODY)),
+                ('deflate', zlib.compress(CompressionTests.BODY, wbits=-zlib.MAX_WBITS)),
+                ('identity', CompressionTests.BODY)):
+            decoder = ContentDecoder(encoding, max_piece_bytes=1024)
+            pieces = [
+                piece
+                for start in range(0, len(compressed), 100)
+                for piece in decoder.decompress(compressed[start:start + 100])
+            ]
+            pieces.append(decoder.flush())
+            self.assertEqual(b''.join(pieces), CompressionTests.BODY, encoding)
+            self.assertLessEqual(max(len(piece) for piece in pieces), 1024, encoding)
+
+    @staticmethod
+    async def serve(consume):
+        """
+        Runs consume(client, url) against a local upstream answering with a
+        gzipped body
+
+        :return: what consume returns, the Accept-Encoding headers received
+        and the gzip transfer stats of the upstream
+        """
+        accept_encodings = []
+
+        async def invoices(request):
+            accept_encodings.append(request.headers.get('Accept-Encoding'))
+            return web.Response(
+                body=gzip.compress(CompressionTests.BODY),
+                headers={'Content-Encoding': 'gzip', 'Content-Type': 'application/json'})
+
+        app = web.Application()
+        app.router.add_get('/invoices', invoices)
+        async with TestServer(app) as server:
+            result = await consume(AioHttpClient(), str(server.make_url('/invoices')))
+            stats = AioHttpClient.transfer_stats().get(server.host, {}).get('gzip')
+            return result, accept_encodings, stats
+
+    def test_wire_and_decoded_bytes_are_accounted(self):
+        async def consume(client, url):
+            before = AioHttpClient.transfer_stats().get('127.0.0.1', {}).get('gzip') or {'decodedBytes': 0}
+            response = await client.run_instance(url, {'method': 'get'})
+            return response, before
+
+        (response, before), accept_encodings, stats = asyncio.run(CompressionTests.serve(consume))
+
+        self.assertEqual(response['data'], json.loads(CompressionTests.BODY))
+        self.assertIn('gzip', accept_encodings[0])
+        self.assertEqual(stats['decodedBytes'] - before['decodedBytes'], len(CompressionTests.BODY))
+        self.assertLess(stats['ratio'], 1)
+
+    def test_upstream_accept_encoding_and_decoded_size_cap_apply(self):
+        async def consume(client, url):
+            with self.assertRaises(ResponseTooLargeException):
+                await client.run_instance(
+                    url, {'method': 'get'},
+                    {'upstream': 'softheon_identity', 'maxBodyBytes': len(CompressionTests.BODY) - 1})
+
+        _, accept_encodings, _ = asyncio.run(CompressionTests.serve(consume))
+        self.assertEqual(accept_encodings, ['identity'])
+
+
+class TracingTests(SimpleTestCase):
+
+    RESOLVER = 'TracingTests.resolver'
+
+    def test_phases_and_connection_reuse_are_tagged_with_upstream_and_resolver(self):
+        async def ok(request):
+            return web.json_response({'ok': True})
+
+        async def requests():
+            app = web.Application()
+            app.router.add_get('/ok', ok)
+            async with TestServer(app) as server:
+                client = AioHttpClient()
+                with tracing.resolver_scope(TracingTests.RESOLVER):
+                    for _ in range(2):
+                        await client.run_instance(str(server.make_url('/ok')), {'method': 'get'}, {'upstream': 'medb'})
+
+        asyncio.run(requests())
+
+        self.assertEqual(
+            AioHttpClient.connection_reuse_stats()['medb'][TracingTests.RESOLVER], {'new': 1, 'reused': 1})
+        phases = AioHttpClient.phase_timings()['medb'][TracingTests.RESOLVER]
+        self.assertEqual(phases['connect']['count'], 1)
+        self.assertEqual(phases['first_byte']['count'], 2)
+        self.assertEqual(phases['body']['count'], 2)
+
+    def test_middleware_runs_each_resolver_in_its_scope(self):
+        info = SimpleNamespace(parent_type=SimpleNamespace(name='MemberType'), field_name='wallet')
+        resolver = tracing.ResolverTracingMiddleware().resolve(
+            lambda root, info: tracing.current_resolver(), None, info)
+
+        self.assertEqual(resolver, 'MemberType.wallet')
+        self.assertIsNone(tracing.current_resolver())
+
+    def test_coalesced_call_is_not_tagged_with_the_first_callers_resolver(self):
+        async def upstream(client, url, options, config):
+            return {'status': 200, 'ok': True, 'headers': [], 'data': tracing.current_resolver()}
+
+        async def request():
+            with tracing.resolver_scope(TracingTests.RESOLVER):
+                return await AioHttpClient()._http_request(
+                    'http://tracing.test/members', {'method': 'get'}, {'coalesce': True})
+
+        with patch.object(AioHttpClient, '_retrying_http_request', upstream):
+            response = asyncio.run(request())
+        self.assertIsNone(response['data'])
+
+
+class HttpCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        get_http_cache().clear()
+        self.addCleanup(get_http_cache().clear)
+
+    @staticmethod
+    async def serve(cache_control: str):
+        """
+        Fetches a url twice, with the HTTP cache on, from a local upstream
+        answering with the given Cache-Control and an ETag
+
+        :return: the responses, the statuses the upstream answered with and
+        the change of each HTTP cache counter
+        """
+        statuses = []
+
+        async def plans(request):
+            if request.headers.get('If-None-Match') == '"v1"':
+                statuses.append(304)
+                return web.Response(status=304, headers={'ETag': '"v1"'})
+            statuses.append(200)
+            return web.json_response(
+                {'plans': ['silver', 'gold']}, headers={'ETag': '"v1"', 'Cache-Control': cache_control})
+
+        app = web.Application()
+        app.router.add_get('/plans', plans)
+        async with TestServer(app) as server:
+            client = AioHttpClient()
+            before = AioHttpClient.http_cache_stats()
+            responses = [
+                await client.run_instance(str(server.make_url('/plans')), {'method': 'get'}, {'httpCache': True})
+                for _ in range(2)
+            ]
+            after = AioHttpClient.http_cache_stats()
+        return responses, statuses, {name: after[name] - before[name] for name in after}
+
+    def test_stale_entry_is_revalidated_and_a_304_served_from_the_cache(self):
+        responses, statuses, counters = asyncio.run(HttpCacheTests.serve('no-cache'))
+
+        self.assertEqual(statuses, [200, 304])
+        self.assertEqual(responses[1]['status'], 200)
+        self.assertEqual(responses[1]['data'], {'plans': ['silver', 'gold']})
+        self.assertIsNot(responses[1]['data'], responses[0]['data'])
+        self.assertEqual((counters['misses'], counters['revalidated'], counters['hits']), (1, 1, 0))
+
+    def test_fresh_entry_is_served_without_a_request(self):
+        responses, statuses, counters = asyncio.run(HttpCacheTests.serve('max-age=60'))
+
+        self.assertEqual(statuses, [200])
+        self.assertEqual(responses[1]['data'], responses[0]['data'])
+        self.assertEqual(counters['hits'], 1)
+
+    def test_no_store_response_is_not_kept(self):
+        _, statuses, counters = asyncio.run(HttpCacheTests.serve('no-store'))
+
+        self.assertEqual(statuses, [200, 200])
+        self.assertEqual((counters['misses'], counters['entries']), (2, 0))
+
+
+class GraphQLViewTests(SimpleTestCase):
+
+    class Query(graphene.ObjectType):
+        balance = graphene.String()
+        invoices = graphene.String()
+
+        @staticmethod
+        async def resolve_balance(root, info):
+            await asyncio.sleep(0.05)
+            return tracing.current_resolver()
+
+        @staticmethod
+        async def resolve_invoices(root, info):
+            await asyncio.sleep(0.05)
+            return tracing.current_resolver()
+
+    SCHEMA = graphene.Schema(query=Query)
+    EXPECTED = {'data': {'balance': 'Query.balance', 'invoices': 'Query.invoices'}}
+
+    @staticmethod
+    def request():
+        return RequestFactory().post(
+            '/graphql/', json.dumps({'query': '{ balance invoices }'}), content_type='application/json')
+
+    @staticmethod
+    def view(view_class):
+        return view_class.as_view(
+            schema=GraphQLViewTests.SCHEMA, middleware=[tracing.ResolverTracingMiddleware()])
+
+    def test_sync_view_resolves_sibling_fields_concurrently(self):
+        view = GraphQLViewTests.view(DeadlineGraphQLView)
+        start = time.monotonic()
+        response = view(GraphQLViewTests.request())
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), GraphQLViewTests.EXPECTED)
+        self.assertLess(elapsed, 0.1)
+
+    def test_async_view_awaits_execution_on_the_running_loop(self):
+        view = GraphQLViewTests.view(AsyncGraphQLView)
+
+        async def respond():
+            start = time.monotonic()
+            response = await view(GraphQLViewTests.request())
+            return response, time.monotonic() - start
+
+        response, elapsed = asyncio.run(respond())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), GraphQLViewTests.EXPECTED)
+        self.assertLess(elapsed, 0.1)
+
+
+class EventLoopBridgeTests(SimpleTestCase):
+
+    def bridge(self, **kwargs):
+        bridge = EventLoopBridge(**kwargs)
+        self.addCleanup(bridge.stop)
+        return bridge
+
+    def test_coroutines_run_on_the_loop_thread_with_the_callers_context(self):
+        bridge = self.bridge()
+
+        async def probe():
+            return threading.current_thread(), deadline.remaining()
+
+        with deadline_scope(5):
+            thread, remaining = bridge.run(probe())
+
+        self.assertEqual(thread.name, 'harmoney-event-loop')
+        self.assertIsNot(thread, threading.current_thread())
+        self.assertGreater(remaining, 4)
+
+    def test_threads_share_the_loop_and_run_concurrently(self):
+        bridge = self.bridge()
+        loops = []
+
+        async def work():
+            await asyncio.sleep(0.1)
+            return asyncio.get_running_loop()
+
+        def call():
+            loops.append(bridge.run(work()))
+
+        threads = [threading.Thread(target=call) for _ in range(5)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(len(loops), 5)
+        self.assertEqual({id(loop) for loop in loops}, {id(bridge.loop)})
+        self.assertLess(elapsed, 0.3)
+
+    def test_timeout_cancels_the_coroutine(self):
+        bridge = self.bridge()
+        cancelled = threading.Event()
+
+        async def hang():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with self.assertRaises(EventLoopTimeoutException):
+            bridge.run(hang(), timeout=0.05)
+        self.assertTrue(cancelled.wait(1))
+
+    def test_timeout_defaults_to_the_time_left_before_the_deadline(self):
+        bridge = self.bridge(default_timeout=30, deadline_grace=0.5)
+
+        self.assertEqual(bridge.get_timeout(None), 30)
+        self.assertEqual(bridge.get_timeout(2), 2)
+        with deadline_scope(1):
+            self.assertGreater(bridge.get_timeout(None), 1.4)
+            self.assertLessEqual(bridge.get_timeout(None), 1.5)
+
+
+class TTLCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch.object(cache, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = TTLCache(max_entries=2, ttl=60, negative_ttl=5)
+
+    def test_value_expires_after_its_ttl(self):
+        self.cache.set('key', 'value')
+        self.clock.advance(59)
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.clock.advance(1)
+        self.assertIs(self.cache.get('key'), MISSING)
+
+    def test_explicit_ttl_overrides_the_default(self):
+        self.cache.set('key', 'value', ttl=10)
+        self.clock.advance(10)
+        self.assertIs(self.cache.get('key'), MISSING)
+
+    def test_negative_value_expires_after_the_negative_ttl(self):
+        self.cache.set_negative('key', None)
+        self.assertIsNone(self.cache.get('key'))
+        self.clock.advance(5)
+        self.assertIs(self.cache.get('key'), MISSING)
+        snapshot = self.cache.snapshot()
+        self.assertEqual(snapshot['negativeHits'], 1)
+        self.assertEqual(snapshot['expirations'], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertIs(self.cache.get('b'), MISSING)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.snapshot()['evictions'], 1)
+
+    def test_invalidated_entry_is_dropped(self):
+        self.cache.set('key', 'value')
+        self.assertTrue(self.cache.invalidate('key'))
+        self.assertFalse(self.cache.invalidate('key'))
+        self.assertIs(self.cache.get('key'), MISSING)
+
+    def test_add_only_stores_without_a_live_entry(self):
+        self.assertTrue(self.cache.add('lease', 1, ttl=30))
+        self.assertFalse(self.cache.add('lease', 2, ttl=30))
+        self.clock.advance(30)
+        self.assertTrue(self.cache.add('lease', 3, ttl=30))
+
+
+class StaleWhileRevalidateCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch.object(cache, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = StaleWhileRevalidateCache(max_entries=10, fresh_ttl=60, stale_ttl=600)
+
+    def loader(self, *values, delay=0.0):
+        """
+        :param values: the values, or exceptions, returned by successive loads
+        :param delay: seconds each load takes
+        :return: the load coroutine function and the list of the deadlines
+        each load saw
+        """
+        results = iter(values)
+        deadlines = []
+
+        async def load():
+            deadlines.append(deadline.remaining())
+            await asyncio.sleep(delay)
+            result = next(results)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        return load, deadlines
+
+    def test_stale_value_is_served_while_it_is_reloaded(self):
+        load, deadlines = self.loader('v1', 'v2')
+
+        async def reads():
+            first = await self.cache.get('key', load)
+            self.clock.advance(61)
+            stale = await self.cache.get('key', load)
+            await asyncio.sleep(0.01)
+            return first, stale, await self.cache.get('key', load)
+
+        self.assertEqual(asyncio.run(reads()), ('v1', 'v1', 'v2'))
+        self.assertEqual(len(deadlines), 2)
+        snapshot = self.cache.snapshot()
+        self.assertEqual((snapshot['staleServed'], snapshot['refreshes']), (1, 1))
+
+    def test_failed_reload_keeps_serving_the_stale_value(self):
+        load, _ = self.loader('v1', ConnectionError('reset'))
+
+        async def reads():
+            await self.cache.get('key', load)
+            self.clock.advance(61)
+            with self.assertLogs('harmoney.cache', 'WARNING'):
+                stale = await self.cache.get('key', load)
+                await asyncio.sleep(0.01)
+            return stale, await self.cache.get('key', load)
+
+        self.assertEqual(asyncio.run(reads()), ('v1', 'v1'))
+        self.assertEqual(self.cache.snapshot()['refreshFailures'], 1)
+
+    def test_concurrent_misses_share_one_load_outside_their_deadline(self):
+        load, deadlines = self.loader('v1', delay=0.05)
+
+        async def reads():
+            with deadline_scope(5):
+                return await asyncio.gather(*(self.cache.get('key', load) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(reads()), ['v1'] * 5)
+        self.assertEqual(deadlines, [None])
+
+    def test_caller_stops_waiting_at_its_deadline_without_cancelling_the_load(self):
+        load, _ = self.loader('v1', delay=0.1)
+
+        async def reads():
+            async def hurried():
+                with deadline_scope(0.02):
+                    return await self.cache.get('key', load)
+
+            return await asyncio.gather(hurried(), self.cache.get('key', load), return_exceptions=True)
+
+        hurried, patient = asyncio.run(reads())
+        self.assertIsInstance(hurried, DeadlineExceededException)
+        self.assertEqual(patient, 'v1')
+
+    def test_invalidated_key_is_loaded_again(self):
+        load, deadlines = self.loader('v1', 'v2')
+
+        async def reads():
+            first = await self.cache.get('key', load)
+            self.assertTrue(self.cache.invalidate('key'))
+            return first, await self.cache.get('key', load)
+
+        self.assertEqual(asyncio.run(reads()), ('v1', 'v2'))
+        self.assertEqual(len(deadlines), 2)
+
+
+class AccessTokenManagerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch.object(token_manager, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tokens = AccessTokenManager(refresh_ahead=300, default_lifetime=3600)
+        self.issued = 0
+
+    async def fetch(self):
+        self.issued += 1
+        await asyncio.sleep(0)
+        return f'token-{self.issued}', 1000
+
+    def test_concurrent_callers_share_one_fetch(self):
+        async def get_all():
+            return await asyncio.gather(
+                *(self.tokens.get('key', self.fetch) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(get_all()), ['token-1'] * 5)
+        self.assertEqual(self.issued, 1)
+        self.assertEqual(self.tokens.snapshot()['coalesced'], 4)
+
+    def test_token_is_refreshed_in_the_background_ahead_of_expiry(self):
+        async def scenario():
+            first = await self.tokens.get('key', self.fetch)
+            self.clock.advance(699)
+            unrefreshed = await self.tokens.get('key', self.fetch)
+            self.clock.advance(1)
+            # Served the current token while the refresh runs
+            refreshing = await self.tokens.get('key', self.fetch)
+            await asyncio.sleep(0.01)
+            refreshed = await self.tokens.get('key', self.fetch)
+            return first, unrefreshed, refreshing, refreshed
+
+        self.assertEqual(asyncio.run(scenario()), ('token-1', 'token-1', 'token-1', 'token-2'))
+        self.assertEqual(self.issued, 2)
+        self.assertEqual(self.tokens.snapshot()['backgroundRefreshes'], 1)
+
+    def test_expired_token_is_fetched_again(self):
+        async def scenario():
+            await self.tokens.get('key', self.fetch)
+            self.clock.advance(1000)
+            return await self.tokens.get('key', self.fetch)
+
+        self.assertEqual(asyncio.run(scenario()), 'token-2')
+
+    def test_invalidate_keeps_a_token_that_replaced_the_rejected_one(self):
+        async def scenario():
+            await self.tokens.get('key', self.fetch)
+            kept = await self.tokens.invalidate('key', 'token-0')
+            forgotten = await self.tokens.invalidate('key', 'token-1')
+            return kept, forgotten, await self.tokens.get('key', self.fetch)
+
+        self.assertEqual(asyncio.run(scenario()), (None, 'token-1', 'token-2'))
+
+    def test_workers_sharing_a_store_fetch_a_token_once(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'cache.sqlite3')
+        workers = [
+            AccessTokenManager(refresh_ahead=300, default_lifetime=3600, store=SQLiteCache(path, namespace='tokens'))
+            for _ in range(2)]
+
+        async def scenario():
+            return [await tokens.get('key', self.fetch) for tokens in workers]
+
+        self.assertEqual(asyncio.run(scenario()), ['token-1', 'token-1'])
+        self.assertEqual(self.issued, 1)
+
+
+class SQLiteCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+
+    def test_caches_on_one_file_share_their_entries(self):
+        writer = SQLiteCache(self.path, namespace='shared')
+        reader = SQLiteCache(self.path, namespace='shared')
+        other = SQLiteCache(self.path, namespace='other')
+
+        async def scenario():
+            await writer.aset(('U1', 'softheon'), {'refId': 'R1'})
+            return await reader.aget(('U1', 'softheon')), await other.aget(('U1', 'softheon'))
+
+        self.assertEqual(asyncio.run(scenario()), ({'refId': 'R1'}, MISSING))
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+
+    def test_lease_is_taken_by_one_cache_only(self):
+        first = SQLiteCache(self.path)
+        second = SQLiteCache(self.path)
+
+        self.assertTrue(first.add('lease', True, ttl=30))
+        self.assertFalse(second.add('lease', True, ttl=30))
+        first.invalidate('lease')
+        self.assertTrue(second.add('lease', True, ttl=30))
+
+    def test_file_in_a_shared_directory_is_refused(self):
+        os.chmod(self.directory, 0o777)
+        with self.assertRaises(ImproperlyConfigured):
+            SQLiteCache(self.path)
+
+    def test_file_readable_by_others_is_refused(self):
+        SQLiteCache(self.path)
+        os.chmod(self.path, 0o644)
+        with self.assertRaises(ImproperlyConfigured):
+            SQLiteCache(self.path)
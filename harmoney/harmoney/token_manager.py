@@ -0,0 +1,225 @@
+"""
+Module: token_manager
+
+Provides AccessTokenManager, which keeps OAuth access tokens for the process
+and fetches each one once, ahead of its expiry.
+
+A token is kept for the lifetime its token response reports in expires_in
+(default_lifetime when the response has none). Once it is within
+refresh_ahead seconds of expiring, the next caller still receives it, and a
+background task fetches its replacement, so that callers only ever wait on
+the token endpoint for a token they never had. Concurrent fetches of the
+same token, e.g. by every request arriving after a deploy, share one call to
+the token endpoint.
+
+Tokens are kept in a harmoney.cache backend, in-process ('memory') by
+default. With the 'sqlite' backend, the worker processes of a host share
+their tokens: a token fetched by one worker is used by all, and only the
+worker that wins a short lease refreshes a token, while the others keep
+using the current one. The file then holds live credentials, so it must be
+in a directory private to the service user (see harmoney.cache.SQLiteCache).
+
+Fetch latencies, background refreshes and failures are counted for
+snapshot(). The manager is configured from a Django settings dict, e.g.:
+
+    SOFTHEON_ACCESS_TOKENS = {
+        'backend': 'sqlite',
+        'path': '/var/lib/harmoney/cache.sqlite3',
+        'refresh_ahead_seconds': 300,
+        'default_lifetime_seconds': 3600
+    }
+
+Example usage:
+    ```
+    tokens = AccessTokenManager.from_settings('SOFTHEON_ACCESS_TOKENS')
+    token = await tokens.get((client_id, scope), lambda: fetch_token(client_id, scope))
+    ```
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from typing import Optional
+
+from harmoney.cache import MISSING, CacheBackend, TTLCache, create_cache, get_cache_settings
+from harmoney.metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+
+class AccessTokenManager:
+    """
+    Process-wide access tokens, refreshed in the background before they
+    expire
+
+    * refresh_ahead (float): seconds before expiry a token is refreshed, at
+    most half its lifetime
+    * default_lifetime (float): seconds a token lives when its response has
+    no expires_in
+    * store (CacheBackend): where the tokens are kept, in-process by default
+    """
+
+    DEFAULT_REFRESH_AHEAD_SECONDS = 300.0
+    DEFAULT_LIFETIME_SECONDS = 3600.0
+    # Seconds a process is left to refresh a token before another may
+    REFRESH_LEASE_SECONDS = 30.0
+
+    def __init__(self, refresh_ahead: float = DEFAULT_REFRESH_AHEAD_SECONDS,
+                 default_lifetime: float = DEFAULT_LIFETIME_SECONDS,
+                 store: Optional[CacheBackend] = None):
+        self.refresh_ahead = refresh_ahead
+        self.default_lifetime = default_lifetime
+        # CacheBackend [key: [token, refresh_at, expires_at]], and
+        # [('refreshing', key): lease]
+        self._store = store if store is not None else TTLCache()
+        self._lock = threading.Lock()
+        # dict [key: asyncio.Task]
+        self._fetching = {}
+        self._latency = LatencyHistogram()
+        self._fetches = 0
+        self._coalesced = 0
+        self._background_refreshes = 0
+        self._failures = 0
+
+    @classmethod
+    def from_settings(cls, setting_name: str, **defaults) -> 'AccessTokenManager':
+        """
+        :param setting_name: name of the Django setting configuring the
+        manager, with refresh_ahead_seconds and default_lifetime_seconds keys
+        and the keys of its cache backend (see harmoney.cache.create_cache)
+        :type setting_name: str
+        :param defaults: values for the keys the setting leaves out
+        :return: a manager configured from the setting
+        :rtype: AccessTokenManager
+        """
+        configured = {**defaults, **get_cache_settings(setting_name)}
+        return cls(
+            refresh_ahead=configured.get(
+                'refresh_ahead_seconds', cls.DEFAULT_REFRESH_AHEAD_SECONDS),
+            default_lifetime=configured.get(
+                'default_lifetime_seconds', cls.DEFAULT_LIFETIME_SECONDS),
+            store=create_cache(setting_name, **defaults)
+        )
+
+    async def get(self, key, fetch) -> str:
+        """
+        :param key: identifies the token, e.g. (client_id, scope)
+        :param fetch: coroutine function requesting a new token, returning
+        the token and its expires_in seconds (None when unknown)
+        :type fetch: callable
+        :return: an unexpired access token
+        :rtype: str
+        :raises Exception: whatever fetch raised, when no unexpired token is
+        kept
+        """
+        now = time.time()
+        entry = await self._store.aget(key)
+        if entry is not MISSING:
+            token, refresh_at, expires_at = entry
+            if now < expires_at:
+                if now >= refresh_at and await self._store.aadd(
+                        ('refreshing', key), True, AccessTokenManager.REFRESH_LEASE_SECONDS):
+                    self._fetch(key, fetch, background=True)
+                return token
+        return await asyncio.shield(self._fetch(key, fetch, background=False))
+
+    def _fetch(self, key, fetch, background: bool) -> asyncio.Task:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._fetching.get(key)
+            if task is not None and task.get_loop() is loop and not task.done():
+                if not background:
+                    self._coalesced += 1
+                return task
+            # A background refresh must not inherit the request's deadline
+            context = contextvars.Context() if background else contextvars.copy_context()
+            task = context.run(asyncio.ensure_future, self._fetch_and_store(key, fetch))
+            self._fetching[key] = task
+            self._fetches += 1
+            if background:
+                self._background_refreshes += 1
+            task.add_done_callback(lambda done: self._check_fetch(key, done, background))
+        return task
+
+    async def _fetch_and_store(self, key, fetch) -> str:
+        start, started_at = time.monotonic(), time.time()
+        try:
+            token, expires_in = await fetch()
+        finally:
+            self._latency.observe(time.monotonic() - start)
+            with self._lock:
+                # A token invalidated while fetching is not stored
+                current = self._fetching.get(key) is asyncio.current_task()
+                if current:
+                    del self._fetching[key]
+        if current:
+            lifetime = self.get_lifetime(expires_in)
+            expires_at = started_at + lifetime
+            refresh_at = expires_at - min(self.refresh_ahead, lifetime / 2)
+            await self._store.aset(key, [token, refresh_at, expires_at], expires_at - time.time())
+            await self._store.ainvalidate(('refreshing', key))
+        return token
+
+    def get_lifetime(self, expires_in) -> float:
+        """
+        :param expires_in: the expires_in of a token response, if any
+        :return: seconds the token is kept
+        :rtype: float
+        """
+        try:
+            lifetime = float(expires_in)
+        except (TypeError, ValueError):
+            return self.default_lifetime
+        return lifetime if lifetime > 0 else self.default_lifetime
+
+    def _check_fetch(self, key, task: asyncio.Task, background: bool) -> None:
+        exc = None if task.cancelled() else task.exception()
+        if exc is None:
+            return
+        with self._lock:
+            self._failures += 1
+        if background:
+            logger.warning(
+                f"Background refresh of access token {key} failed, keeping the current token: {exc}")
+
+    async def invalidate(self, key, token: Optional[str] = None) -> Optional[str]:
+        """
+        Forgets a token, e.g. after the upstream rejected it
+
+        :param key: identifies the token
+        :param token: the rejected token, if known. The kept token is then
+        only forgotten if it is this one, and not one another caller already
+        fetched to replace it, and a fetch in flight is left to complete
+        :type token: str
+        :return: the forgotten token, if one was kept
+        :rtype: str
+        """
+        entry = await self._store.aget(key)
+        kept = None if entry is MISSING else entry[0]
+        if token is not None and kept != token:
+            return None
+        if token is None:
+            with self._lock:
+                self._fetching.pop(key, None)
+        if kept is not None:
+            await self._store.ainvalidate(key)
+        return kept
+
+    def clear(self) -> None:
+        with self._lock:
+            self._fetching.clear()
+        self._store.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snapshot = {
+                'store': self._store.snapshot(),
+                'fetches': self._fetches,
+                'coalesced': self._coalesced,
+                'backgroundRefreshes': self._background_refreshes,
+                'failures': self._failures
+            }
+        snapshot['latency'] = self._latency.snapshot()
+        return snapshot
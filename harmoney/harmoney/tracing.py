@@ -0,0 +1,239 @@
+"""
+Module: tracing
+
+Provides per-phase timing of the upstream calls made by the AioHttpClient.
+
+The shared session carries an aiohttp TraceConfig built by
+build_trace_config(). For every request it times the phases aiohttp reports:
+
+    * pool_wait: waiting for a free connection in the pool
+    * dns: resolving the host (DNS cache misses only)
+    * connect: opening a new connection, including its TLS handshake
+    * first_byte: from the request being sent to the response headers
+    * body: reading and decoding the response body
+
+and counts whether the request opened a new connection or reused a pooled
+one. Timings are tagged with the request's upstream and with the GraphQL
+resolver it was made from, and kept as latency histograms in
+PHASE_LATENCIES.
+
+The resolver is tracked with a contextvar set by ResolverTracingMiddleware,
+which is installed through the GRAPHENE MIDDLEWARE setting.
+"""
+
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from aiohttp import TraceConfig
+
+from harmoney.metrics import HistogramRegistry
+
+UNKNOWN_UPSTREAM = 'unknown'
+NO_RESOLVER = 'none'
+
+_RESOLVER: ContextVar[Optional[str]] = ContextVar('harmoney_resolver', default=None)
+
+# dict [(upstream, resolver, phase): LatencyHistogram]
+PHASE_LATENCIES = HistogramRegistry(window_size=200)
+
+
+@contextmanager
+def resolver_scope(name: str):
+    """
+    Tags the upstream calls made within the block with a resolver name
+
+    :param name: the resolver name, e.g. 'MemberType.wallet'
+    :type name: str
+    """
+    token = _RESOLVER.set(name)
+    try:
+        yield
+    finally:
+        _RESOLVER.reset(token)
+
+
+def current_resolver() -> Optional[str]:
+    """
+    :return: the name of the resolver being run, if any
+    :rtype: str
+    """
+    return _RESOLVER.get()
+
+
+class ResolverTracingMiddleware:
+    """
+    Graphene middleware that runs every resolver inside a resolver_scope
+    named after its parent type and field. The coroutine of an async
+    resolver only runs once the executor schedules it, so it is wrapped in a
+    coroutine that enters the scope itself.
+    """
+
+    def resolve(self, next, root, info, **args):
+        name = f'{info.parent_type.name}.{info.field_name}'
+        with resolver_scope(name):
+            result = next(root, info, **args)
+        if inspect.iscoroutine(result):
+            return _scoped(name, result)
+        return result
+
+
+async def _scoped(name: str, coroutine):
+    with resolver_scope(name):
+        return await coroutine
+
+
+class ConnectionStats:
+    """
+    Thread-safe counts of new and reused connections, keyed by upstream and
+    resolver
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # dict [(upstream, resolver): [new, reused]]
+        self._counters = {}
+
+    def record(self, tags: dict, reused: bool) -> None:
+        key = (tags['upstream'], tags['resolver'])
+        with self._lock:
+            counters = self._counters.setdefault(key, [0, 0])
+            counters[1 if reused else 0] += 1
+
+    def snapshot(self) -> dict:
+        """
+        :return: dict [upstream: dict [resolver: connection counts]]
+        :rtype: dict
+        """
+        with self._lock:
+            counters = list(self._counters.items())
+        result = {}
+        for (upstream, resolver), (new, reused) in counters:
+            result.setdefault(upstream, {})[resolver] = {
+                'new': new,
+                'reused': reused
+            }
+        return result
+
+
+CONNECTION_STATS = ConnectionStats()
+
+
+def new_trace_context(upstream: Optional[str]) -> dict:
+    """
+    Creates the tags of one request, passed to aiohttp as trace_request_ctx
+
+    :param upstream: the name of the request's upstream, if any
+    :type upstream: str
+    :return: the request's tags, filled in with timestamps as it runs
+    :rtype: dict
+    """
+    return {
+        'upstream': upstream or UNKNOWN_UPSTREAM,
+        'resolver': current_resolver() or NO_RESOLVER
+    }
+
+
+def record_phase(tags: Optional[dict], phase: str, seconds: float) -> None:
+    if tags is None:
+        return
+    PHASE_LATENCIES.get((tags['upstream'], tags['resolver'], phase)).observe(seconds)
+
+
+def record_body_read(tags: Optional[dict]) -> None:
+    """
+    Records the body phase of a request once its body has been read
+
+    :param tags: the request's trace context
+    :type tags: dict
+    """
+    if tags is not None and 'responseStart' in tags:
+        record_phase(tags, 'body', time.monotonic() - tags['responseStart'])
+
+
+def phase_snapshot() -> dict:
+    """
+    :return: dict [upstream: dict [resolver: dict [phase: histogram
+    snapshot]]]
+    :rtype: dict
+    """
+    result = {}
+    for (upstream, resolver, phase), snapshot in PHASE_LATENCIES.snapshot().items():
+        result.setdefault(upstream, {}).setdefault(resolver, {})[phase] = snapshot
+    return result
+
+
+def _tags(trace_config_ctx) -> Optional[dict]:
+    return trace_config_ctx.trace_request_ctx
+
+
+def _timed_phase(phase: str):
+    # Builds the start and end handlers of a phase, timed on the trace context
+    attribute = f'{phase}_start'
+
+    async def on_start(_session, trace_config_ctx, _params):
+        setattr(trace_config_ctx, attribute, time.monotonic())
+
+    async def on_end(_session, trace_config_ctx, _params):
+        start = getattr(trace_config_ctx, attribute, None)
+        if start is not None:
+            record_phase(_tags(trace_config_ctx), phase, time.monotonic() - start)
+
+    return on_start, on_end
+
+
+async def _on_request_start(_session, trace_config_ctx, _params):
+    trace_config_ctx.request_start = time.monotonic()
+
+
+async def _on_request_headers_sent(_session, trace_config_ctx, _params):
+    trace_config_ctx.headers_sent = time.monotonic()
+
+
+async def _on_request_end(_session, trace_config_ctx, _params):
+    now = time.monotonic()
+    sent = getattr(trace_config_ctx, 'headers_sent', trace_config_ctx.request_start)
+    tags = _tags(trace_config_ctx)
+    record_phase(tags, 'first_byte', now - sent)
+    if tags is not None:
+        tags['responseStart'] = now
+
+
+async def _on_connection_create_end(_session, trace_config_ctx, _params):
+    tags = _tags(trace_config_ctx)
+    if tags is not None:
+        CONNECTION_STATS.record(tags, reused=False)
+
+
+async def _on_connection_reuseconn(_session, trace_config_ctx, _params):
+    tags = _tags(trace_config_ctx)
+    if tags is not None:
+        CONNECTION_STATS.record(tags, reused=True)
+
+
+def build_trace_config() -> TraceConfig:
+    """
+    :return: a TraceConfig recording the phase timings and connection reuse
+    of every request made with a trace context from new_trace_context()
+    :rtype: TraceConfig
+    """
+    trace_config = TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_request_headers_sent.append(_on_request_headers_sent)
+    trace_config.on_request_end.append(_on_request_end)
+    for phase, start_signal, end_signal in (
+            ('pool_wait', trace_config.on_connection_queued_start,
+             trace_config.on_connection_queued_end),
+            ('dns', trace_config.on_dns_resolvehost_start,
+             trace_config.on_dns_resolvehost_end),
+            ('connect', trace_config.on_connection_create_start,
+             trace_config.on_connection_create_end)):
+        on_start, on_end = _timed_phase(phase)
+        start_signal.append(on_start)
+        end_signal.append(on_end)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+    return trace_config
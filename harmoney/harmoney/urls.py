@@ -14,11 +14,18 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import os
+
 from django.contrib import admin
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
 from harmoney.schema import schema
-from graphene_django.views import GraphQLView
+from harmoney.views import AsyncGraphQLView, DeadlineGraphQLView
+
+if os.environ.get('HARMONEY_SERVER_INTERFACE') == 'asgi':
+    GraphQLViewClass = AsyncGraphQLView
+else:
+    GraphQLViewClass = DeadlineGraphQLView
 
 urlpatterns = [
     path(
@@ -27,7 +34,7 @@ urlpatterns = [
     path(
         'graphql/',
         csrf_exempt(
-            GraphQLView.as_view(
+            GraphQLViewClass.as_view(
                 graphiql=True,
                 schema=schema,
             )))
@@ -0,0 +1,186 @@
+"""
+Module: views
+
+Provides the GraphQL views served by the harmoney project.
+
+DeadlineGraphQLView runs every GraphQL request inside a request deadline (see
+harmoney.deadline), so that all upstream calls made by its resolvers share
+one time budget. The budget is read from the X-Request-Deadline-Ms header
+when the caller sends one, capped at the GRAPHQL_REQUEST_DEADLINE_SECONDS
+setting, which is also the default.
+
+Resolvers are coroutines, executed by graphql-core's AsyncioExecutor so that
+sibling fields (balance, invoices, creditCards, ...) wait on their upstreams
+concurrently. DeadlineGraphQLView serves threaded WSGI deployments: each
+worker thread submits the execution to the process's background event loop
+(see harmoney.event_loop) and waits for its result. AsyncGraphQLView serves
+ASGI deployments and awaits the execution on the server's own event loop.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotAllowed
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.execution import ExecutionResult
+from graphql.execution.executors.asyncio import AsyncioExecutor
+from graphql.execution.middleware import MiddlewareManager
+from promise import is_thenable
+
+from harmoney.deadline import deadline_scope
+from harmoney.event_loop import run_sync
+from harmoney.exceptions import EventLoopTimeoutException
+
+logger = logging.getLogger(__name__)
+
+
+class PromiseBackend(GraphQLCoreBackend):
+    """
+    GraphQLCoreBackend whose documents execute to a promise of their result,
+    instead of blocking until the result is complete
+    """
+
+    def __init__(self, executor=None):
+        super().__init__(executor=executor)
+        self.execute_params['return_promise'] = True
+
+
+class DeadlineGraphQLView(GraphQLView):
+    """
+    GraphQLView that bounds the total time spent on upstream calls, and
+    executes its async resolvers on the background event loop
+    """
+
+    DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+    def __init__(self, backend=None, **kwargs):
+        super().__init__(backend=backend or PromiseBackend(), **kwargs)
+
+    def dispatch(self, request, *args, **kwargs):
+        with deadline_scope(DeadlineGraphQLView.get_deadline_seconds(request)):
+            return super().dispatch(request, *args, **kwargs)
+
+    def execute_graphql_request(self, *args, **kwargs):
+        try:
+            return run_sync(self.execute_graphql_request_async(*args, **kwargs))
+        except EventLoopTimeoutException as e:
+            logger.error(e)
+            return ExecutionResult(errors=[e])
+
+    async def execute_graphql_request_async(self, *args, **kwargs):
+        """
+        Same as GraphQLView.execute_graphql_request, executing the resolvers
+        on the running event loop and awaiting the result
+        """
+        self.executor = AsyncioExecutor(loop=asyncio.get_running_loop())
+        execution_result = super().execute_graphql_request(*args, **kwargs)
+        if is_thenable(execution_result):
+            execution_result = await execution_result
+        return execution_result
+
+    def get_middleware(self, request):
+        middleware = super().get_middleware(request)
+        if not middleware or isinstance(middleware, MiddlewareManager):
+            return middleware
+        # A promise wrapped around a resolver's coroutine never resolves, the
+        # executor has to receive the coroutine itself
+        return MiddlewareManager(*middleware, wrap_in_promise=False)
+
+    @staticmethod
+    def get_deadline_seconds(request) -> Optional[float]:
+        """
+        :param request: the incoming GraphQL request
+        :type request: django.http.HttpRequest
+        :return: seconds the request may spend on upstream calls, or None
+        for no deadline
+        :rtype: float
+        """
+        default = getattr(settings, 'GRAPHQL_REQUEST_DEADLINE_SECONDS', None)
+        header = request.headers.get(DeadlineGraphQLView.DEADLINE_HEADER)
+        if not header:
+            return default
+        try:
+            seconds = max(0.0, float(header) / 1000)
+        except ValueError:
+            logger.warning(
+                f"Ignoring invalid {DeadlineGraphQLView.DEADLINE_HEADER} header: {header}")
+            return default
+        return seconds if default is None else min(seconds, default)
+
+
+class AsyncGraphQLView(DeadlineGraphQLView):
+    """
+    DeadlineGraphQLView for ASGI deployments, executing resolvers on the
+    running event loop of the server
+    """
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        with deadline_scope(DeadlineGraphQLView.get_deadline_seconds(request)):
+            try:
+                if request.method.lower() not in ('get', 'post'):
+                    raise HttpError(HttpResponseNotAllowed(
+                        ['GET', 'POST'], 'GraphQL only supports GET and POST requests.'))
+                data = self.parse_body(request)
+                if self.graphiql and self.can_display_graphiql(request, data):
+                    # Rendering GraphiQL executes no query
+                    return GraphQLView.dispatch(self, request, *args, **kwargs)
+
+                if self.batch:
+                    responses = await asyncio.gather(
+                        *(self.get_async_response(request, entry) for entry in data))
+                    result = '[{}]'.format(','.join(response[0] for response in responses))
+                    status_code = max(response[1] for response in responses)
+                else:
+                    result, status_code = await self.get_async_response(request, data)
+
+                return HttpResponse(
+                    status=status_code, content=result, content_type='application/json')
+
+            except HttpError as e:
+                response = e.response
+                response['Content-Type'] = 'application/json'
+                response.content = self.json_encode(
+                    request, {'errors': [self.format_error(e)]})
+                return response
+
+    async def get_async_response(self, request, data):
+        """
+        Same as GraphQLView.get_response, awaiting the execution result
+
+        :param request: the incoming GraphQL request
+        :type request: django.http.HttpRequest
+        :param data: the parsed body of one GraphQL query
+        :type data: dict
+        :return: the JSON response body and its status code
+        :rtype: tuple
+        """
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        execution_result = await self.execute_graphql_request_async(
+            request, data, query, variables, operation_name)
+
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        response = {}
+        if execution_result.errors:
+            set_rollback()
+            response['errors'] = [self.format_error(e) for e in execution_result.errors]
+
+        if execution_result.invalid:
+            status_code = 400
+        else:
+            response['data'] = execution_result.data
+
+        if self.batch:
+            response['id'] = id
+            response['status'] = status_code
+
+        return self.json_encode(request, response), status_code
@@ -13,7 +13,7 @@ the API endpoint to retrieve the member data
 import logging
 import os
 from dotenv import load_dotenv
-from harmoney.config import BaseConfig
+from harmoney.config import BaseConfig, Upstreams
 from harmoney.exceptions import MissingAuthTokenException, FailedClientCreationException
 from harmoney.aiohttp_client import AioHttpClient
 from payment.utils import create_resource_url
@@ -77,5 +77,6 @@ class CncUmvV3Client:
                 **request
             }
         }
-        data = (await self.client.run_instance(url, request_options))
+        data = (await self.client.run_instance(
+            url, request_options, {'upstream': Upstreams.UMV}))
         return data
@@ -49,6 +49,7 @@ class FormattingStrings(Enum):
 
 
 class HttpStatusCodes(Enum):
+    NotModified = 304
     FileNotFoundErr = 404
     UnauthorizedErr = 401
     BadRequestErr = 400
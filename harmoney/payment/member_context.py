@@ -0,0 +1,222 @@
+"""
+Module: member_context
+
+Provides MemberContext, the enriched member of one GraphQL request together
+with the values every field of the member derives from it.
+
+logic_resolve_member returns a MemberContext, which MemberQuery.resolve_member
+attaches to info.context as info.context.member. It is the member dict itself,
+so existing code reading member fields is unchanged, and it computes each of
+the following at most once for the request:
+
+    * issuer_subscriber_id: the ID scanned out of the member's refs
+    * payment_system(): 'embark' or 'softheon', from RTR
+    * ref_id(): the payment profile ID, from RTR or Softheon, cached across
+    requests by RtrPayments
+    * token(scope): the Softheon access token of a scope, which
+    softheon_request() authorizes Softheon calls with
+    * wallet(): the member's Softheon wallet, shared by the creditCards and
+    bankAccounts fields and by the payment mutations
+
+Async values are computed by a single task shared by all concurrent callers;
+a failed computation is forgotten, so that a later caller retries it.
+"""
+
+import asyncio
+import os
+from functools import cached_property
+
+from dotenv import load_dotenv
+
+from harmoney.aiohttp_client import AioHttpClient
+from harmoney.config import Upstreams
+from harmoney.exceptions import UpstreamStatusException
+from harmoney.retry_policy import RetryPolicies
+from payment.constants import APPLICATION_JSON_CONTENT_TYPE, Constants, HttpStatusCodes
+from payment.rtrPayments import RtrPayments
+from payment.utils import get_softheon_identity, invalidate_softheon_identity
+from payment.views import GetIds
+
+load_dotenv()
+
+RTR = RtrPayments()
+HTTP = AioHttpClient()
+SOFTHEON_WALLET_HOST = os.environ.get("SOFTHEON_WALLET_HOST")
+SOFTHEON_PAYMENT_SCOPE = Constants.SOFTHEON_PAYMENT_SCOPE.value
+
+
+class MemberContext(dict):
+    """
+    An enriched member dict that memoizes the values derived from it for the
+    duration of one request
+    """
+
+    def __init__(self, member: dict):
+        super().__init__(member)
+        # dict [name: asyncio.Task]
+        self._tasks = {}
+
+    @cached_property
+    def issuer_subscriber_id(self) -> str:
+        """
+        :return: the issuer subscriber ID of the member
+        :rtype: str
+        :raises MemberNotFoundException: the ID cannot be derived from the refs
+        """
+        return GetIds.get_issuer_subscriber_id(self)
+
+    async def payment_system(self) -> str:
+        """
+        :return: the payment system of the member, 'embark' or 'softheon'
+        :rtype: str
+        """
+        return await self._memoized('paymentSystem', lambda: RTR.get_payment_system(self))
+
+    async def ref_id(self) -> str:
+        """
+        :return: the reference ID of the member's payment profile
+        :rtype: str
+        """
+        return await self._memoized('refId', lambda: RTR.get_member_ref_id(self))
+
+    async def token(self, scope: str) -> str:
+        """
+        :param scope: the Softheon scope, e.g. SOFTHEON_PAYMENT_SCOPE
+        :type scope: str
+        :return: a Softheon access token of the scope for the member's client
+        :rtype: str
+        """
+        return await self._memoized(
+            f'token:{scope}', lambda: get_softheon_identity(self, scope))
+
+    async def softheon_request(self, scope: str, url: str, request_options: dict,
+                               request_config: dict = None) -> dict:
+        """
+        Runs a Softheon request authorized with the member's access token of
+        a scope. A request rejected with status 401, e.g. because the token
+        was revoked before its expiry, is sent once more with a new token
+
+        :param scope: the Softheon scope, e.g. SOFTHEON_PAYMENT_SCOPE
+        :type scope: str
+        :param url: the url to request
+        :type url: str
+        :param request_options: the options of AioHttpClient.run_instance,
+        without the Authorization header
+        :type request_options: dict
+        :param request_config: the request configuration object
+        :type request_config: dict
+        :return: the response of AioHttpClient.run_instance
+        :rtype: dict
+        :raises UpstreamStatusException: the response status is >= 400
+        """
+        token = await self.token(scope)
+        try:
+            return await HTTP.run_instance(
+                url, MemberContext._authorized(request_options, token), request_config)
+        except UpstreamStatusException as exc:
+            if exc.status != HttpStatusCodes.UnauthorizedErr.value:
+                raise
+        await self.forget_token(scope, token)
+        token = await self.token(scope)
+        return await HTTP.run_instance(
+            url, MemberContext._authorized(request_options, token), request_config)
+
+    @staticmethod
+    def _authorized(request_options: dict, token: str) -> dict:
+        return {
+            **request_options,
+            'headers': {
+                **request_options.get('headers', {}),
+                'Authorization': f'Bearer {token}'
+            }
+        }
+
+    async def wallet(self) -> dict:
+        """
+        :return: the data of the member's Softheon wallet, with its
+        creditCards and bankAccounts, or None without a reference ID
+        :rtype: dict
+        :raises UpstreamStatusException: Softheon rejected the wallet lookup,
+        also after the reference ID was looked up again
+        """
+        return await self._memoized('wallet', self._fetch_wallet)
+
+    async def forget_ref_id(self) -> None:
+        """
+        Drops the memoized and cached reference ID, so that the next call to
+        ref_id() looks it up again
+        """
+        self._tasks.pop('refId', None)
+        await RTR.invalidate_ref_id(self.issuer_subscriber_id, self.get('PaymentSystem'))
+
+    async def forget_token(self, scope: str, token: str) -> None:
+        """
+        Drops the memoized and kept access token of a scope after Softheon
+        rejected it, so that the next call to token() fetches a new one
+
+        :param scope: the Softheon scope of the token
+        :type scope: str
+        :param token: the rejected token
+        :type token: str
+        """
+        task = self._tasks.get(f'token:{scope}')
+        if task is not None and task.done() and not task.cancelled() \
+                and task.exception() is None and task.result() == token:
+            del self._tasks[f'token:{scope}']
+        await invalidate_softheon_identity(self, scope, token)
+
+    def forget_wallet(self) -> None:
+        """
+        Drops the memoized wallet, after a mutation changed it
+        """
+        self._tasks.pop('wallet', None)
+
+    async def _fetch_wallet(self):
+        _, ref_id = await asyncio.gather(
+            self.token(SOFTHEON_PAYMENT_SCOPE), self.ref_id())
+        if not ref_id:
+            return None
+        try:
+            return await self._fetch_wallet_of(ref_id)
+        except UpstreamStatusException as exc:
+            if not 400 <= exc.status < 500:
+                raise
+            # The cached reference ID may be outdated, look it up once more
+            await self.forget_ref_id()
+            fresh_ref_id = await self.ref_id()
+            if not fresh_ref_id or fresh_ref_id == ref_id:
+                raise
+        return await self._fetch_wallet_of(fresh_ref_id)
+
+    async def _fetch_wallet_of(self, ref_id):
+        url = f'{SOFTHEON_WALLET_HOST}/payments/v4/wallet?referenceId={ref_id}'
+        request_options = {
+            'method': "get",
+            'headers': {
+                'Content-Type': APPLICATION_JSON_CONTENT_TYPE
+            }
+        }
+        config = {
+            'timeoutSeconds': 1,
+            'retryPolicy': RetryPolicies.SOFTHEON_WALLET,
+            'upstream': Upstreams.SOFTHEON_WALLET,
+            'coalesce': True,
+            'hedge': True
+        }
+        response = await self.softheon_request(
+            SOFTHEON_PAYMENT_SCOPE, url, request_options, config)
+        return response.get('data') if response else None
+
+    async def _memoized(self, name: str, compute):
+        task = self._tasks.get(name)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            task.add_done_callback(lambda done: self._forget_failure(name, done))
+            self._tasks[name] = task
+        # A caller that is cancelled must not cancel the others' computation
+        return await asyncio.shield(task)
+
+    def _forget_failure(self, name: str, task: asyncio.Task) -> None:
+        if task.cancelled() or task.exception() is not None:
+            if self._tasks.get(name) is task:
+                del self._tasks[name]
@@ -1,5 +1,4 @@
 import json
-import asyncio
 
 import graphene
 from payment.types import BankAccountType, StatusReturnType
@@ -7,22 +6,14 @@ import logging
 import os
 
 from dotenv import load_dotenv
-from payment.resolvers import ApplicationConfigResolvers, logic_resolve_member, resolve_wallet_accounts
+from payment.resolvers import ApplicationConfigResolvers, logic_resolve_member, invalidate_member
 from payment.constants import Constants
 from payment.rtrPayments import RtrPayments
-from payment.utils import get_softheon_identity
 from harmoney.aiohttp_client import AioHttpClient
+from harmoney.config import Upstreams
 from harmoney.exceptions import DupicateObjectException, NoneReturnTypeException
 
 
-EVENT_LOOP = None
-
-try:
-    EVENT_LOOP = asyncio.get_running_loop()
-except RuntimeError:
-    EVENT_LOOP = asyncio.new_event_loop()
-    asyncio.set_event_loop(EVENT_LOOP)
-
 load_dotenv()
 
 RTR = RtrPayments()
@@ -54,9 +45,9 @@ class CreateBankAccount(graphene.Mutation):
 
     bank_account = graphene.Field(BankAccountType)
 
-    def mutate(self, info, member_id, accountNumber, routingNumber, accountHolderName,
-              type, nickname, address1, city, state, zip_code,
-              email, address2=""):
+    async def mutate(self, info, member_id, accountNumber, routingNumber, accountHolderName,
+                    type, nickname, address1, city, state, zip_code,
+                    email, address2=""):
         bank_account_object = {
             "accountNumber": f"{accountNumber}",
             "routingNumber": f"{routingNumber}",
@@ -72,16 +63,13 @@ class CreateBankAccount(graphene.Mutation):
             },
             "email": f"{email}"
         }
-        member = EVENT_LOOP.run_until_complete(
-            logic_resolve_member(
-                member_id
-            )
+        member = await logic_resolve_member(
+            member_id
         )
-        response = EVENT_LOOP.run_until_complete(
-            CreateBankAccount.format_add_bank_account(
-                member, bank_account_object
-            )
+        response = await CreateBankAccount.format_add_bank_account(
+            member, bank_account_object
         )
+        invalidate_member(member_id)
         bank_account = BankAccountType(**response)
         return CreateBankAccount(bank_account=bank_account)
     
@@ -89,9 +77,8 @@ class CreateBankAccount(graphene.Mutation):
     @staticmethod
     async def format_add_bank_account(member, bank_account_object):
         payment_config = await ApplicationConfigResolvers.logic_resolve_application_config(member)
-        wallet = await resolve_wallet_accounts(member)
+        wallet = await member.wallet()
         tokenized_ba = await CreateBankAccount._tokenize_bank_account(bank_account_object, payment_config)
-        token = await get_softheon_identity(member, SOFTHEON_PAYMENT_SCOPE)
         url = f'{SOFTHEON_WALLET_HOST}{SOFTHEON_WALLET_PREFIX}/v4/wallet/{wallet["id"]}/BankAccount'
         card_to_post = {"paymentToken": str(tokenized_ba['token']),
                         "isDefault": True}
@@ -99,12 +86,13 @@ class CreateBankAccount(graphene.Mutation):
             'method': "post",
             'data': json.dumps(card_to_post),
             'headers': {
-                'Authorization': f'Bearer {token}',
                 'Content-Type': APPLICATION_JSON_CONTENT_TYPE
             }
         }
 
-        data = await HTTP.run_instance(url, request_options)
+        data = await member.softheon_request(
+            SOFTHEON_PAYMENT_SCOPE, url, request_options, {'upstream': Upstreams.SOFTHEON_WALLET})
+        member.forget_wallet()
         data = data["data"]
         bank_accounts = data["bankAccounts"]
         bank_account = bank_accounts[-1]
@@ -135,7 +123,7 @@ class CreateBankAccount(graphene.Mutation):
                 'Content-Type': APPLICATION_JSON_CONTENT_TYPE
             }
         }
-        data = await HTTP.run_instance(payment_tokenization_url, request_options)
+        data = await HTTP.run_instance(payment_tokenization_url, request_options, {'upstream': Upstreams.SOFTHEON_WALLET})
         if data is None:
             raise NoneReturnTypeException(
                 'Unable to tokenize bank account. '
@@ -150,24 +138,20 @@ class DeleteBankAccount(graphene.Mutation):
 
     bank_account_status = graphene.Field(StatusReturnType)
 
-    def mutate(self, info, member_id, token):
-        member = EVENT_LOOP.run_until_complete(
-            logic_resolve_member(member_id)
-        )
-        resp = EVENT_LOOP.run_until_complete(
-            DeleteBankAccount.format_delete_bank_account(
-                member, token
-            )
+    async def mutate(self, info, member_id, token):
+        member = await logic_resolve_member(member_id)
+        resp = await DeleteBankAccount.format_delete_bank_account(
+            member, token
         )
+        invalidate_member(member_id)
         status_resp = StatusReturnType(**resp)
         return DeleteBankAccount(bank_account_status=status_resp)
 
 
     @staticmethod
     async def format_delete_bank_account(member, ba_token):
-        wallet = await resolve_wallet_accounts(member)
+        wallet = await member.wallet()
         active_tokens = [ba['token'] for ba in wallet['bankAccounts']]
-        token = await get_softheon_identity(member, SOFTHEON_PAYMENT_SCOPE)
         if ba_token not in active_tokens:
             return {'status': '400', 'error': f'Bank Account token: {ba_token} does not exist in the members wallet'}
         wallet_id = wallet['id']
@@ -180,11 +164,12 @@ class DeleteBankAccount(graphene.Mutation):
             'method': "delete",
             'data': json.dumps({}),
             'headers': {
-                'Authorization': f'Bearer {token}',
                 'Content-Type': APPLICATION_JSON_CONTENT_TYPE
             }
         }
-        await HTTP.run_instance(url, request_options)
+        await member.softheon_request(
+            SOFTHEON_PAYMENT_SCOPE, url, request_options, {'upstream': Upstreams.SOFTHEON_WALLET})
+        member.forget_wallet()
         return {'status': '200', 'error': ''}
 
 
@@ -1,5 +1,4 @@
 import json
-import asyncio
 
 import graphene
 from payment.types import CreditCardType, StatusReturnType
@@ -7,22 +6,14 @@ import logging
 import os
 
 from dotenv import load_dotenv
-from payment.resolvers import ApplicationConfigResolvers, logic_resolve_member, resolve_wallet_accounts
+from payment.resolvers import ApplicationConfigResolvers, logic_resolve_member, invalidate_member
 from payment.constants import Constants
 from payment.rtrPayments import RtrPayments
-from payment.utils import get_softheon_identity
 from harmoney.aiohttp_client import AioHttpClient
+from harmoney.config import Upstreams
 from harmoney.exceptions import DupicateObjectException, InvalidCreditCardTypeException, NoneReturnTypeException
 
 
-EVENT_LOOP = None
-
-try:
-    EVENT_LOOP = asyncio.get_running_loop()
-except RuntimeError:
-    EVENT_LOOP = asyncio.new_event_loop()
-    asyncio.set_event_loop(EVENT_LOOP)
-
 load_dotenv()
 
 RTR = RtrPayments()
@@ -54,9 +45,9 @@ class CreateCreditCard(graphene.Mutation):
 
     credit_card = graphene.Field(CreditCardType)
 
-    def mutate(self, info, member_id, card_number, security_code, expiration_month,
-              expiration_year, card_holder_name, address1, city, state, zip_code,
-              email, address2 = ""):
+    async def mutate(self, info, member_id, card_number, security_code, expiration_month,
+                    expiration_year, card_holder_name, address1, city, state, zip_code,
+                    email, address2 = ""):
         card_object = {
             "cardNumber": f"{card_number}",
             "securityCode": f"{security_code}",
@@ -72,16 +63,13 @@ class CreateCreditCard(graphene.Mutation):
             },
             "email": f"{email}"
         }
-        member = EVENT_LOOP.run_until_complete(
-            logic_resolve_member(
-                member_id
-            )
+        member = await logic_resolve_member(
+            member_id
         )
-        response = EVENT_LOOP.run_until_complete(
-            CreateCreditCard.format_add_credit_card(
-                member, card_object
-            )
+        response = await CreateCreditCard.format_add_credit_card(
+            member, card_object
         )
+        invalidate_member(member_id)
         credit_card = CreditCardType(**response)
         return CreateCreditCard(credit_card=credit_card)
     
@@ -89,7 +77,7 @@ class CreateCreditCard(graphene.Mutation):
     @staticmethod
     async def format_add_credit_card(member, card_object):
         payment_config= await ApplicationConfigResolvers.logic_resolve_application_config(member)
-        wallet = await resolve_wallet_accounts(member)
+        wallet = await member.wallet()
         tokenized_cc = await CreateCreditCard._tokenize_credit_card(card_object, payment_config)
         if tokenized_cc['cardType'] == "AMEX":
             raise InvalidCreditCardTypeException("Support for American Express (AMEX) does not exist")
@@ -97,7 +85,6 @@ class CreateCreditCard(graphene.Mutation):
         if tokenized_cc['token'] in active_tokens:
             raise DupicateObjectException(f"credit card ending with {tokenized_cc['cardNumber']} already exists")
 
-        token = await get_softheon_identity(member, SOFTHEON_PAYMENT_SCOPE)
         url = f'{SOFTHEON_WALLET_HOST}{SOFTHEON_WALLET_PREFIX}/v4/wallet/{wallet["id"]}/creditCard'
         card_to_post = {"paymentToken": str(tokenized_cc['token']),
                         "isDefault": True}
@@ -105,12 +92,13 @@ class CreateCreditCard(graphene.Mutation):
             'method': "post",
             'data': json.dumps(card_to_post),
             'headers': {
-                'Authorization': f'Bearer {token}',
                 'Content-Type': APPLICATION_JSON_CONTENT_TYPE
             }
         }
 
-        data = await HTTP.run_instance(url, request_options)
+        data = await member.softheon_request(
+            SOFTHEON_PAYMENT_SCOPE, url, request_options, {'upstream': Upstreams.SOFTHEON_WALLET})
+        member.forget_wallet()
         data = data["data"]
         cards = data['creditCards']
         target_card = cards[-1]
@@ -142,7 +130,7 @@ class CreateCreditCard(graphene.Mutation):
                 'Content-Type': APPLICATION_JSON_CONTENT_TYPE
             }
         }
-        data = await HTTP.run_instance(payment_tokenization_url, request_options)
+        data = await HTTP.run_instance(payment_tokenization_url, request_options, {'upstream': Upstreams.SOFTHEON_WALLET})
         if data is None:
             raise NoneReturnTypeException('Unable to tokenize credit card. Verify all required data is entered correctly')
         return data['data']
@@ -155,24 +143,20 @@ class DeleteCreditCard(graphene.Mutation):
 
     card_status = graphene.Field(StatusReturnType)
 
-    def mutate(self, info, member_id, token):
-        member = EVENT_LOOP.run_until_complete(
-            logic_resolve_member(member_id)
-        )
-        resp = EVENT_LOOP.run_until_complete(
-            DeleteCreditCard.format_delete_credit_card(
-                member, token
-            )
+    async def mutate(self, info, member_id, token):
+        member = await logic_resolve_member(member_id)
+        resp = await DeleteCreditCard.format_delete_credit_card(
+            member, token
         )
+        invalidate_member(member_id)
         status_resp = StatusReturnType(**resp)
         return DeleteCreditCard(card_status=status_resp)
 
 
     @staticmethod
     async def format_delete_credit_card(member, cc_token):
-        wallet = await resolve_wallet_accounts(member)
+        wallet = await member.wallet()
         active_tokens = [cc['token'] for cc in wallet['creditCards']]
-        token = await get_softheon_identity(member, SOFTHEON_PAYMENT_SCOPE)
         if cc_token not in active_tokens:
             return {'status': '400', 'error': f'credit card token: {cc_token} does not exist in the members wallet'}
         wallet_id = wallet['id']
@@ -185,11 +169,12 @@ class DeleteCreditCard(graphene.Mutation):
             'method': "delete",
             'data': json.dumps({}),
             'headers': {
-                'Authorization': f'Bearer {token}',
                 'Content-Type': APPLICATION_JSON_CONTENT_TYPE
             }
         }
-        await HTTP.run_instance(url, request_options)
+        await member.softheon_request(
+            SOFTHEON_PAYMENT_SCOPE, url, request_options, {'upstream': Upstreams.SOFTHEON_WALLET})
+        member.forget_wallet()
         return {'status': '200', 'error': ''}
 
 
@@ -1,5 +1,4 @@
 import json
-import asyncio
 
 import graphene
 from payment.types import OneTimePaymentType
@@ -8,26 +7,16 @@ import logging
 import os
 
 from dotenv import load_dotenv
-from payment.resolvers import CreditCardResolvers, logic_resolve_member
+from payment.resolvers import CreditCardResolvers, logic_resolve_member, invalidate_member
 from payment.constants import Constants, APPLICATION_JSON_CONTENT_TYPE
 from payment.rtrPayments import RtrPayments
-from payment.utils import get_softheon_identity
-from harmoney.aiohttp_client import AioHttpClient
+from harmoney.config import Upstreams
 from harmoney.exceptions import InvalidFieldForObject, InvalidFormatException
 
 
-EVENT_LOOP = None
-
-try:
-    EVENT_LOOP = asyncio.get_running_loop()
-except RuntimeError:
-    EVENT_LOOP = asyncio.new_event_loop()
-    asyncio.set_event_loop(EVENT_LOOP)
-
 load_dotenv()
 
 RTR = RtrPayments()
-HTTP = AioHttpClient()
 SOFTHEON_WALLET_HOST = os.environ.get("SOFTHEON_WALLET_HOST")
 SOFTHEON_WALLET_PREFIX = os.environ.get("SOFTHEON_WALLET_PREFIX")
 
@@ -51,17 +40,13 @@ class ExecuteOneTimePayment(graphene.Mutation):
     payment = graphene.Field(OneTimePaymentType)
     
 
-    def mutate(self, info, member_id, payment_amount, payment_date, description,
-             payment_token, payment_type, source, properties):
+    async def mutate(self, info, member_id, payment_amount, payment_date, description,
+                   payment_token, payment_type, source, properties):
         
-        member = EVENT_LOOP.run_until_complete(
-            logic_resolve_member(
-                member_id
-            )
-        )
-        ref_id = EVENT_LOOP.run_until_complete(
-            RTR.get_member_ref_id(member)
+        member = await logic_resolve_member(
+            member_id
         )
+        ref_id = await member.ref_id()
         payment_object = {
             "paymentAmount": payment_amount,
             "paymentDate": f"{payment_date}",
@@ -75,37 +60,33 @@ class ExecuteOneTimePayment(graphene.Mutation):
             "properties": {}
         }
 
-        credit_cards = EVENT_LOOP.run_until_complete(
-            CreditCardResolvers.format_credit_cards(member)
-        )
+        credit_cards = await CreditCardResolvers.format_credit_cards(member)
         active_tokens = [cc['token'] for cc in credit_cards]
         if payment_token not in active_tokens:
             raise InvalidFieldForObject(f'Credit card token: {payment_token} does not exist for the current member')
         if payment_amount <= 0:
              raise InvalidFieldForObject(f'Payment amount must be larger than 0')
         
-        response = EVENT_LOOP.run_until_complete(
-            ExecuteOneTimePayment.format_payment(
-                member, payment_object
-            )
+        response = await ExecuteOneTimePayment.format_payment(
+            member, payment_object
         )
+        invalidate_member(member_id)
         payment = ExecuteOneTimePayment.create_payment_object(response)
         return ExecuteOneTimePayment(payment=payment)
     
 
     @staticmethod
     async def format_payment(member, card_object):
-        token = await get_softheon_identity(member, SOFTHEON_PAYMENT_SCOPE)
         url = f"{SOFTHEON_WALLET_HOST}{SOFTHEON_WALLET_PREFIX}/v3/payments"
         request_options = {
             'method': "post",
             'data': json.dumps(card_object),
             'headers': {
-                'Authorization': f'Bearer {token}',
                 'Content-Type': APPLICATION_JSON_CONTENT_TYPE
             }
         }
-        data = await HTTP.run_instance(url, request_options)
+        data = await member.softheon_request(
+            SOFTHEON_PAYMENT_SCOPE, url, request_options, {'upstream': Upstreams.SOFTHEON_WALLET})
         if data is None:
             raise InvalidFormatException('Request could not go though. Verify all data entered is correct')
         data = data['data']
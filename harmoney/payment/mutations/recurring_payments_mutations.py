@@ -1,34 +1,22 @@
 import json
-import asyncio
 
 import graphene
-import requests
 
 from payment.types import RecurringPaymentReturnType, StatusReturnType
 import logging
 import os
-from payment.resolvers import CreditCardResolvers, logic_resolve_member, RecurringPaymentsResolver, ApplicationConfigResolvers, BankAccountsResolver
+from payment.resolvers import CreditCardResolvers, logic_resolve_member, invalidate_member, RecurringPaymentsResolver, ApplicationConfigResolvers, BankAccountsResolver
 
 from dotenv import load_dotenv
 from payment.constants import Constants, ValidInputs
 from payment.rtrPayments import RtrPayments
-from payment.utils import get_softheon_identity
-from harmoney.aiohttp_client import AioHttpClient
-from harmoney.exceptions import InvalidFieldForObject, InvalidTokenException, PaymentNotFoundException
+from harmoney.config import Upstreams
+from harmoney.exceptions import InvalidFieldForObject, InvalidTokenException, PaymentNotFoundException, UpstreamStatusException
 
 
-EVENT_LOOP = None
-
-try:
-    EVENT_LOOP = asyncio.get_running_loop()
-except RuntimeError:
-    EVENT_LOOP = asyncio.new_event_loop()
-    asyncio.set_event_loop(EVENT_LOOP)
-
 load_dotenv()
 
 RTR = RtrPayments()
-HTTP = AioHttpClient()
 SOFTHEON_WALLET_HOST = os.environ.get("SOFTHEON_WALLET_HOST")
 SOFTHEON_WALLET_PREFIX = os.environ.get("SOFTHEON_WALLET_PREFIX")
 
@@ -38,20 +26,16 @@ APPLICATION_JSON_CONTENT_TYPE = "application/json"
 logger = logging.getLogger(__name__)
 
 
-def validate_payment_object(member, payment_obj):
+async def validate_payment_object(member, payment_obj):
 
     if payment_obj['paymentType'].lower() == 'credit card':
-        credit_cards = EVENT_LOOP.run_until_complete(
-            CreditCardResolvers.format_credit_cards(member)
-        ) 
+        credit_cards = await CreditCardResolvers.format_credit_cards(member) 
         active_tokens = [cc['token'] for cc in credit_cards]
         if payment_obj['paymentToken'] not in active_tokens:
             raise InvalidTokenException(f'Credit card token: {payment_obj["paymentToken"]} '
                                     f'does not exist for the current member')
     elif payment_obj['paymentType'].lower() == 'ach':
-        bank_accounts = EVENT_LOOP.run_until_complete(
-            BankAccountsResolver.format_bank_accounts(member)
-        )
+        bank_accounts = await BankAccountsResolver.format_bank_accounts(member)
         active_bank_tokens = [ba['token'] for ba in bank_accounts]
         if payment_obj['paymentToken'] not in active_bank_tokens:
             raise InvalidTokenException(f'Bank account token: {payment_obj["paymentToken"]} '
@@ -107,50 +91,40 @@ class CreateRecurringPayment(graphene.Mutation):
 
     rec_payment = graphene.Field(RecurringPaymentReturnType)
 
-    def mutate(self, info, member_id, name, amount_type, run_day,
-               state, payment_type, payment_token, amount=0,
-               end_date='', description=''):
-        member = EVENT_LOOP.run_until_complete(
-            logic_resolve_member(
-                member_id
-            )
-        )
-        ref_id = EVENT_LOOP.run_until_complete(
-            RTR.get_member_ref_id(
-                member
-            )
+    async def mutate(self, info, member_id, name, amount_type, run_day,
+                     state, payment_type, payment_token, amount=0,
+                     end_date='', description=''):
+        member = await logic_resolve_member(
+            member_id
         )
+        ref_id = await member.ref_id()
         payment_object = get_create_payment_obj(
             name, description, run_day, end_date, state,
             payment_type, payment_token, amount_type, amount, ref_id)
 
-        validate_payment_object(member, payment_object)
+        await validate_payment_object(member, payment_object)
         #currently this value is not used, but the action must take place and this var may be needed later
-        response = EVENT_LOOP.run_until_complete(
-            CreateRecurringPayment.create_recurring_payment(
-                member, payment_object
-            )
-        )
-        ret_response = EVENT_LOOP.run_until_complete(
-            CreateRecurringPayment.format_response_object(member)
+        response = await CreateRecurringPayment.create_recurring_payment(
+            member, payment_object
         )
+        invalidate_member(member_id)
+        ret_response = await CreateRecurringPayment.format_response_object(member)
         rec_payment = RecurringPaymentReturnType(**ret_response)
 
         return CreateRecurringPayment(rec_payment=rec_payment)
     
     @staticmethod
     async def create_recurring_payment(member, payment_obj):
-        token = await get_softheon_identity(member, SOFTHEON_PAYMENT_SCOPE)
         url = f'{SOFTHEON_WALLET_HOST}{SOFTHEON_WALLET_PREFIX}/v4/subscriptions'
         request_options = {
             'method': "post",
             'data': json.dumps(payment_obj),
             'headers': {
-                'Authorization': f'Bearer {token}',
                 'Content-Type': APPLICATION_JSON_CONTENT_TYPE
             }
         }
-        data = await HTTP.run_instance(url, request_options)
+        data = await member.softheon_request(
+            SOFTHEON_PAYMENT_SCOPE, url, request_options, {'upstream': Upstreams.SOFTHEON_WALLET})
         return_data = data["data"]
         return return_data
 
@@ -182,50 +156,45 @@ class UpdateRecurringPayment(graphene.Mutation):
 
     payment_update_status = graphene.Field(StatusReturnType)
 
-    def mutate(self, info, member_id, payment_id, name, run_day,
-               state, payment_type, payment_token, amount_type, amount=0,
-               end_date="", description=""):
+    async def mutate(self, info, member_id, payment_id, name, run_day,
+                     state, payment_type, payment_token, amount_type, amount=0,
+                     end_date="", description=""):
 
-        member = EVENT_LOOP.run_until_complete(
-            logic_resolve_member(
-                member_id
-            )
-        )
-        ref_id = EVENT_LOOP.run_until_complete(
-            RTR.get_member_ref_id(
-                member
-            )
+        member = await logic_resolve_member(
+            member_id
         )
+        ref_id = await member.ref_id()
         payment_object = get_create_payment_obj(
             name, description, run_day, end_date, state,
             payment_type, payment_token, amount_type, amount, ref_id)
         # adding extra fields required to update
         payment_object['id'] = payment_id
 
-        validate_payment_object(member, payment_object)
-        response = EVENT_LOOP.run_until_complete(
-            UpdateRecurringPayment.format_recurring_payment_update(
-                member, payment_object
-            )
+        await validate_payment_object(member, payment_object)
+        response = await UpdateRecurringPayment.format_recurring_payment_update(
+            member, payment_object
         )
-        status_resp = StatusReturnType(**{
-            "status": response.status_code,
-            "error": response.text
-        })
+        invalidate_member(member_id)
+        status_resp = StatusReturnType(**response)
         return UpdateRecurringPayment(payment_update_status=status_resp)
         
 
     @staticmethod
     async def format_recurring_payment_update(member, payment_obj):
-        token = await get_softheon_identity(member, SOFTHEON_PAYMENT_SCOPE)
         url = f'{SOFTHEON_WALLET_HOST}{SOFTHEON_WALLET_PREFIX}/v4/subscriptions'
-        data = json.dumps(payment_obj)
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': APPLICATION_JSON_CONTENT_TYPE
+        request_options = {
+            'method': "put",
+            'data': json.dumps(payment_obj),
+            'headers': {
+                'Content-Type': APPLICATION_JSON_CONTENT_TYPE
+            }
         }
-        response = requests.put(url, data=data, headers=headers)
-        return response
+        try:
+            response = await member.softheon_request(
+                SOFTHEON_PAYMENT_SCOPE, url, request_options, {'upstream': Upstreams.SOFTHEON_WALLET})
+        except UpstreamStatusException as exc:
+            return {'status': exc.status, 'error': str(exc.data)}
+        return {'status': response['status'], 'error': ''}
 
 
 class DeleteRecurringPayment(graphene.Mutation):
@@ -246,19 +215,13 @@ class DeleteRecurringPayment(graphene.Mutation):
 
     payment_delete_status = graphene.Field(StatusReturnType)
 
-    def mutate(self, info, member_id, payment_id, name, run_day,
-               payment_type, payment_token, amount_type, amount=0,
-               end_date="", description=""):
-        member = EVENT_LOOP.run_until_complete(
-            logic_resolve_member(
-                member_id
-            )
-        )
-        ref_id = EVENT_LOOP.run_until_complete(
-            RTR.get_member_ref_id(
-                member
-            )
+    async def mutate(self, info, member_id, payment_id, name, run_day,
+                     payment_type, payment_token, amount_type, amount=0,
+                     end_date="", description=""):
+        member = await logic_resolve_member(
+            member_id
         )
+        ref_id = await member.ref_id()
         # this is to make sure, subscription becomes inactive
         state = "inactive"
         payment_object = get_create_payment_obj(
@@ -268,16 +231,12 @@ class DeleteRecurringPayment(graphene.Mutation):
         #TODO: verify the payment ID actually exists
         payment_object['id'] = payment_id
 
-        validate_payment_object(member, payment_object)
-        response = EVENT_LOOP.run_until_complete(
-            UpdateRecurringPayment.format_recurring_payment_update(
-                member, payment_object
-            )
+        await validate_payment_object(member, payment_object)
+        response = await UpdateRecurringPayment.format_recurring_payment_update(
+            member, payment_object
         )
-        status_resp = StatusReturnType(**{
-            "status": response.status_code,
-            "error": response.text
-        })
+        invalidate_member(member_id)
+        status_resp = StatusReturnType(**response)
         return DeleteRecurringPayment(payment_delete_status=status_resp)
     
 
@@ -0,0 +1,220 @@
+"""
+Module: payment_system_rules
+
+Decides the payment system of most members from a local rule table, so that
+RTR is only asked about the members the table leaves ambiguous.
+
+The table is a JSON file whose rules match a member's enrollment source, the
+state code of its plan HIOS ID (see payment.utils.decode_hios_id) and
+prefixes of the plan HIOS ID. A rule leaving a field out matches any value:
+
+    {
+        "rules": [
+            {"enrollmentSource": "Embark", "stateCode": "FL",
+             "planHiosIdPrefixes": ["12345FL"], "paymentSystem": "embark"},
+            {"enrollmentSource": "Embark", "paymentSystem": "rtr"},
+            {"paymentSystem": "softheon"}
+        ]
+    }
+
+paymentSystem is 'embark', 'softheon', or 'rtr' for members RTR must decide.
+The most specific rule wins: one matching both the enrollment source and the
+state code, then the enrollment source only, then the state code only, then
+neither; among those, the rule with the longest matching HIOS ID prefix.
+Rules are compiled into dicts keyed by these fields, so a lookup costs a few
+dict reads whatever the size of the table.
+
+The file is read again when its modification time changes, checked at most
+every check_interval seconds. A file that cannot be read or compiled is
+logged, and the previous table kept. The table is configured by the
+PAYMENT_SYSTEM_RULES Django setting:
+
+    PAYMENT_SYSTEM_RULES = {
+        'path': BASE_DIR / 'payment' / 'payment_system_rules.json',
+        'check_interval_seconds': 5
+    }
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from payment.utils import decode_hios_id
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_SYSTEMS = frozenset({'embark', 'softheon'})
+# paymentSystem of the rules leaving the decision to RTR
+RTR = 'rtr'
+RULE_FIELDS = frozenset({'enrollmentSource', 'stateCode', 'planHiosIdPrefixes', 'paymentSystem'})
+
+
+def _normalize_source(enrollment_source: Optional[str]) -> Optional[str]:
+    return enrollment_source.strip().lower() if enrollment_source else None
+
+
+def _normalize_code(code: Optional[str]) -> Optional[str]:
+    return code.strip().upper() if code else None
+
+
+def compile_rules(rules: list) -> dict:
+    """
+    :param rules: the rules of a rule table
+    :type rules: list
+    :return: dict [(enrollment source, state code): dict [HIOS ID prefix:
+    payment system]], None keys matching any value
+    :rtype: dict
+    :raises ValueError: a rule is invalid, or conflicts with another
+    """
+    compiled = {}
+    for index, rule in enumerate(rules):
+        if not isinstance(rule, dict) or not RULE_FIELDS.issuperset(rule):
+            raise ValueError(f"Rule {index} must be an object with keys among {sorted(RULE_FIELDS)}")
+        payment_system = rule.get('paymentSystem')
+        if payment_system not in PAYMENT_SYSTEMS and payment_system != RTR:
+            raise ValueError(f"Rule {index} has an invalid paymentSystem: {payment_system!r}")
+        key = (_normalize_source(rule.get('enrollmentSource')), _normalize_code(rule.get('stateCode')))
+        prefixes = compiled.setdefault(key, {})
+        for prefix in rule.get('planHiosIdPrefixes') or ['']:
+            prefix = _normalize_code(prefix) or ''
+            if prefixes.get(prefix, payment_system) != payment_system:
+                raise ValueError(f"Rule {index} conflicts with an earlier rule for {key} {prefix!r}")
+            prefixes[prefix] = payment_system
+    return compiled
+
+
+class PaymentSystemRules:
+    """
+    A rule table file, compiled for lookups and reloaded when it changes
+
+    * path (str): the JSON rule table, None for an empty table
+    * check_interval (float): the most seconds between two checks of the
+    file's modification time
+    """
+
+    DEFAULT_CHECK_INTERVAL_SECONDS = 5.0
+
+    def __init__(self, path: Optional[str] = None,
+                 check_interval: float = DEFAULT_CHECK_INTERVAL_SECONDS):
+        self.path = str(path) if path else None
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._compiled = {}
+        # sorted lengths of the HIOS ID prefixes, longest first
+        self._prefix_lengths = ()
+        self._version = None
+        self._checked_at = None
+        self._matched = 0
+        self._ambiguous = 0
+        self._reloads = 0
+        self._reload_failures = 0
+
+    @classmethod
+    def from_settings(cls, setting_name: str) -> 'PaymentSystemRules':
+        """
+        :param setting_name: name of the Django setting configuring the table,
+        with path and check_interval_seconds keys
+        :type setting_name: str
+        :return: the configured rule table
+        :rtype: PaymentSystemRules
+        """
+        try:
+            configured = getattr(settings, setting_name, {})
+        except ImproperlyConfigured:
+            configured = {}
+        return cls(
+            path=configured.get('path'),
+            check_interval=configured.get(
+                'check_interval_seconds', cls.DEFAULT_CHECK_INTERVAL_SECONDS)
+        )
+
+    def match(self, enrollment_source: Optional[str], plan_hios_id: Optional[str]) -> Optional[str]:
+        """
+        :param enrollment_source: the member's enrollment source
+        :type enrollment_source: str
+        :param plan_hios_id: the member's plan HIOS ID
+        :type plan_hios_id: str
+        :return: 'embark' or 'softheon', or None when RTR must decide
+        :rtype: str
+        """
+        self._reload_if_changed()
+        source = _normalize_source(enrollment_source)
+        hios_id = _normalize_code(plan_hios_id) or ''
+        state_code = _normalize_code(decode_hios_id(plan_hios_id)['stateCode'])
+        with self._lock:
+            compiled, prefix_lengths = self._compiled, self._prefix_lengths
+        payment_system = None
+        for key in ((source, state_code), (source, None), (None, state_code), (None, None)):
+            prefixes = compiled.get(key)
+            if not prefixes:
+                continue
+            payment_system = next(
+                (prefixes[hios_id[:length]] for length in prefix_lengths
+                 if length <= len(hios_id) and hios_id[:length] in prefixes), None)
+            if payment_system is not None:
+                break
+        decided = payment_system in PAYMENT_SYSTEMS
+        with self._lock:
+            if decided:
+                self._matched += 1
+            else:
+                self._ambiguous += 1
+        return payment_system if decided else None
+
+    def _reload_if_changed(self) -> None:
+        if self.path is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+        try:
+            stat = os.stat(self.path)
+        except OSError as exc:
+            self._failed(exc, version=None)
+            return
+        version = (stat.st_mtime_ns, stat.st_size)
+        if version == self._version:
+            return
+        try:
+            with open(self.path) as rule_file:
+                compiled = compile_rules(json.load(rule_file).get('rules', []))
+        except (OSError, ValueError, AttributeError) as exc:
+            self._failed(exc, version)
+            return
+        prefix_lengths = tuple(sorted(
+            {len(prefix) for prefixes in compiled.values() for prefix in prefixes}, reverse=True))
+        with self._lock:
+            self._compiled, self._prefix_lengths = compiled, prefix_lengths
+            self._version = version
+            self._reloads += 1
+        logger.info(f"Loaded {sum(map(len, compiled.values()))} payment system rules from {self.path}")
+
+    def _failed(self, exc: Exception, version) -> None:
+        with self._lock:
+            # A file is reported once per version, not on every check
+            if self._version == ('failed', version):
+                return
+            self._version = ('failed', version)
+            self._reload_failures += 1
+        logger.error(f"Payment system rules {self.path} could not be loaded, keeping the previous rules: {exc}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'rules': sum(map(len, self._compiled.values())),
+                'matched': self._matched,
+                'ambiguous': self._ambiguous,
+                'reloads': self._reloads,
+                'reloadFailures': self._reload_failures
+            }
+
+
+PAYMENT_SYSTEM_RULES = PaymentSystemRules.from_settings('PAYMENT_SYSTEM_RULES')
@@ -0,0 +1,119 @@
+"""
+Module: prefetch
+
+Starts the upstream fetches of every field selected on a member together,
+as soon as the member itself is resolved.
+
+MemberQuery.resolve_member reads the fields the query selects on the member,
+with their arguments, and runs their resolvers concurrently with
+asyncio.gather. The results are stored on the member object, and the
+MemberType.resolve_* methods decorated with prefetchable return them instead
+of fetching again. A field whose fetch failed raises its own error when it
+is resolved, so that the other fields are still returned. Fields under a
+@skip or @include directive are not prefetched and resolve as usual.
+"""
+
+import asyncio
+import functools
+
+from graphene.utils.str_converters import to_snake_case
+from graphql.execution.values import get_argument_values
+from graphql.language import ast
+from graphql.type.definition import get_named_type
+
+from harmoney.tracing import resolver_scope
+
+PREFETCHED_ATTRIBUTE = '_prefetched_fields'
+
+
+def _key(field_name: str, arguments: dict) -> tuple:
+    return field_name, tuple(sorted(arguments.items()))
+
+
+def get_selected_fields(info) -> list:
+    """
+    :param info: the resolve info of the field whose selections are read
+    :type info: graphql.execution.base.ResolveInfo
+    :return: list [(field name, argument values)] of the fields selected on
+    the resolved object, fragments included
+    :rtype: list
+    """
+    field_defs = get_named_type(info.return_type).fields
+    selected = []
+    seen = set()
+
+    def visit(selection_set):
+        for selection in selection_set.selections if selection_set else ():
+            if selection.directives:
+                continue
+            if isinstance(selection, ast.FragmentSpread):
+                fragment = info.fragments.get(selection.name.value)
+                if fragment is not None:
+                    visit(fragment.selection_set)
+            elif isinstance(selection, ast.InlineFragment):
+                visit(selection.selection_set)
+            elif selection.name.value in field_defs:
+                name = selection.name.value
+                arguments = get_argument_values(
+                    field_defs[name].args, selection.arguments, info.variable_values)
+                key = _key(name, arguments)
+                if key not in seen:
+                    seen.add(key)
+                    selected.append((name, arguments))
+
+    for field_ast in info.field_asts:
+        visit(field_ast.selection_set)
+    return selected
+
+
+async def prefetch_fields(root, info, object_type) -> None:
+    """
+    Runs the prefetchable resolvers of the fields selected on root
+    concurrently, and stores their results on it
+
+    :param root: the resolved object, e.g. the Member
+    :param info: the resolve info of the field that resolved root
+    :type info: graphql.execution.base.ResolveInfo
+    :param object_type: the graphene type of root, e.g. MemberType
+    :type object_type: graphene.ObjectType
+    """
+    type_name = get_named_type(info.return_type).name
+    keys = []
+    tasks = []
+    for name, arguments in get_selected_fields(info):
+        resolver = getattr(object_type, f'resolve_{to_snake_case(name)}', None)
+        fetch = getattr(resolver, 'prefetch', None)
+        if fetch is None:
+            continue
+        # Tasks copy the context they are created in, and keep the tag
+        with resolver_scope(f'{type_name}.{name}'):
+            tasks.append(asyncio.ensure_future(fetch(root, info, **arguments)))
+        keys.append(_key(name, arguments))
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    setattr(root, PREFETCHED_ATTRIBUTE, dict(zip(keys, results)))
+
+
+def prefetchable(resolver):
+    """
+    Decorates an async resolve_* method whose result may be fetched ahead of
+    time by prefetch_fields. The undecorated method is kept as the prefetch
+    attribute of the decorated one.
+
+    :param resolver: the resolve_* method
+    :type resolver: coroutine function
+    :return: the resolver, returning the prefetched result when there is one
+    :rtype: coroutine function
+    """
+    @functools.wraps(resolver)
+    async def resolve(root, info, **arguments):
+        prefetched = getattr(root, PREFETCHED_ATTRIBUTE, None) or {}
+        key = _key(info.field_name, arguments)
+        if key not in prefetched:
+            return await resolver(root, info, **arguments)
+        result = prefetched[key]
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    resolve.prefetch = resolver
+    return resolve
@@ -1,4 +1,4 @@
-import asyncio
+import copy
 import datetime
 import pydash
 import logging
@@ -10,20 +10,17 @@ from payment.rtrPayments import RtrPayments
 from payment.models import Balance, CreditCard, BankAccount, Premium
 from payment.models import RecurringPayment, Invoice, ApplicationConfig
 from payment.models import PaymentHistory
+from payment.member_context import MemberContext
 from payment.views import search_member, enrich_member, GetIds
-from payment.utils import decode_hios_id, create_resource_url, get_softheon_identity, add_ref_object, add_payment_method_obj
+from payment.utils import decode_hios_id, create_resource_url, add_ref_object, add_payment_method_obj
 from harmoney.aiohttp_client import AioHttpClient
+from harmoney.cache import StaleWhileRevalidateCache
+from harmoney.config import Upstreams
+from harmoney.retry_policy import RetryPolicies
 from harmoney.exceptions import MemberNotFoundException
 from payment.queries import rtr_payment_history_query, rtr_get_balance_query, rtr_invoice_query
 from payment.utils import get_medb_response
 
-EVENT_LOOP = None
-
-try:
-    EVENT_LOOP = asyncio.get_running_loop()
-except RuntimeError:
-    EVENT_LOOP = asyncio.new_event_loop()
-    asyncio.set_event_loop(EVENT_LOOP)
 
 load_dotenv()
 
@@ -51,6 +48,11 @@ RTR_MAX_LIMIT = 100
 
 logger = logging.getLogger(__name__)
 
+# dict [member_id: enriched member], without its PaymentSystem, which is
+# cached on its own by RtrPayments
+ENRICHED_MEMBER_CACHE = StaleWhileRevalidateCache.from_settings(
+    'ENRICHED_MEMBER_CACHE', fresh_ttl_seconds=60, stale_ttl_seconds=600)
+
 SOFTHEON_CREDIT_CARD_TOKENIZATION_LEGACY_URL = os.environ.get(
     "SOFTHEON_CREDIT_CARD_TOKENIZATION_LEGACY_URL"
 )
@@ -70,14 +72,12 @@ EMBARK_CLIENT_ID = os.environ.get("EMBARK_CLIENT_ID")
 
 class CreditCardResolvers:
 
-    def resolve_credit_cards(self, info):
+    async def resolve_credit_cards(self, info):
         """
         Credit card resolver
         """
-        credit_cards = EVENT_LOOP.run_until_complete(
-            CreditCardResolvers.format_credit_cards(
-                info.context.member
-            )
+        credit_cards = await CreditCardResolvers.format_credit_cards(
+            info.context.member
         )
         return [CreditCard(**cc) for cc in credit_cards]
 
@@ -91,58 +91,39 @@ class CreditCardResolvers:
         :return: List of credit card dict
         """
         credit_cards = []
-        payment_token = await get_softheon_identity(member, SOFTHEON_PAYMENT_SCOPE)
-        ref_id = await RTR.get_member_ref_id(member)
-        if ref_id:
-            url = f'{SOFTHEON_WALLET_HOST}/payments/v4/wallet?referenceId={ref_id}'
-            request_options = {
-                'method': "get",
-                'headers': {
-                    'Authorization': f"Bearer {payment_token}",
-                    'Content-Type': APPLICATION_JSON_CONTENT_TYPE
-                }
-            }
-            config = {
-                'timeoutSeconds': 1,
-                'retries': 5
-            }
-            response = await HTTP.run_instance(url, request_options, config)
-            if response:
-                response_data = response.get("data")
-                if response_data:
-                    credit_card_data = response_data.get('creditCards')
-                    for each_credit_response in credit_card_data:
-                        ref = add_ref_object(each_credit_response)
-                        credit_cards.append({
-                            'ref': ref,
-                            'cardHolderName': each_credit_response.get('cardHolderName'),
-                            'maskedCardNumber': each_credit_response.get('cardNumber'),
-                            'cardState': each_credit_response.get('cardState'),
-                            'cardType': each_credit_response.get('cardType'),
-                            'createdAt': each_credit_response.get('createdTime'),
-                            'email': each_credit_response.get('email'),
-                            'expirationMonth': each_credit_response.get('expirationMonth'),
-                            'expirationYear': each_credit_response.get('expirationYear'),
-                            'memberId': each_credit_response.get('id'),
-                            'modifiedOn': each_credit_response.get('modifiedTime'),
-                            'token': each_credit_response.get('token'),
-                            'isDefault': each_credit_response.get('isDefault', False)
-                        })
+        wallet = await member.wallet()
+        if wallet:
+            credit_card_data = wallet.get('creditCards')
+            for each_credit_response in credit_card_data:
+                ref = add_ref_object(each_credit_response)
+                credit_cards.append({
+                    'ref': ref,
+                    'cardHolderName': each_credit_response.get('cardHolderName'),
+                    'maskedCardNumber': each_credit_response.get('cardNumber'),
+                    'cardState': each_credit_response.get('cardState'),
+                    'cardType': each_credit_response.get('cardType'),
+                    'createdAt': each_credit_response.get('createdTime'),
+                    'email': each_credit_response.get('email'),
+                    'expirationMonth': each_credit_response.get('expirationMonth'),
+                    'expirationYear': each_credit_response.get('expirationYear'),
+                    'memberId': each_credit_response.get('id'),
+                    'modifiedOn': each_credit_response.get('modifiedTime'),
+                    'token': each_credit_response.get('token'),
+                    'isDefault': each_credit_response.get('isDefault', False)
+                })
         return credit_cards
 
 
 class ApplicationConfigResolvers:
 
-    def resolve_application_config(self, info):
-        application_config = EVENT_LOOP.run_until_complete(
-            ApplicationConfigResolvers.logic_resolve_application_config(
-                info.context.member)
-        )
+    async def resolve_application_config(self, info):
+        application_config = await ApplicationConfigResolvers.logic_resolve_application_config(
+            info.context.member)
         return ApplicationConfig(**application_config)
 
     @staticmethod
     async def logic_resolve_application_config(member):
-        payment_system = await RTR.get_payment_system(member)
+        payment_system = await member.payment_system()
         plan_hios_id = member.get('planHiosId')
         state_code = decode_hios_id(plan_hios_id)
         if payment_system == 'embark':
@@ -161,10 +142,8 @@ class ApplicationConfigResolvers:
 
 class BalanceResolvers:
 
-    def resolve_balance(self, info):
-        balance = EVENT_LOOP.run_until_complete(
-            BalanceResolvers.format_resolve_balance(info.context.member)
-        )
+    async def resolve_balance(self, info):
+        balance = await BalanceResolvers.format_resolve_balance(info.context.member)
         return Balance(**balance)
 
     @staticmethod
@@ -217,7 +196,7 @@ class BalanceResolvers:
     async def logic_resolve_balance(member):
         today = datetime.date.today()
         payment_system = member.get('PaymentSystem')
-        issuer_subscriber_id = GetIds.get_issuer_subscriber_id(member)
+        issuer_subscriber_id = member.issuer_subscriber_id
         if payment_system == 'embark':
             start_of_year = datetime.date(today.year, 1, 1).strftime(
                 DATE_FORMAT
@@ -227,19 +206,16 @@ class BalanceResolvers:
             result = await RTR.execute_rtr_query(query)
             return result.get('data')
         else:
-            token = await get_softheon_identity(member, SOFTHEON_REMOTE_SCOPE)
             options = {
                 'params': {
                     'issuerSubscriberID': issuer_subscriber_id
                 },
-                'method': 'get',
-                'headers': {
-                    'Authorization': f'Bearer {token}'
-                }
+                'method': 'get'
             }
 
             path = f"{CNC_SOFTHEON_PAYMENT_HOST}{CNC_SOFTHEON_PAYMENT_PREFIX}/Subscriber"
-            data = await HTTP.run_instance(path, options)
+            data = await member.softheon_request(
+                SOFTHEON_REMOTE_SCOPE, path, options, {'upstream': Upstreams.SOFTHEON_PAYMENT})
 
             success, status = data.get('ok'), data.get('status')
             if not success or not status:
@@ -249,20 +225,18 @@ class BalanceResolvers:
 
 class PaymentResolvers:
 
-    def resolve_payment_histories(self, info, start_date=None, end_date=None):
+    async def resolve_payment_histories(self, info, start_date=None, end_date=None):
         today = datetime.date.today()
         today = today.replace(today.year - 3, 1, 1).strftime(DATE_FORMAT)
         start_date = today if not start_date else start_date
         end_date = datetime.date.today().strftime(
             DATE_FORMAT) if not end_date else end_date
-        payment_histories = EVENT_LOOP.run_until_complete(
-            PaymentResolvers.format_resolve_payment_histories(
-                info.context.member,
-                {
-                    'startDate': start_date,
-                    'endDate': end_date,
-                }
-            )
+        payment_histories = await PaymentResolvers.format_resolve_payment_histories(
+            info.context.member,
+            {
+                'startDate': start_date,
+                'endDate': end_date,
+            }
         )
         return [PaymentHistory(**aph)
                 for aph in payment_histories]
@@ -348,7 +322,7 @@ class PaymentResolvers:
             'startDate', today.strftime(DATE_FORMAT)), dates.get('endDate')
         payment_system = member.get('PaymentSystem')
         if payment_system == 'embark':
-            account_id = GetIds.get_issuer_subscriber_id(member)
+            account_id = member.issuer_subscriber_id
             on_after_processed_date, on_before_processed_date = \
                 PaymentResolvers.rtr_initialize_dates(
                     start_date,
@@ -461,11 +435,9 @@ class PaymentResolvers:
 
 class PremiumResolvers:
 
-    def resolve_premium(self, info):
-        premium = EVENT_LOOP.run_until_complete(
-            PremiumResolvers.format_premium_account(
-                info.context.member
-            )
+    async def resolve_premium(self, info):
+        premium = await PremiumResolvers.format_premium_account(
+            info.context.member
         )
         return [Premium(**p) for p in premium]
 
@@ -478,7 +450,8 @@ class PremiumResolvers:
             os.environ.get('CNC_UMV_V3_VERSION'),
             f"/{member_id}/premiums")
         premium_ret_list = []
-        premium_data = (await HTTP.get(url, CNC_UMV_V3_API_KEY))['premiums']
+        premium_data = (await HTTP.get(
+            url, CNC_UMV_V3_API_KEY, coalesce=True, upstream=Upstreams.UMV))['premiums']
         valid_fields = [
             'member', 'claimsPaidThroughDate', 'premiumPaidThroughDate', 'premiumDueDate',
             'startDate', 'endDate', 'premiumAmountTotal', 'totalAmountDue', 'pastDueAmount',
@@ -497,17 +470,17 @@ class PremiumResolvers:
 
 class BankAccountsResolver:
 
-    def resolve_bank_accounts(self, info):
-        bank_accounts = EVENT_LOOP.run_until_complete(
-            BankAccountsResolver.format_bank_accounts(
-                info.context.member
-            )
+    async def resolve_bank_accounts(self, info):
+        bank_accounts = await BankAccountsResolver.format_bank_accounts(
+            info.context.member
         )
         return [BankAccount(**ba) for ba in bank_accounts]
 
     @staticmethod
     async def format_bank_accounts(member):
-        raw_wallet = await resolve_wallet_accounts(member)
+        raw_wallet = await member.wallet()
+        if not raw_wallet:
+            return []
         fields_to_remove = [
             'accountHolderAddress', 'createdTime', 'last3', 'modifiedTime',
             'nickname', 'state', 'type']
@@ -523,11 +496,9 @@ class BankAccountsResolver:
 
 class RecurringPaymentsResolver:
 
-    def resolve_recurring_payments(self, info):
-        recurring_payments = EVENT_LOOP.run_until_complete(
-            RecurringPaymentsResolver.format_recurring_payments(
-                info.context.member
-            )
+    async def resolve_recurring_payments(self, info):
+        recurring_payments = await RecurringPaymentsResolver.format_recurring_payments(
+            info.context.member
         )
         return [RecurringPayment(**rp) for rp in recurring_payments]
 
@@ -554,40 +525,40 @@ class RecurringPaymentsResolver:
 
     @staticmethod
     async def logic_recurring_payments(member):
-        payment_token = await get_softheon_identity(member, SOFTHEON_PAYMENT_SCOPE)
-        ref_id = await RTR.get_member_ref_id(member)
+        ref_id = await member.ref_id()
         url = f'{SOFTHEON_WALLET_HOST}/payments/v4/subscriptions?referenceId={ref_id}'
         request_options = {
             'method': "get",
             'headers': {
-                'Authorization': f"Bearer {payment_token}",
                 'Content-Type': APPLICATION_JSON_CONTENT_TYPE
             }
         }
         config = {
             'timeoutSeconds': 2,
-            'retries': 5
+            'retryPolicy': RetryPolicies.SOFTHEON_WALLET,
+            'upstream': Upstreams.SOFTHEON_WALLET,
+            'coalesce': True,
+            'hedge': True
         }
-        recurring_payments = await HTTP.run_instance(url, request_options, config)
+        recurring_payments = await member.softheon_request(
+            SOFTHEON_PAYMENT_SCOPE, url, request_options, config)
         return recurring_payments.get('data')
 
 
 class InvoicesResolver:
 
-    def resolve_invoices(self, info, start_date=None, end_date=None):
+    async def resolve_invoices(self, info, start_date=None, end_date=None):
         moment = datetime.date.today()
         moment = moment.replace(year=moment.year - 1).strftime(DATE_FORMAT)
         start_date = moment if start_date is None else start_date
         end_date = datetime.date.today().strftime(
             DATE_FORMAT) if end_date is None else end_date
-        invoices = EVENT_LOOP.run_until_complete(
-            InvoicesResolver.format_resolve_invoices(
-                info.context.member,
-                {
-                    'startDate': start_date,
-                    'endDate': end_date,
-                }
-            )
+        invoices = await InvoicesResolver.format_resolve_invoices(
+            info.context.member,
+            {
+                'startDate': start_date,
+                'endDate': end_date,
+            }
         )
 
         return [Invoice(**invoice) for invoice in invoices]
@@ -680,7 +651,7 @@ class InvoicesResolver:
         """
         payment_system = member.get('PaymentSystem')
         if payment_system == 'embark':
-            account_id = GetIds.get_issuer_subscriber_id(member)
+            account_id = member.issuer_subscriber_id
             accounts = await InvoicesResolver.rtr_retrieve_invoices(
                 account_id,
                 dates,
@@ -769,6 +740,24 @@ class InvoicesResolver:
 
 #Utility resolvers
 async def logic_resolve_member(id):
+    enriched_member = await ENRICHED_MEMBER_CACHE.get(
+        id, lambda: load_enriched_member(id))
+    member = MemberContext(copy.deepcopy(enriched_member))
+    member['PaymentSystem'] = await member.payment_system()
+    return member
+
+
+async def load_enriched_member(id):
+    """
+    Searches UMV for the member and enriches it with its identifiers and
+    attributes
+
+    :param id: the member ID, an amisys ID without its dash
+    :type id: str
+    :return: the enriched member
+    :rtype: dict
+    :raises MemberNotFoundException: no member has the ID
+    """
     members = await search_member({'id': id})
     searched_member = next(
         (member for member in members if member.get(
@@ -777,25 +766,27 @@ async def logic_resolve_member(id):
     if not searched_member:
         logger.error("Unable to find member after search_member")
         raise MemberNotFoundException('Unable to find member')
-    member = await enrich_member(searched_member)
-    member['PaymentSystem'] = await RTR.get_payment_system(member)
-    return member
-
-async def resolve_wallet_accounts(member):
-    payment_token = await get_softheon_identity(member, SOFTHEON_PAYMENT_SCOPE)
-    ref_id = await RTR.get_member_ref_id(member)
-    url = f'{SOFTHEON_WALLET_HOST}/payments/v4/wallet?referenceId={ref_id}'
-    request_options = {
-        'method': "get",
-        'headers': {
-            'Authorization': f"Bearer {payment_token}",
-            'Content-Type': APPLICATION_JSON_CONTENT_TYPE
-        }
-    }
-    config = {
-        'timeoutSeconds': 1,
-        'retries': 5
-    }
-    wallet = await HTTP.run_instance(url, request_options, config)
-    wallet_data = wallet['data']
-    return wallet_data
\ No newline at end of file
+    return await enrich_member(searched_member)
+
+
+def invalidate_member(id):
+    """
+    Forgets the cached enriched member after a mutation changed the member's
+    payment data, so that the next operation on the member searches and
+    enriches it again
+
+    :param id: the member ID
+    :type id: str
+    :return: whether a cached member was dropped
+    :rtype: bool
+    """
+    return ENRICHED_MEMBER_CACHE.invalidate(id)
+
+
+def enriched_member_cache_stats():
+    """
+    :return: entry count, hit, miss and background reload counters of
+    ENRICHED_MEMBER_CACHE
+    :rtype: dict
+    """
+    return ENRICHED_MEMBER_CACHE.snapshot()
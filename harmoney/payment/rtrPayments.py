@@ -2,12 +2,15 @@ import logging
 import os
 
 from harmoney.aiohttp_client import AioHttpClient
+from harmoney.cache import MISSING, create_cache
+from harmoney.config import Upstreams
+from harmoney.retry_policy import RetryPolicies
 from harmoney.exceptions import MemberNotFoundException, PaymentNotFoundException, PaymentDisabledException
 from dotenv import load_dotenv
 from payment.views import GetIds
 from payment.queries import rtr_get_source_query, embark_ref_id_query
 from payment.constants import HttpStatusCodes, Constants
-from payment.utils import get_softheon_identity
+from payment.payment_system_rules import PAYMENT_SYSTEM_RULES
 
 load_dotenv()
 RTR_API_KEY = os.environ.get('BILLING_PAYMENTS_RTR_API_KEY')
@@ -18,42 +21,101 @@ SOFTHEON_PAYMENT_SCOPE = Constants.SOFTHEON_PAYMENT_SCOPE.value
 
 logger = logging.getLogger(__name__)
 
+# dict [issuer_subscriber_id: 'embark' or 'softheon']. Migration away from
+# Embark is rare, so the payment system is kept for an hour; a failed RTR
+# lookup falls back to softheon for a minute only.
+PAYMENT_SYSTEM_CACHE = create_cache(
+    'PAYMENT_SYSTEM_CACHE', ttl_seconds=3600, negative_ttl_seconds=60)
+
+# dict [(issuer_subscriber_id, payment_system): ref_id]. A member's payment
+# profile ID or Softheon FolderID does not change, so it is kept for a day;
+# failed lookups are not cached.
+REF_ID_CACHE = create_cache('REF_ID_CACHE', ttl_seconds=86400)
+
 
 class RtrPayments():
-    def __init__(self, override_value=False, use_config_first=False):
+    def __init__(self):
         self.rtr_url = f'{RTR_BASE}{RTR_PREFIX}'
-        self.override_value = override_value
-        self.use_config_first = use_config_first
         self.http_client = AioHttpClient()
 
     async def get_payment_system(self, member):
         if (member.get("PaymentSystem") is None):
-            issuer_subscriber_id = GetIds.get_issuer_subscriber_id(member)
-            is_embark_member = await self.check_is_embark_member_flag(issuer_subscriber_id)
-            member['PaymentSystem'] = "embark" if is_embark_member else "softheon"
+            payment_system = self._use_rule_table(member)
+            if payment_system is None:
+                issuer_subscriber_id = GetIds.get_issuer_subscriber_id(member)
+                payment_system = await self.lookup_payment_system(issuer_subscriber_id)
+            member['PaymentSystem'] = payment_system
         return member.get('PaymentSystem')
 
-    async def check_is_embark_member_flag(self, issuer_subscriber_id, enrollment_source=''):
+    def _use_rule_table(self, member):
+        """
+        Decides the payment system of a member from PAYMENT_SYSTEM_RULES,
+        without calling RTR
+
+        :param member: the enriched member, with its enrollmentSource and
+        planHiosId
+        :type member: dict
+        :return: 'embark' or 'softheon', or None when RTR must decide
+        :rtype: str
+        """
+        return PAYMENT_SYSTEM_RULES.match(member.get('enrollmentSource'), member.get('planHiosId'))
+
+    @staticmethod
+    def payment_system_rules_stats():
+        """
+        :return: rule count, members decided and left to RTR, and reloads of
+        PAYMENT_SYSTEM_RULES
+        :rtype: dict
+        """
+        return PAYMENT_SYSTEM_RULES.snapshot()
+
+    async def lookup_payment_system(self, issuer_subscriber_id):
+        """
+        Looks up the payment system of a member in PAYMENT_SYSTEM_CACHE, then
+        in RTR, for members PAYMENT_SYSTEM_RULES leaves ambiguous. When RTR
+        cannot tell, the member is treated as a softheon member and the
+        fallback is cached for the negative TTL.
+
+        :param issuer_subscriber_id: the member's issuer subscriber ID
+        :type issuer_subscriber_id: str
+        :return: 'embark' or 'softheon'
+        :rtype: str
+        """
+        payment_system = await PAYMENT_SYSTEM_CACHE.aget(issuer_subscriber_id)
+        if payment_system is not MISSING:
+            return payment_system
         try:
-            if self.use_config_first:
-                # return self._useEnvConfig(enrollmentSource, overrideValue)
-                logger.error(
-                    'Logic for the env config has not yet been implemented')
-                return
-            try:
-                return await self.is_embark_member(issuer_subscriber_id)
-            except Exception as exc:
-                # Must return false here to catch non-embark members
-                logger.error(exc)
-                logger.error(
-                    "IsEmbarkMember check failed! Trying env config file")
-                return False
-                # return self._useEnvConfig(enrollmentSource, overrideValue)
+            is_embark_member = await self.is_embark_member(issuer_subscriber_id)
+        except Exception as exc:
+            logger.error(exc)
+            logger.error("IsEmbarkMember check failed! Caching softheon as a fallback")
+            await PAYMENT_SYSTEM_CACHE.aset_negative(issuer_subscriber_id, "softheon")
+            return "softheon"
+        payment_system = "embark" if is_embark_member else "softheon"
+        await PAYMENT_SYSTEM_CACHE.aset(issuer_subscriber_id, payment_system)
+        return payment_system
 
-        except Exception:
-            logger.error(
-                'An unexpected error occurred while searching for embark member data!')
-            return None
+    @staticmethod
+    async def invalidate_payment_system(issuer_subscriber_id):
+        """
+        Forgets the cached payment system of a member, e.g. after the member
+        migrated away from Embark
+
+        :param issuer_subscriber_id: the member's issuer subscriber ID
+        :type issuer_subscriber_id: str
+        :return: whether a cached payment system was dropped
+        :rtype: bool
+        """
+        return await PAYMENT_SYSTEM_CACHE.ainvalidate(issuer_subscriber_id)
+
+    @staticmethod
+    def payment_system_cache_stats():
+        """
+        :return: entry count and hit, miss, expiry and eviction counters of
+        PAYMENT_SYSTEM_CACHE
+        :rtype: dict
+        """
+        return PAYMENT_SYSTEM_CACHE.snapshot()
 
     async def is_embark_member(self, sub_id):
         try:
@@ -94,7 +156,8 @@ class RtrPayments():
             'assumeResponseIsJson': False,
             'throwOnParseError': False,
             'timeoutSeconds': 2,
-            'retries': 0
+            'retryPolicy': RetryPolicies.NO_RETRY,
+            'upstream': Upstreams.RTR
         }
         data = await self.http_client.run_instance(
             self.rtr_url,
@@ -124,27 +187,65 @@ class RtrPayments():
 
         return data.get('data')
 
-    def _use_env_config(self, enrollment_source, override_value):
-        # TODO: Add entries to the envfile as a fail-safe.
-        pass
-
     async def get_member_ref_id(self, member):
+        """
+        Looks up the reference ID of a member's payment profile in
+        REF_ID_CACHE, then in RTR for embark members or Softheon for softheon
+        members
+
+        :param member: the enriched member, with its PaymentSystem
+        :type member: payment.member_context.MemberContext
+        :return: the reference ID, or None when it cannot be found
+        :rtype: str
+        """
         member_status = member.get('PaymentSystem')
+        if member_status not in ('embark', 'softheon'):
+            return
         account_id = GetIds.get_issuer_subscriber_id(member)
+        ref_id = await REF_ID_CACHE.aget((account_id, member_status))
+        if ref_id is not MISSING:
+            return ref_id
+        ref_id = await self.lookup_member_ref_id(member, account_id)
+        if ref_id:
+            await REF_ID_CACHE.aset((account_id, member_status), ref_id)
+        return ref_id
+
+    async def lookup_member_ref_id(self, member, account_id):
+        member_status = member.get('PaymentSystem')
         if member_status == 'embark':
             query = embark_ref_id_query(account_id)
             ref_id = await self.execute_rtr_query(query)
             return ref_id['data']['accounts'][0]['paymentProfileId']
         elif member_status == 'softheon':
-            ref_token = await get_softheon_identity(member, SOFTHEON_REMOTE_SCOPE)
             url = 'https://apitest.centene.com/Softheon.Payment.API.Centene/api/Subscriber?issuerSubscriberID='+account_id
             options = {
-                'method': 'get',
-                'headers': {
-                    'Authorization': f'Bearer {ref_token}'
-                }
+                'method': 'get'
             }
-            data = await self.http_client.run_instance(url, options)
+            data = await member.softheon_request(
+                SOFTHEON_REMOTE_SCOPE, url, options, {'upstream': Upstreams.SOFTHEON_PAYMENT})
             return data.get('data', {}).get('FolderID')
         else:
             return
+
+    @staticmethod
+    async def invalidate_ref_id(issuer_subscriber_id, payment_system):
+        """
+        Forgets the cached reference ID of a member, e.g. after it was
+        rejected by the Softheon wallet
+
+        :param issuer_subscriber_id: the member's issuer subscriber ID
+        :type issuer_subscriber_id: str
+        :param payment_system: 'embark' or 'softheon'
+        :type payment_system: str
+        :return: whether a cached reference ID was dropped
+        :rtype: bool
+        """
+        return await REF_ID_CACHE.ainvalidate((issuer_subscriber_id, payment_system))
+
+    @staticmethod
+    def ref_id_cache_stats():
+        """
+        :return: entry count and hit, miss and expiry counters of REF_ID_CACHE
+        :rtype: dict
+        """
+        return REF_ID_CACHE.snapshot()
@@ -1,5 +1,4 @@
 import graphene
-import asyncio
 import datetime
 import logging
 
@@ -7,6 +6,7 @@ from .mutations.credit_card_mutations import Mutation as CreditCardMutation
 from .mutations.recurring_payments_mutations import Mutation as RecurringPaymentMutation
 from .mutations.bank_account_mutations import Mutation as BankAccountMutation
 from .mutations.one_time_payment_mutation import Mutation as OneTimePaymentMutation
+from .prefetch import prefetchable, prefetch_fields
 from .resolvers import logic_resolve_member
 
 from dotenv import load_dotenv
@@ -20,14 +20,6 @@ from .resolvers import CreditCardResolvers, ApplicationConfigResolvers, BalanceR
     InvoicesResolver
 
 
-EVENT_LOOP = None
-
-try:
-    EVENT_LOOP = asyncio.get_running_loop()
-except RuntimeError:
-    EVENT_LOOP = asyncio.new_event_loop()
-    asyncio.set_event_loop(EVENT_LOOP)
-
 load_dotenv()
 logger = logging.getLogger(__name__)
 
@@ -68,38 +60,44 @@ class MemberType(DjangoObjectType):
         PremiumType
     )
 
-    def resolve_credit_cards(self, info):
-        return CreditCardResolvers.resolve_credit_cards(self, info)
+    @prefetchable
+    async def resolve_credit_cards(self, info):
+        return await CreditCardResolvers.resolve_credit_cards(self, info)
 
-    def resolve_application_config(self, info):
-        return ApplicationConfigResolvers.resolve_application_config(self, info)
+    @prefetchable
+    async def resolve_application_config(self, info):
+        return await ApplicationConfigResolvers.resolve_application_config(self, info)
 
-    def resolve_balance(self, info):
-        return BalanceResolvers.resolve_balance(self, info)
+    @prefetchable
+    async def resolve_balance(self, info):
+        return await BalanceResolvers.resolve_balance(self, info)
 
-    def resolve_payment_histories(self, info, start_date=None, end_date=None):
-        return PaymentResolvers.resolve_payment_histories(self, info, start_date, end_date)
+    @prefetchable
+    async def resolve_payment_histories(self, info, start_date=None, end_date=None):
+        return await PaymentResolvers.resolve_payment_histories(self, info, start_date, end_date)
 
-    def resolve_premium(self, info):
-        return PremiumResolvers.resolve_premium(self, info)
+    @prefetchable
+    async def resolve_premium(self, info):
+        return await PremiumResolvers.resolve_premium(self, info)
 
-    def resolve_bank_accounts(self, info):
-        return BankAccountsResolver.resolve_bank_accounts(self, info)
+    @prefetchable
+    async def resolve_bank_accounts(self, info):
+        return await BankAccountsResolver.resolve_bank_accounts(self, info)
 
-    def resolve_recurring_payments(self, info):
-        return RecurringPaymentsResolver.resolve_recurring_payments(self, info)
+    @prefetchable
+    async def resolve_recurring_payments(self, info):
+        return await RecurringPaymentsResolver.resolve_recurring_payments(self, info)
 
-    def resolve_invoices(self, info, start_date=None, end_date=None):
-        return InvoicesResolver.resolve_invoices(self, info, start_date, end_date)
+    @prefetchable
+    async def resolve_invoices(self, info, start_date=None, end_date=None):
+        return await InvoicesResolver.resolve_invoices(self, info, start_date, end_date)
 
 
 class MemberQuery(graphene.ObjectType):
     member = graphene.Field(MemberType, id=graphene.ID(required=True))
 
-    def resolve_member(self, info, id):
-        member = EVENT_LOOP.run_until_complete(
-            logic_resolve_member(id)
-        )
+    async def resolve_member(self, info, id):
+        member = await logic_resolve_member(id)
         member_obj = {
             "id": member.get('id'),
             "amisysId": member.get('amisysId'),
@@ -112,7 +110,9 @@ class MemberQuery(graphene.ObjectType):
             ),
         }
         info.context.member = member
-        return Member(**member_obj)
+        member = Member(**member_obj)
+        await prefetch_fields(member, info, MemberType)
+        return member
 
 
 class MemberMutation(CreditCardMutation, RecurringPaymentMutation, BankAccountMutation, OneTimePaymentMutation, graphene.ObjectType):
@@ -1,3 +1,395 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import time
+from unittest.mock import AsyncMock, patch
 
-# Create your tests here.
+import graphene
+from django.test import SimpleTestCase
+from graphql.execution.executors.asyncio import AsyncioExecutor
+from promise import is_thenable
+
+from harmoney.exceptions import UpstreamStatusException
+from payment import member_context, resolvers, rtrPayments, utils, views
+from payment.member_context import MemberContext
+from payment.payment_system_rules import PaymentSystemRules
+from payment.prefetch import prefetch_fields, prefetchable
+from payment.resolvers import BankAccountsResolver, CreditCardResolvers
+
+
+class SearchMemberTests(SimpleTestCase):
+
+    MEMBERS = [{'id': 'M1', 'amisysId': 'A-1'}, {'id': 'M2', 'amisysId': 'A-1'}]
+    ENROLLMENT = {'effectiveDate': '2020-01-01T00:00:00Z', 'endDate': '2099-12-31T00:00:00Z'}
+
+    def test_member_whose_enrollment_lookup_failed_is_skipped(self):
+        async def run_instance(url, options, config):
+            if '/M1/' in url:
+                raise ConnectionError(url)
+            return {'status': 200, 'data': {'enrollmentspans': [SearchMemberTests.ENROLLMENT]}}
+
+        search = AsyncMock(return_value={'data': {'members': SearchMemberTests.MEMBERS}})
+        with patch.dict(os.environ, {'CNC_UMV_V3_HOST': 'http://umv.test', 'CNC_UMV_V3_BASE_PATH': 'members',
+                                     'CNC_UMV_V3_VERSION': '3'}), \
+                patch.object(views.CNC_UMV_V3, 'search_member_client', search), \
+                patch.object(utils.client, 'run_instance', side_effect=run_instance), \
+                self.assertLogs('payment.utils', 'ERROR'):
+            members = asyncio.run(views.search_member({'lastName': 'Doe'}))
+
+        self.assertEqual(members, [SearchMemberTests.MEMBERS[1]])
+
+
+class PrefetchTests(SimpleTestCase):
+
+    @staticmethod
+    def schema(fetched, delay=0.0):
+        class ItemType(graphene.ObjectType):
+            good = graphene.String(suffix=graphene.String())
+            bad = graphene.String()
+            plain = graphene.String()
+
+            @prefetchable
+            async def resolve_good(self, info, suffix=''):
+                fetched.append(f'good{suffix}')
+                await asyncio.sleep(delay)
+                return f'ok{suffix}'
+
+            @prefetchable
+            async def resolve_bad(self, info):
+                fetched.append('bad')
+                await asyncio.sleep(delay)
+                raise ValueError('upstream down')
+
+            async def resolve_plain(self, info):
+                return 'plain'
+
+        class Query(graphene.ObjectType):
+            item = graphene.Field(ItemType)
+
+            async def resolve_item(self, info):
+                item = ItemType()
+                await prefetch_fields(item, info, ItemType)
+                return item
+
+        return graphene.Schema(query=Query)
+
+    @staticmethod
+    def execute(schema, query):
+        async def run():
+            result = schema.execute(
+                query, executor=AsyncioExecutor(loop=asyncio.get_running_loop()), return_promise=True)
+            return await result if is_thenable(result) else result
+
+        return asyncio.run(run())
+
+    def test_failed_field_does_not_fail_the_others(self):
+        fetched = []
+        result = PrefetchTests.execute(PrefetchTests.schema(fetched), '{ item { good bad plain } }')
+
+        self.assertEqual(result.data, {'item': {'good': 'ok', 'bad': None, 'plain': 'plain'}})
+        self.assertEqual([str(error) for error in result.errors], ['upstream down'])
+        # Each field was fetched once, ahead of time
+        self.assertEqual(sorted(fetched), ['bad', 'good'])
+
+    def test_fields_are_fetched_concurrently_once_per_arguments(self):
+        fetched = []
+        start = time.monotonic()
+        result = PrefetchTests.execute(
+            PrefetchTests.schema(fetched, delay=0.1),
+            '{ item { good a: good(suffix: "!") b: good(suffix: "!") ...on ItemType { good } } }')
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(result.data, {'item': {'good': 'ok', 'a': 'ok!', 'b': 'ok!'}})
+        self.assertEqual(sorted(fetched), ['good', 'good!'])
+        self.assertLess(elapsed, 0.18)
+
+    def test_fields_under_a_directive_are_not_prefetched(self):
+        fetched = []
+        result = PrefetchTests.execute(
+            PrefetchTests.schema(fetched), '{ item { good bad @skip(if: true) } }')
+
+        self.assertEqual(result.data, {'item': {'good': 'ok'}})
+        self.assertEqual(fetched, ['good'])
+
+
+class MemberWalletTests(SimpleTestCase):
+
+    WALLET = {'creditCards': [], 'bankAccounts': []}
+
+    def patch_wallet(self, run_instance, ref_id='R1'):
+        for patcher in (
+                patch.object(member_context.HTTP, 'run_instance', run_instance),
+                patch.object(member_context.RTR, 'get_member_ref_id', AsyncMock(return_value=ref_id)),
+                patch.object(member_context, 'get_softheon_identity', AsyncMock(return_value='token'))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_card_and_bank_account_fields_share_one_wallet_request(self):
+        run_instance = AsyncMock(return_value={'status': 200, 'data': MemberWalletTests.WALLET})
+        self.patch_wallet(run_instance)
+        member = MemberContext({})
+
+        async def resolve():
+            return await asyncio.gather(
+                CreditCardResolvers.format_credit_cards(member),
+                BankAccountsResolver.format_bank_accounts(member),
+                member.wallet())
+
+        cards, accounts, wallet = asyncio.run(resolve())
+
+        self.assertEqual((cards, accounts), ([], []))
+        self.assertEqual(wallet, MemberWalletTests.WALLET)
+        run_instance.assert_awaited_once()
+        self.assertIn('referenceId=R1', run_instance.await_args.args[0])
+
+    def test_failed_wallet_request_is_retried_by_a_later_caller(self):
+        run_instance = AsyncMock(side_effect=[
+            ConnectionError('reset'), {'status': 200, 'data': MemberWalletTests.WALLET}])
+        self.patch_wallet(run_instance)
+        member = MemberContext({})
+
+        async def resolve_twice():
+            with self.assertRaises(ConnectionError):
+                await member.wallet()
+            return await member.wallet()
+
+        self.assertEqual(asyncio.run(resolve_twice()), MemberWalletTests.WALLET)
+        self.assertEqual(run_instance.await_count, 2)
+
+    def test_forgotten_wallet_is_fetched_again(self):
+        run_instance = AsyncMock(return_value={'status': 200, 'data': MemberWalletTests.WALLET})
+        self.patch_wallet(run_instance)
+        member = MemberContext({})
+
+        async def resolve():
+            await member.wallet()
+            await member.wallet()
+            member.forget_wallet()
+            await member.wallet()
+
+        asyncio.run(resolve())
+        self.assertEqual(run_instance.await_count, 2)
+
+    def test_member_without_ref_id_has_no_wallet(self):
+        run_instance = AsyncMock()
+        self.patch_wallet(run_instance, ref_id=None)
+
+        self.assertIsNone(asyncio.run(MemberContext({}).wallet()))
+        run_instance.assert_not_awaited()
+
+
+    def fetch_wallet(self, ref_ids, wallets):
+        """
+        Runs MemberContext.wallet() against stubbed RTR and Softheon calls
+
+        :param ref_ids: the reference IDs RTR returns, in order
+        :param wallets: dict [reference ID: wallet data, or the status
+        Softheon rejects the lookup with]
+        :return: the wallet, or the exception raised, the reference ID lookup
+        and invalidation mocks
+        """
+        async def run_instance(url, options, config):
+            wallet = wallets[url.rsplit('referenceId=', 1)[1]]
+            if isinstance(wallet, int):
+                raise UpstreamStatusException(url, wallet, {'message': 'Wallet not found'})
+            return {'status': 200, 'data': wallet}
+
+        member = MemberContext({'PaymentSystem': 'softheon'})
+        get_ref_id = AsyncMock(side_effect=ref_ids)
+        invalidate_ref_id = AsyncMock(return_value=True)
+        with patch.object(member_context.RTR, 'get_member_ref_id', get_ref_id), \
+                patch.object(member_context.RTR, 'invalidate_ref_id', invalidate_ref_id), \
+                patch.object(member_context.HTTP, 'run_instance', side_effect=run_instance), \
+                patch.object(member_context, 'get_softheon_identity', AsyncMock(return_value='token')), \
+                patch.object(member_context.GetIds, 'get_issuer_subscriber_id', return_value='U1'):
+            try:
+                wallet = asyncio.run(member.wallet())
+            except UpstreamStatusException as exc:
+                wallet = exc
+        return wallet, get_ref_id, invalidate_ref_id
+
+    def test_not_found_wallet_is_fetched_again_with_a_fresh_ref_id(self):
+        wallet, get_ref_id, invalidate_ref_id = self.fetch_wallet(
+            ['stale', 'fresh'], {'stale': 404, 'fresh': {'id': 'W1'}})
+
+        self.assertEqual(wallet, {'id': 'W1'})
+        self.assertEqual(get_ref_id.await_count, 2)
+        invalidate_ref_id.assert_awaited_once_with('U1', 'softheon')
+
+    def test_rejection_is_raised_when_the_ref_id_did_not_change(self):
+        wallet, _, invalidate_ref_id = self.fetch_wallet(
+            ['stale', 'stale'], {'stale': 404})
+
+        self.assertIsInstance(wallet, UpstreamStatusException)
+        self.assertEqual(wallet.status, 404)
+        invalidate_ref_id.assert_awaited_once()
+
+    def test_server_errors_keep_the_ref_id(self):
+        wallet, get_ref_id, invalidate_ref_id = self.fetch_wallet(
+            ['current'], {'current': 503})
+
+        self.assertEqual(wallet.status, 503)
+        self.assertEqual(get_ref_id.await_count, 1)
+        invalidate_ref_id.assert_not_awaited()
+
+class EnrichedMemberCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        resolvers.ENRICHED_MEMBER_CACHE.clear()
+        self.addCleanup(resolvers.ENRICHED_MEMBER_CACHE.clear)
+
+    def test_invalidated_member_is_loaded_again(self):
+        load = AsyncMock(side_effect=[{'id': 'M1', 'version': 1}, {'id': 'M1', 'version': 2}])
+        with patch.object(resolvers, 'load_enriched_member', load), \
+                patch.object(member_context.RTR, 'get_payment_system', AsyncMock(return_value='softheon')):
+            first = asyncio.run(resolvers.logic_resolve_member('M1'))
+            cached = asyncio.run(resolvers.logic_resolve_member('M1'))
+            self.assertTrue(resolvers.invalidate_member('M1'))
+            reloaded = asyncio.run(resolvers.logic_resolve_member('M1'))
+
+        self.assertEqual([member['version'] for member in (first, cached, reloaded)], [1, 1, 2])
+        self.assertEqual(load.await_count, 2)
+        stats = resolvers.enriched_member_cache_stats()
+        self.assertEqual((stats['hits'], stats['invalidations']), (1, 1))
+
+
+class SoftheonRequestTests(SimpleTestCase):
+
+    def request(self, statuses, tokens):
+        """
+        Runs MemberContext.softheon_request() against a stubbed Softheon
+
+        :param statuses: the statuses Softheon answers with, in order
+        :param tokens: the access tokens fetched, in order
+        :return: the response, or the exception raised, the Authorization
+        headers sent and the invalidation mock
+        """
+        seen = []
+
+        async def run_instance(url, options, config):
+            seen.append(options['headers']['Authorization'])
+            status = statuses[len(seen) - 1]
+            if status >= 400:
+                raise UpstreamStatusException(url, status, {'message': 'Rejected'})
+            return {'status': status, 'data': 'ok'}
+
+        member = MemberContext({'PaymentSystem': 'softheon'})
+        with patch.object(member_context.HTTP, 'run_instance', side_effect=run_instance), \
+                patch.object(member_context, 'get_softheon_identity', AsyncMock(side_effect=tokens)), \
+                patch.object(member_context, 'invalidate_softheon_identity', AsyncMock()) as invalidate:
+            try:
+                response = asyncio.run(member.softheon_request(
+                    'payments', 'http://wallet.test', {'method': 'get', 'headers': {'Accept': 'application/json'}}))
+            except UpstreamStatusException as exc:
+                response = exc
+        return response, seen, invalidate, member
+
+    def test_rejected_token_is_replaced_and_the_request_sent_again(self):
+        response, seen, invalidate, member = self.request([401, 200], ['revoked', 'fresh'])
+
+        self.assertEqual(response['data'], 'ok')
+        self.assertEqual(seen, ['Bearer revoked', 'Bearer fresh'])
+        invalidate.assert_awaited_once_with(member, 'payments', 'revoked')
+
+    def test_second_rejection_is_raised(self):
+        response, seen, invalidate, _ = self.request([401, 401], ['revoked', 'also revoked'])
+
+        self.assertIsInstance(response, UpstreamStatusException)
+        self.assertEqual(len(seen), 2)
+        invalidate.assert_awaited_once()
+
+    def test_other_errors_keep_the_token(self):
+        response, seen, invalidate, _ = self.request([503], ['current'])
+
+        self.assertEqual(response.status, 503)
+        self.assertEqual(seen, ['Bearer current'])
+        invalidate.assert_not_awaited()
+
+
+class RefIdCacheTests(SimpleTestCase):
+
+    MEMBER = {'PaymentSystem': 'embark'}
+
+    def setUp(self):
+        rtrPayments.REF_ID_CACHE.clear()
+        self.addCleanup(rtrPayments.REF_ID_CACHE.clear)
+        patcher = patch.object(rtrPayments.GetIds, 'get_issuer_subscriber_id', return_value='U1')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rtr = rtrPayments.RtrPayments()
+
+    def test_ref_id_is_looked_up_once(self):
+        lookup = AsyncMock(return_value='R1')
+        with patch.object(self.rtr, 'lookup_member_ref_id', lookup):
+            ref_ids = [asyncio.run(self.rtr.get_member_ref_id(RefIdCacheTests.MEMBER)) for _ in range(2)]
+
+        self.assertEqual(ref_ids, ['R1', 'R1'])
+        lookup.assert_awaited_once()
+
+    def test_missing_or_invalidated_ref_id_is_looked_up_again(self):
+        lookup = AsyncMock(side_effect=[None, 'R1', 'R2'])
+        with patch.object(self.rtr, 'lookup_member_ref_id', lookup):
+            missing = asyncio.run(self.rtr.get_member_ref_id(RefIdCacheTests.MEMBER))
+            found = asyncio.run(self.rtr.get_member_ref_id(RefIdCacheTests.MEMBER))
+            self.assertTrue(asyncio.run(rtrPayments.RtrPayments.invalidate_ref_id('U1', 'embark')))
+            refreshed = asyncio.run(self.rtr.get_member_ref_id(RefIdCacheTests.MEMBER))
+
+        self.assertEqual((missing, found, refreshed), (None, 'R1', 'R2'))
+        self.assertEqual(lookup.await_count, 3)
+
+
+class PaymentSystemRulesTests(SimpleTestCase):
+
+    RULES = [
+        {'enrollmentSource': 'Embark', 'stateCode': 'FL', 'planHiosIdPrefixes': ['12345FL'],
+         'paymentSystem': 'embark'},
+        {'enrollmentSource': 'Embark', 'paymentSystem': 'rtr'},
+        {'stateCode': 'TX', 'paymentSystem': 'softheon'},
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'rules.json')
+        self.write(PaymentSystemRulesTests.RULES)
+        self.rules = PaymentSystemRules(self.path, check_interval=0)
+
+    def write(self, rules) -> None:
+        with open(self.path, 'w') as rule_file:
+            json.dump({'rules': rules}, rule_file)
+
+    def test_most_specific_rule_wins(self):
+        self.assertEqual(self.rules.match('embark', '12345FL0010001'), 'embark')
+        self.assertEqual(self.rules.match('Embark', '99999TX0010001'), None)
+        self.assertEqual(self.rules.match('Ambetter', '99999TX0010001'), 'softheon')
+        self.assertEqual(self.rules.match('Ambetter', '99999GA0010001'), None)
+        snapshot = self.rules.snapshot()
+        self.assertEqual((snapshot['matched'], snapshot['ambiguous']), (2, 2))
+
+    def test_changed_file_is_reloaded(self):
+        self.assertEqual(self.rules.match('Ambetter', '99999GA0010001'), None)
+        self.write(PaymentSystemRulesTests.RULES + [{'stateCode': 'GA', 'paymentSystem': 'softheon'}])
+        self.assertEqual(self.rules.match('Ambetter', '99999GA0010001'), 'softheon')
+        self.assertEqual(self.rules.snapshot()['reloads'], 2)
+
+    def test_invalid_file_keeps_the_previous_rules(self):
+        self.assertEqual(self.rules.match('Ambetter', '99999TX0010001'), 'softheon')
+        self.write([{'stateCode': 'TX', 'paymentSystem': 'unknown'}])
+        with self.assertLogs('payment.payment_system_rules', 'ERROR'):
+            self.assertEqual(self.rules.match('Ambetter', '99999TX0010001'), 'softheon')
+        self.assertEqual(self.rules.snapshot()['reloadFailures'], 1)
+
+    def test_rtr_is_only_asked_about_members_no_rule_decides(self):
+        rtr = rtrPayments.RtrPayments()
+        lookup = AsyncMock(return_value='embark')
+        with patch.object(rtrPayments, 'PAYMENT_SYSTEM_RULES', self.rules), \
+                patch.object(rtr, 'lookup_payment_system', lookup), \
+                patch.object(rtrPayments.GetIds, 'get_issuer_subscriber_id', return_value='U1'):
+            decided = asyncio.run(rtr.get_payment_system(
+                {'enrollmentSource': 'Ambetter', 'planHiosId': '99999TX0010001'}))
+            ambiguous = asyncio.run(rtr.get_payment_system(
+                {'enrollmentSource': 'Embark', 'planHiosId': '99999TX0010001'}))
+
+        self.assertEqual((decided, ambiguous), ('softheon', 'embark'))
+        lookup.assert_awaited_once_with('U1')
@@ -4,18 +4,21 @@ Module: utils.py
     utils.py is a helper file in the payment module of the Harmoney project.
     It encompasses various utility-based helper functions that as of now,
     currently have no respective file structure to live in. It includes various
-    functions such as create_resource_url, get_enrollments, etc. 
+    functions such as create_resource_url, get_enrollments_many, etc. 
 
 """
 
 import logging
-import time
 import os
 from payment.models import PaymentMethodRequest, Ref
 from dotenv import load_dotenv
 from harmoney.aiohttp_client import AioHttpClient
+from harmoney.config import Upstreams
+from harmoney.retry_policy import RetryPolicies
+from harmoney.token_manager import AccessTokenManager
 from payment.constants import Constants, FormattingStrings, HttpStatusCodes
-from harmoney.exceptions import PaymentNotFoundException, InvoiceNotFoundException
+from harmoney.exceptions import PaymentNotFoundException, InvoiceNotFoundException, UpstreamUnavailableException, \
+    NoneReturnTypeException
 
 
 load_dotenv()
@@ -52,21 +55,57 @@ def create_resource_url(
     return "/".join([host, base_path, version_number, endpoint])
 
 
-async def get_enrollments(cnc_member_id: str):
-    """Retrieves enrollment information about cnc_member_id
+async def get_enrollments_many(cnc_member_ids, max_concurrency=5):
+    """Retrieves enrollment information about several members, at most
+    max_concurrency at a time
 
-    :param cnc_member_id: The CncUmvV3 Member ID 
-    :type cnc_member_id: str
-    :return: Returns an dictionary containing enrollment information
+    :param cnc_member_ids: The CncUmvV3 Member IDs
+    :type cnc_member_ids: list
+    :param max_concurrency: The lookups allowed in flight at once
+    :type max_concurrency: int
+    :return: Returns a dictionary of enrollment information keyed by member
+    ID, None for members whose lookup failed
     :rtype: dict
     """
-    url = create_resource_url(
+    cnc_member_ids = list(cnc_member_ids)
+    requests = [
+        {
+            'url': _enrollments_url(cnc_member_id),
+            'options': {
+                'method': 'get',
+                'headers': {
+                    'Authorization': f"Basic {umv_api_key}"
+                }
+            },
+            'config': {
+                'retryPolicy': RetryPolicies.NO_RETRY,
+                'coalesce': True,
+                'upstream': Upstreams.UMV
+            }
+        }
+        for cnc_member_id in cnc_member_ids
+    ]
+    enrollments = {}
+    async for result in client.run_many(requests, max_concurrency=max_concurrency):
+        cnc_member_id = cnc_member_ids[result['index']]
+        logger.debug(
+            f"Enrollment lookup for {cnc_member_id} took {result['elapsedSeconds']:.3f}s")
+        if result['exception'] is not None:
+            logger.error(FormattingStrings.ErrorLogFormat.value,
+                         'fetching enrollments failed', result['exception'])
+            enrollments[cnc_member_id] = None
+            continue
+        data = result['response'].get('data') or {}
+        enrollments[cnc_member_id] = data.get('enrollmentspans')
+    return enrollments
+
+
+def _enrollments_url(cnc_member_id):
+    return create_resource_url(
         os.environ.get('CNC_UMV_V3_HOST'), os.environ.get(
             'CNC_UMV_V3_BASE_PATH'),
         os.environ.get('CNC_UMV_V3_VERSION'), f"{cnc_member_id}/enrollmentspans"
     )
-    data = await client.get(url, umv_api_key)
-    return data.get('enrollmentspans')
 
 
 async def get_identifiers(cnc_member_id):
@@ -83,7 +122,8 @@ async def get_identifiers(cnc_member_id):
         os.environ.get('CNC_UMV_V3_VERSION'),
         f"{cnc_member_id}/identifiers"
     )
-    return await client.get(url, umv_api_key)
+    return await client.get(
+        url, umv_api_key, coalesce=True, upstream=Upstreams.UMV)
 
 
 async def get_attributes(cnc_member_id):
@@ -100,7 +140,8 @@ async def get_attributes(cnc_member_id):
         os.environ.get('CNC_UMV_V3_VERSION'),
         endpoint=f"{cnc_member_id}/attributes"
     )
-    return await client.get(url, umv_api_key)
+    return await client.get(
+        url, umv_api_key, coalesce=True, upstream=Upstreams.UMV)
 
 
 def decode_hios_id(hios_id: str):
@@ -113,28 +154,64 @@ def decode_hios_id(hios_id: str):
     }
 
 
-# dict [member_id: [(remote_scope, expires), (payment_scope, expires)]]
-ACCESS_TOKEN_CACHE = {}
+# Access tokens keyed by (client_id, scope)
+SOFTHEON_ACCESS_TOKENS = AccessTokenManager.from_settings('SOFTHEON_ACCESS_TOKENS')
 
 
 # Must be called before a restapi call is made to the Softheon wallet
 async def get_softheon_identity(member, type):
-    if member['PaymentSystem'] == 'embark':
-        client_id = os.environ.get('EMBARK_CLIENT_ID')
-        client_secret = os.environ.get('EMBARK_CLIENT_SECRET')
-    else:
-        state_code = decode_hios_id(member['planHiosId'])
-        client_id = os.environ.get('HEALTHNET_CLIENT_ID') if state_code == 'CA' else \
-            os.environ.get('AMBETTER_CLIENT_ID')
-        client_secret = os.environ.get('HEALTHNET_CLIENT_SECRET') if state_code == 'CA' else os.environ.get(
-            'AMBETTER_CLIENT_SECRET')
-
-    tokens = ACCESS_TOKEN_CACHE.get(client_id)
-    if tokens:
-        num = 1 if type == Constants.SOFTHEON_PAYMENT_SCOPE.value else 0
-        if tokens[num] and len(tokens[num]) == 2 and tokens[num][1] > time.time():
-            return ACCESS_TOKEN_CACHE[client_id][num][0]
+    client_id, client_secret = _softheon_client(member)
+    try:
+        return await SOFTHEON_ACCESS_TOKENS.get(
+            (client_id, type),
+            lambda: fetch_softheon_token(client_id, client_secret, type))
+    except UpstreamUnavailableException:
+        raise
+    except Exception as err:
+        logger.error(err)
+
+
+async def invalidate_softheon_identity(member, type, token):
+    """Forgets a Softheon access token the upstream rejected, unless another
+    caller already replaced it
+
+    :param member: The member the token was fetched for
+    :type member: dict
+    :param type: The scope of the token, e.g. Constants.SOFTHEON_PAYMENT_SCOPE
+    :type type: str
+    :param token: The rejected access token
+    :type token: str
+    :return: Returns whether the token was forgotten
+    :rtype: bool
+    """
+    client_id, _ = _softheon_client(member)
+    return await SOFTHEON_ACCESS_TOKENS.invalidate((client_id, type), token) is not None
+
 
+def _softheon_client(member):
+    if member['PaymentSystem'] == 'embark':
+        return os.environ.get('EMBARK_CLIENT_ID'), os.environ.get('EMBARK_CLIENT_SECRET')
+    state_code = decode_hios_id(member['planHiosId'])
+    client_id = os.environ.get('HEALTHNET_CLIENT_ID') if state_code == 'CA' else \
+        os.environ.get('AMBETTER_CLIENT_ID')
+    client_secret = os.environ.get('HEALTHNET_CLIENT_SECRET') if state_code == 'CA' else os.environ.get(
+        'AMBETTER_CLIENT_SECRET')
+    return client_id, client_secret
+
+
+async def fetch_softheon_token(client_id, client_secret, type):
+    """Requests a new Softheon access token with the client credentials grant
+
+    :param client_id: The Softheon client ID
+    :type client_id: str
+    :param client_secret: The Softheon client secret
+    :type client_secret: str
+    :param type: The scope of the token, e.g. Constants.SOFTHEON_PAYMENT_SCOPE
+    :type type: str
+    :return: The access token and its expires_in seconds, if given
+    :rtype: tuple
+    :raises NoneReturnTypeException: The response holds no access token
+    """
     host = os.environ.get('SOFTHEON_IDENTITY_HOST')
     prefix = os.environ.get('SOFTHEON_IDENTITY_PREFIX')
     url = f'{host}{prefix}/token'
@@ -155,28 +232,36 @@ async def get_softheon_identity(member, type):
         'data': payload,
         'headers': headers
     }
-    start = time.time()
-    try:
-        data = await client.run_instance(url=url, request_options=request_options)
-    except Exception as err:
-        logger.error(err)
-    else:
-        access_token = data.get('data', {}).get('access_token')
-        if client_id not in ACCESS_TOKEN_CACHE:
-            ACCESS_TOKEN_CACHE[client_id] = [(), ()]
-        if type == Constants.SOFTHEON_REMOTE_SCOPE.value:
-            ACCESS_TOKEN_CACHE[client_id][0] = (access_token, start+3600)
-        elif type == Constants.SOFTHEON_PAYMENT_SCOPE.value:
-            ACCESS_TOKEN_CACHE[client_id][1] = (access_token, start+3600)
-        else:
-            logger.error("Invalid Type Provided")
-        return access_token
+    data = await client.run_instance(
+        url=url,
+        request_options=request_options,
+        request_config={
+            'retryPolicy': RetryPolicies.SOFTHEON_IDENTITY,
+            'upstream': Upstreams.SOFTHEON_IDENTITY
+        }
+    )
+    token_response = (data or {}).get('data') or {}
+    access_token = token_response.get('access_token')
+    if not access_token:
+        raise NoneReturnTypeException(f"Softheon identity returned no {type} access token")
+    return access_token, token_response.get('expires_in')
+
+
+def softheon_token_stats():
+    """Reports on the Softheon access tokens kept by the process
+
+    :return: Returns the token count, fetch latencies and refresh counters of
+    SOFTHEON_ACCESS_TOKENS
+    :rtype: dict
+    """
+    return SOFTHEON_ACCESS_TOKENS.snapshot()
 
 
 async def get_medb_response(url, options):
     medb_error = "fetching Data from MEDB failed: timed out making MEDB request for Invoices"
     try:
-        response = await client.run_instance(url, options)
+        response = await client.run_instance(
+            url, options, {'upstream': Upstreams.MEDB})
     except InvoiceNotFoundException as exc:
         logger.error(FormattingStrings.ErrorLogFormat.value, medb_error, exc)
         raise InvoiceNotFoundException(medb_error)
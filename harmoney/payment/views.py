@@ -12,7 +12,7 @@ from payment.date_selector import DateSelector
 from datetime import datetime
 from payment.date_selector import DateSelector
 from payment.objects import TimeSpan
-from payment.utils import get_attributes, get_identifiers, get_enrollments
+from payment.utils import get_attributes, get_identifiers, get_enrollments_many
 from payment.cnc_umv_v3_client import CncUmvV3Client
 from .constants import FormattingStrings
 
@@ -52,15 +52,11 @@ async def search_member(_request):
 
         date_selector = DateSelector('currentOrFuture', datetime.now())
         results = []
-        tasks = []
+        enrollments_by_id = await get_enrollments_many(
+            member.get('id') for member in grouped_members)
         for member in grouped_members:
-            tasks.append(asyncio.create_task(
-                _get_current_pr_future_enrollment_span(
-                    member.get('id')
-                )
-            ))
-        gathered = await asyncio.gather(*tasks)
-        for enrollment in gathered:
+            enrollment = _select_current_or_future_enrollment_span(
+                enrollments_by_id.get(member.get('id')))
             if not enrollment:
                 continue
             result = {
@@ -213,10 +209,13 @@ async def enrich_member(member):
     }
 
 
-async def _get_current_pr_future_enrollment_span(member_id):
+def _select_current_or_future_enrollment_span(enrollment_spans):
+    if not enrollment_spans:
+        return None
+
     enrollments = filter(
         lambda item: not item.get('void') and item.get('endDate'),
-        await get_enrollments(member_id))
+        enrollment_spans)
 
     if not enrollments:
         return None
@@ -288,6 +287,9 @@ class GetIds:
 
     """
 
+    # Strips the suffix (-01) from abs and amisys IDs
+    SUBSCRIBER_ID_REGEX = re.compile(r'^(R\d{8})')
+
     @staticmethod
     def get_ref_id(refs: str, source: str) -> str:
         """Takes in a source string and a ref string and traverses through ref
@@ -331,9 +333,7 @@ class GetIds:
             member['refs'], 'Issuer Subscriber ID')
 
         # remove the suffix (-01) from the amisysId
-        abs_id_regex, amisys_id_regex = re.compile(
-            r'^(R\d{8})'), re.compile(
-                r'^(R\d{8})')
+        abs_id_regex = amisys_id_regex = GetIds.SUBSCRIBER_ID_REGEX
 
         _, issuer_subscriber_id = (
             (issuer_subscriber_id_ref and [
@@ -0,0 +1,135 @@
+"""
+Micro-benchmark for AioHttpClient response decoding.
+
+Compares the CPU spent per request by the legacy decode path, which read
+response.text() twice and ran json.loads on it twice, with the single-pass
+AioHttpClient.parse_response/get_common_response path, on synthetic RTR
+invoice payloads. The single-pass path is measured with the stdlib json
+backend and, when installed, with orjson.
+
+Run from the project root (the directory containing manage.py):
+
+    python script_test/bench_response_decoding.py --invoices 500 --iterations 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from harmoney import aiohttp_client  # noqa: E402
+from harmoney.aiohttp_client import AioHttpClient, JSON_CONTENT_TYPE  # noqa: E402
+
+
+class FakeResponse:
+    """Stands in for aiohttp.ClientResponse with an already received body"""
+
+    def __init__(self, body: bytes):
+        self._body = body
+        self.ok = True
+        self.status = 200
+        self.reason = 'OK'
+        self.url = 'https://rtr.example/graphql'
+        self.charset = 'utf-8'
+        self.headers = {'Content-Type': 'application/json; charset=utf-8'}
+
+    async def read(self):
+        return self._body
+
+    async def text(self):
+        return self._body.decode(self.charset)
+
+
+def build_rtr_invoice_payload(invoice_count: int) -> bytes:
+    invoices = [
+        {
+            'billingCycle': {'endDate': '2023-06-30', 'startDate': '2023-06-01'},
+            'accountId': 'R12345678',
+            'aptcAmount': 412.17,
+            'balanceForwardAmount': 0.0,
+            'dueDate': '2023-06-01',
+            'generatedDate': '2023-05-10',
+            'grossAmount': 512.44,
+            'generatedDocumentId': f'DOC-{index:08d}',
+            'netAmount': 100.27,
+            'productCode': 'AMB-SILVER',
+            'premiumAmount': 512.44,
+            'invoiceId': f'INV-{index:08d}'
+        }
+        for index in range(invoice_count)
+    ]
+    payload = {'data': {'data': {'accounts': [{'invoices': invoices}]}}}
+    return json.dumps(payload).encode('utf-8')
+
+
+async def legacy_decode(response, config):
+    """The decode path before single-pass decoding, kept for comparison"""
+    data = await response.text()
+    common_response = {
+        'ok': response.ok,
+        'status': response.status,
+        'statusText': response.reason,
+        'headers': response.headers.items(),
+        'url': str(response.url)
+    }
+    try:
+        common_response['data'] = json.loads(data)
+    except json.JSONDecodeError:
+        common_response['data'] = data
+    data = await response.text()
+    obj = {'data': data, 'isJson': False}
+    if config.get('assumeResponseIsJson') or JSON_CONTENT_TYPE.match(
+            response.headers['Content-Type']):
+        obj = {'data': json.loads(data), 'isJson': True}
+    if obj.get('isJson'):
+        return {'isJson': True, 'data': obj.get('data', {}), **common_response}
+    return {}
+
+
+async def single_pass_decode(response, config):
+    body = await response.read()
+    parsed_body = AioHttpClient.parse_response(response, body, config)
+    return AioHttpClient.get_common_response(response, parsed_body)
+
+
+def measure(decode, response, iterations):
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(decode(response, {}))
+        start = time.process_time()
+        for _ in range(iterations):
+            loop.run_until_complete(decode(response, {}))
+        return (time.process_time() - start) / iterations
+    finally:
+        loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--invoices', type=int, default=500)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    body = build_rtr_invoice_payload(args.invoices)
+    response = FakeResponse(body)
+    print(f'RTR invoice payload: {args.invoices} invoices, {len(body)} bytes')
+
+    orjson = aiohttp_client.orjson
+    results = [('legacy (text + json.loads x2)', measure(legacy_decode, response, args.iterations))]
+    aiohttp_client.orjson = None
+    results.append(('single pass (stdlib json)', measure(single_pass_decode, response, args.iterations)))
+    aiohttp_client.orjson = orjson
+    if orjson is not None:
+        results.append(('single pass (orjson)', measure(single_pass_decode, response, args.iterations)))
+
+    baseline = results[0][1]
+    for name, seconds in results:
+        print(f'{name:32} {seconds * 1000:8.3f} ms CPU/request  {baseline / seconds:5.2f}x')
+
+
+if __name__ == '__main__':
+    main()